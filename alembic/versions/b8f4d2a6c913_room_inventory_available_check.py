@@ -0,0 +1,25 @@
+"""room inventory available check
+
+Revision ID: b8f4d2a6c913
+Revises: 9a6c3e1f5b27
+Create Date: 2026-10-18 21:14:52.730164
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b8f4d2a6c913'
+down_revision = '9a6c3e1f5b27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute('UPDATE room_inventory SET available = 0 WHERE available < 0')
+    op.create_check_constraint('room_inventory_available_check', 'room_inventory', sa.text('available >= 0'))
+
+
+def downgrade() -> None:
+    op.drop_constraint('room_inventory_available_check', 'room_inventory', type_='check')
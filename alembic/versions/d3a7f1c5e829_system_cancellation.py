@@ -0,0 +1,33 @@
+"""system cancellation
+
+Revision ID: d3a7f1c5e829
+Revises: b8f4d2a6c913
+Create Date: 2026-10-18 23:05:37.418206
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3a7f1c5e829'
+down_revision = 'b8f4d2a6c913'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("ALTER TYPE bookingcanceledby ADD VALUE IF NOT EXISTS 'SYSTEM'")
+
+
+def downgrade() -> None:
+    # a value cannot be dropped from an enum type, the type is recreated without it
+    for table in ('booking', 'booked_room'):
+        op.execute(f"UPDATE {table} SET canceled_by = NULL WHERE canceled_by = 'SYSTEM'")
+    op.execute('ALTER TYPE bookingcanceledby RENAME TO bookingcanceledby_old')
+    op.execute("CREATE TYPE bookingcanceledby AS ENUM ('CLIENT', 'MERCHANT_USER')")
+    for table in ('booking', 'booked_room'):
+        op.execute(
+            f'ALTER TABLE {table} ALTER COLUMN canceled_by TYPE bookingcanceledby '
+            f'USING canceled_by::text::bookingcanceledby'
+        )
+    op.execute('DROP TYPE bookingcanceledby_old')
@@ -1,6 +1,26 @@
 from sqladmin import ModelView
 
 from app import models
+from app.core.dependencies import session_context_var
+from app.core.sessions import AsyncSessionLocal
+from app.crud import crud_transaction
+from app.models import enums
+
+
+async def top_up_balance(dashboard_id: int, amount: float) -> float | None:
+    """Admin views have no request session, so the top-up is posted to the ledger in its own one"""
+    async with AsyncSessionLocal() as session:
+        token = session_context_var.set(session)
+        try:
+            balance = await crud_transaction.post_entries(dashboard_id, [dict(
+                title=enums.TransactionTitle.TOP_UP_THE_BALANCE,
+                status=enums.TransactionStatus.SUCCESS,
+                amount=amount,
+            )])
+            await session.commit()
+            return balance
+        finally:
+            session_context_var.reset(token)
 
 
 class MerchantDashboard(ModelView, model=models.MerchantDashboard):
@@ -18,6 +38,23 @@ class MerchantDashboard(ModelView, model=models.MerchantDashboard):
         "chief_id",
     ]
 
+    # the balance moves only through the ledger: the value typed in the form never reaches the model,
+    # the difference to the stored balance is posted as a top-up once the dashboard is saved
+    async def insert_model(self, data: dict) -> models.MerchantDashboard:
+        balance = data.pop('balance', None)
+        return await self._top_up(await super().insert_model(data), balance)
+
+    async def update_model(self, pk, data: dict) -> models.MerchantDashboard:
+        balance = data.pop('balance', None)
+        return await self._top_up(await super().update_model(pk, data), balance)
+
+    @staticmethod
+    async def _top_up(model: models.MerchantDashboard, balance) -> models.MerchantDashboard:
+        amount = 0 if balance is None else float(balance) - float(model.balance or 0)
+        if amount:
+            model.balance = await top_up_balance(model.id, amount)
+        return model
+
 
 class MerchantUser(ModelView, model=models.MerchantUser):
     form_columns = [
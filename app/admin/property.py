@@ -1,6 +1,23 @@
+import sqlalchemy as sa
 from sqladmin import ModelView
 
 from app import models
+from app.core.sessions import AsyncSessionLocal
+from app.crud.search_index import refresh_search_index_query
+from app.utils.search_cache import PropertySearchCache
+
+
+async def refresh_property_search(property_id: int):
+    """Admin views have no request session, so the search row is refreshed in its own one"""
+    async with AsyncSessionLocal() as session:
+        await session.execute(refresh_search_index_query([property_id]))
+        await session.commit()
+        city = await session.scalar(
+            sa.select(models.PropertySearchIndex.city_slug).where(
+                models.PropertySearchIndex.property_id == property_id
+            )
+        )
+    await PropertySearchCache.invalidate(city, property_id=property_id)
 
 
 class PropertyService(ModelView, model=models.PropertyService):
@@ -11,6 +28,12 @@ class PropertyService(ModelView, model=models.PropertyService):
         'icon_id',
     ]
 
+    async def after_model_change(self, data: dict, model: models.PropertyService, is_created: bool) -> None:
+        await refresh_property_search(model.property_id)
+
+    async def after_model_delete(self, model: models.PropertyService) -> None:
+        await refresh_property_search(model.property_id)
+
 
 class PropertyType(ModelView, model=models.PropertyType):
     column_list = ['id', 'type']
@@ -61,6 +84,9 @@ class Property(ModelView, model=models.Property):
         *form_columns
     ]
 
+    async def after_model_change(self, data: dict, model: models.Property, is_created: bool) -> None:
+        await refresh_property_search(model.id)
+
 
 class PropertyTranslation(ModelView, model=models.PropertyTranslation):
     column_list = [models.PropertyTranslation.id, models.PropertyTranslation.language]
@@ -72,6 +98,9 @@ class PropertyTranslation(ModelView, model=models.PropertyTranslation):
         "is_default"
     ]
 
+    async def after_model_change(self, data: dict, model: models.PropertyTranslation, is_created: bool) -> None:
+        await refresh_property_search(model.property_id)
+
 
 class PropertyPhoto(ModelView, model=models.PropertyPhoto):
     form_columns = [
@@ -133,6 +162,9 @@ class PropertyRoomTemplate(ModelView, model=models.PropertyRoomTemplate):
         'name'
     ]
 
+    async def after_model_change(self, data: dict, model: models.PropertyRoomTemplate, is_created: bool) -> None:
+        await refresh_property_search(model.property_id)
+
 
 class PropertyRoom(ModelView, model=models.PropertyRoom):
     form_columns = [
@@ -1,4 +1,5 @@
 from app import models
+from app.utils.withdrawal_rules import WithdrawalRulesCache
 from sqladmin import ModelView
 
 
@@ -17,6 +18,12 @@ class WithDraw(ModelView, model=models.WithdrawalAmount):
         *form_columns
     ]
 
+    async def after_model_change(self, data: dict, model: models.WithdrawalAmount, is_created: bool) -> None:
+        await WithdrawalRulesCache.invalidate()
+
+    async def after_model_delete(self, model: models.WithdrawalAmount) -> None:
+        await WithdrawalRulesCache.invalidate()
+
 
 class Transactions(ModelView, model=models.Transaction):
     column_list = [
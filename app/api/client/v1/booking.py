@@ -8,12 +8,14 @@ from app import schemas, models
 from app.api import deps
 from app.crud import crud_booking
 from app.crud.booking import make_booking_response
+from app.utils.idempotency import idempotent
 from app.utils.paginator import Paginator, paginate
 
 router = APIRouter()
 
 
 @router.post("/", response_model=schemas.Booking, status_code=201)
+@idempotent('booking-create', response_model=schemas.Booking, status_code=201)
 async def create_booking(booking_in: schemas.BookingCreate, user: models.User = Depends(deps.get_current_user)):
     if booking := await crud_booking.create(
             user_id=user.id,
@@ -23,6 +25,13 @@ async def create_booking(booking_in: schemas.BookingCreate, user: models.User =
     return JSONResponse({'ok': False, 'detail': 'Bad Request'}, status_code=400)
 
 
+@router.post("/quote/", response_model=schemas.BookingQuote)
+async def quote_booking(booking_in: schemas.BookingCreate, user: models.User = Depends(deps.get_current_user)):
+    if quote := await crud_booking.quote(booking_in=booking_in):
+        return quote
+    return JSONResponse({'ok': False, 'detail': 'Bad Request'}, status_code=400)
+
+
 @router.get('/all/', response_model=schemas.DataResponse[schemas.Booking])
 async def get_all_bookings(
         user: models.User = Depends(deps.get_current_user),
@@ -16,7 +16,7 @@ router = APIRouter()
 async def me(
         current_user: User = Depends(deps.get_current_user)
 ):
-    favourite_list = await crud_favourite.favourite_list(current_user.id)
+    favourite_list = await crud_favourite.favourite_cards(current_user.id)
     return dict(user=current_user, properties=favourite_list)
 
 
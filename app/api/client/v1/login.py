@@ -1,13 +1,12 @@
 from http.client import HTTPException
 
-from eskiz_sms.exceptions import EskizException
 from fastapi import APIRouter, Body, status, Request
 from fastapi.responses import JSONResponse
 
 from app import schemas
-from app.core.conf import settings, eskiz
+from app.core.conf import settings
 from app.core.security import Auth
-from app.crud import crud_user
+from app.crud import crud_user, crud_sms_outbox
 from app.utils import CodeConfirmation
 from app.utils.rate_limiter import rate_limit
 
@@ -19,12 +18,8 @@ router = APIRouter()
 async def check_phone(login: schemas.Login = None):
     token, code = await CodeConfirmation.get_code(login.phone)
     if not settings.DEBUG and login.phone != settings.DEBUG_PHONE:
-        try:
-            resp = await eskiz.send_sms(login.phone, message=settings.ESKIZ_SMS_TEXT.format(code=code))
-        except EskizException as e:
-            return JSONResponse({'ok': False, 'detail': str(e)})
-        else:
-            return {'ok': True, 'token': token, 'message': resp.message}
+        message = await crud_sms_outbox.send_code(login.phone, code)
+        return {'ok': True, 'token': token, 'message': message}
     return {'ok': True, 'token': token}
 
 
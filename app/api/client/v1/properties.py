@@ -2,7 +2,7 @@ from datetime import datetime, timedelta, date
 from typing import List
 
 import pytz
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, Query, HTTPException
 from pydantic import parse_obj_as
 from starlette.responses import JSONResponse
 
@@ -30,13 +30,8 @@ async def get_property_types(paginator: Paginator = Depends(paginate)):
     return await paginator.execute(crud_property.get_property_types())
 
 
-@router.get("/list/", status_code=200)
-async def get_properties(
+async def property_filters(
         q: str = Query(None),
-        page: int = Query(1, alias='page'),
-        per_page: int = Query(10, alias='per_page'),
-        sort_by: enums.PropertySortBy = Query(alias='sort-by'),
-        sort_type: enums.SortType = Query('asc', alias='sort-type'),
         breakfast: bool = Query(None),
         property_type: List[int] = Query(None, alias='type'),
         star_rating: List[enums.PropertyStarRating] = Query(None, alias='star-rating'),
@@ -53,12 +48,24 @@ async def get_properties(
         children: int = Query(None),
         is_resident: bool = Query(default=True),
         ratings: List[int] = Query(None, alias='ratings', ge=0, le=10),
-
-):
-    results, total = await crud_property.get_properties_by_criteria(
+        latitude: float = Query(None, alias='lat', ge=-90, le=90),
+        longitude: float = Query(None, alias='lng', ge=-180, le=180),
+        radius: float = Query(None, gt=0, le=1000, description='km around lat/lng'),
+        bbox: str = Query(None, description='min_lng,min_lat,max_lng,max_lat'),
+) -> dict:
+    """Search filters shared by the property list and its facets"""
+    if bbox:
+        try:
+            bbox = tuple(float(v) for v in bbox.split(','))
+        except ValueError:
+            bbox = ()
+        if len(bbox) != 4 or bbox[0] > bbox[2] or bbox[1] > bbox[3]:
+            raise HTTPException(status_code=400, detail='Invalid bbox')
+    if radius and (latitude is None or longitude is None):
+        raise HTTPException(status_code=400, detail='lat and lng are required with radius')
+
+    return dict(
         q=q,
-        sort_by=sort_by,
-        sort_type=sort_type,
         breakfast=breakfast,
         property_type=property_type,
         star_rating=star_rating,
@@ -74,10 +81,34 @@ async def get_properties(
         is_resident=is_resident,
         children=children,
         ratings=ratings,
+        latitude=latitude,
+        longitude=longitude,
+        radius=radius,
+        bbox=bbox,
+    )
+
+
+@router.get("/list/", status_code=200)
+async def get_properties(
+        page: int = Query(1, alias='page'),
+        per_page: int = Query(10, alias='per_page'),
+        sort_by: enums.PropertySortBy = Query(alias='sort-by'),
+        sort_type: enums.SortType = Query('asc', alias='sort-type'),
+        filters: dict = Depends(property_filters),
+):
+    results, total = await crud_property.get_properties_by_criteria(
+        sort_by=sort_by,
+        sort_type=sort_type,
         page=page,
-        per_page=per_page
+        per_page=per_page,
+        **filters
     )
-    return schemas.DataResponse(items=parse_obj_as(List[schemas.Property], results), total=total)
+    return schemas.DataResponse(items=parse_obj_as(List[schemas.PropertyCard], results), total=total)
+
+
+@router.get("/facets/", response_model=schemas.PropertyFacets, status_code=200)
+async def get_property_facets(filters: dict = Depends(property_filters)):
+    return await crud_property.get_property_facets(**filters)
 
 
 @router.get('/{property_id}/', response_model=schemas.Property, status_code=200)
@@ -9,9 +9,9 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from app import schemas
 from app.api import deps
 from app.core.dependencies import get_db
-from app.core.conf import settings, eskiz
+from app.core.conf import settings
 from app.core.security import Auth
-from app.crud import crud_user
+from app.crud import crud_user, crud_sms_outbox
 from app.models import User
 from app.utils import CodeConfirmation
 from app.utils.jwt_token import JWTToken
@@ -38,8 +38,8 @@ async def update_user_phone(data: schemas.Login, user: User = Depends(deps.get_c
         return JSONResponse({'ok': False}, status_code=400)
     token, code = await CodeConfirmation.get_code(data.phone)
     if not settings.DEBUG and data.phone != settings.DEBUG_PHONE:
-        sms_response = await eskiz.send_sms(data.phone, message=code)
-        return {'ok': True, 'token': token, 'message': sms_response.message}
+        message = await crud_sms_outbox.send_code(data.phone, code)
+        return {'ok': True, 'token': token, 'message': message}
     return {'ok': True, 'token': token}
 
 
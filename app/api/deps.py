@@ -2,7 +2,7 @@ import logging
 from contextlib import suppress
 from typing import AsyncIterator
 
-from fastapi import Depends, HTTPException, Security, Request, FastAPI
+from fastapi import Depends, HTTPException, Security, Request, FastAPI, Query
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import sessionmaker
@@ -11,7 +11,7 @@ from starlette import status
 from app import models
 from app.core.security import Auth
 from app.core.sessions import AsyncSessionLocal
-from app.crud import crud_user, crud_merchant_user
+from app.crud import crud_user, crud_merchant_user, crud_property
 from app.models import enums
 from app.utils.jwt_token import JWTToken
 
@@ -62,3 +62,25 @@ async def is_chief(current_user: models.MerchantUser = Depends(get_current_user)
     if current_user.role == enums.MerchantUserRole.CHIEF:
         return current_user
     raise HTTPException(status_code=status.HTTP_405_METHOD_NOT_ALLOWED, detail="Method Not Allowed")
+
+
+async def get_property_ids(
+        property_ids: list[int] = Query(None, alias='property_id'),
+        all_properties: bool = Query(False),
+        current_user: models.MerchantUser = Depends(get_current_user)
+) -> list[int]:
+    """
+    Properties a merchant dashboard endpoint works on: all of the merchant's with ``all_properties``,
+    the ones passed as ``property_id`` (repeated), otherwise the main hotel. Empty when there are none.
+    """
+    dashboard = current_user.dashboard
+    if not dashboard:
+        return []
+    if all_properties:
+        return await crud_property.get_merchant_property_ids(dashboard.id)
+    if property_ids:
+        owned = await crud_property.get_merchant_property_ids(dashboard.id, property_ids)
+        if len(owned) < len(set(property_ids)):
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
+        return owned
+    return [dashboard.default_property_id] if dashboard.default_property_id else []
@@ -4,42 +4,82 @@ from typing import List
 from fastapi import APIRouter, Depends, Query, Body
 from starlette.responses import JSONResponse
 
-from app import schemas, models
+from app import schemas
 from app.api import deps
-from app.core.conf import settings, eskiz
 from app.models import enums
-from app.crud import crud_booking
+from app.core.conf import settings
+from app.crud import crud_booking, crud_stats
 from app.models.enums import CountByDays
+from app.utils.export import export_response
+from app.utils.idempotency import idempotent
 from app.utils.paginator import Paginator, paginate
-from app.utils.sms_message import order_accept_send_sms
 
 router = APIRouter()
 
+BOOKING_EXPORT_COLUMNS = {
+    'id': lambda booking: booking.id,
+    'created_at': lambda booking: booking.created_at,
+    'name': lambda booking: booking.name,
+    'phone': lambda booking: booking.user.phone,
+    'property_id': lambda booking: booking.property.id,
+    'property': lambda booking: booking.property.name,
+    'booked_from': lambda booking: booking.booked_from,
+    'booked_to': lambda booking: booking.booked_to,
+    'number_of_people': lambda booking: booking.total_number_of_people,
+    'total_price': lambda booking: booking.total_price,
+    'status': lambda booking: booking.status,
+    'is_arrived': lambda booking: booking.is_arrived,
+}
+
 
 @router.get("/")
-async def accounting(user: schemas.MerchantUser = Depends(deps.get_current_user),
+async def accounting(property_ids: list[int] = Depends(deps.get_property_ids),
                      days: CountByDays = CountByDays.LAST_30_DAYS):
-    if not user.dashboard or not user.dashboard.default_property_id:
+    if not property_ids:
+        return JSONResponse({'ok': False, 'detail': 'Must choose the main hotel'}, status_code=406)
+    return await crud_booking.get_accounting(property_ids=property_ids, days=days)
+
+
+@router.get("/summary/")
+async def dashboard_summary(property_ids: list[int] = Depends(deps.get_property_ids),
+                            days: CountByDays = CountByDays.LAST_30_DAYS):
+    if not property_ids:
+        return JSONResponse({'ok': False, 'detail': 'Must choose the main hotel'}, status_code=406)
+    return await crud_booking.get_dashboard_summary(property_ids=property_ids, days=days)
+
+
+@router.get("/series/", response_model=schemas.DashboardSeries)
+async def dashboard_series(
+        date_from: date,
+        date_to: date,
+        bucket: enums.TimeBucket = Query('day'),
+        property_ids: list[int] = Depends(deps.get_property_ids)
+):
+    if not property_ids:
         return JSONResponse({'ok': False, 'detail': 'Must choose the main hotel'}, status_code=406)
-    return await crud_booking.get_accounting(property_id=user.dashboard.default_property_id, days=days)
+    if not 0 <= (date_to - date_from).days < settings.DASHBOARD_SERIES_MAX_DAYS:
+        return JSONResponse({'ok': False, 'detail': 'Invalid date range'}, status_code=400)
+    items = await crud_stats.get_series(
+        property_ids=property_ids, date_from=date_from, date_to=date_to, bucket=bucket
+    )
+    return dict(bucket=bucket, date_from=date_from, date_to=date_to, items=items)
 
 
 @router.get('/orders/', response_model=schemas.DataResponse[schemas.Booking])
 async def get_orders(
         paginator: Paginator = Depends(paginate),
         sort_by: enums.OrderSortBy = Query('by_date', alias='sort_by'),
-        user: schemas.MerchantUser = Depends(deps.get_current_user)):
-    if not user.dashboard or not user.dashboard.default_property_id:
+        property_ids: list[int] = Depends(deps.get_property_ids)):
+    if not property_ids:
         return JSONResponse({'ok': False, 'detail': 'Must choose the main hotel'}, status_code=406)
-    return await paginator.execute(
-        crud_booking.get_orders(property_id=user.dashboard.default_property_id, sort_by=sort_by))
+    return await paginator.execute(crud_booking.get_orders(property_ids=property_ids, sort_by=sort_by))
 
 
 @router.get('/orders-statistics/')
-async def get_orders_statistics(user: schemas.MerchantUser = Depends(deps.get_current_user)):
-    if not user.dashboard or not user.dashboard.default_property_id:
+async def get_orders_statistics(property_ids: list[int] = Depends(deps.get_property_ids)):
+    if not property_ids:
         return JSONResponse({'ok': False, 'detail': 'Must choose the main hotel'}, status_code=406)
-    return await crud_booking.get_orders_statistics(property_id=user.dashboard.default_property_id)
+    return await crud_booking.get_orders_statistics(property_ids=property_ids)
 
 
 @router.get('/orders/{booking_id}/', response_model=schemas.Booking, dependencies=[Depends(deps.get_current_user)])
@@ -50,6 +90,7 @@ async def get_order(booking_id: int):
 
 
 @router.post('/cancel/order/{booking_id}')
+@idempotent('order-cancel')
 async def cancel_order(
         booking_id: int,
         reason_of_cancellation: str = Body(None),
@@ -59,7 +100,7 @@ async def cancel_order(
 ):
     if not user.dashboard or not user.dashboard.default_property_id:
         return JSONResponse({'ok': False, 'detail': 'Must choose the main hotel'}, status_code=406)
-    user, is_canceled = await crud_booking.cancel_order(
+    _, is_canceled = await crud_booking.cancel_order(
         booking_id=booking_id,
         property_id=user.dashboard.default_property_id,
         reason_of_cancellation=reason_of_cancellation,
@@ -67,16 +108,13 @@ async def cancel_order(
         is_cancel=is_cancel
     )
     if is_canceled:
-        user: models.User
-        if user.phone:
-            text = order_accept_send_sms(user.language, is_accept=False)
-            await eskiz.send_sms(user.phone, text)
         return JSONResponse({'ok': False, 'detail': 'Successfully Canceled'},
                             status_code=200)
     return JSONResponse({'ok': False, 'detail': 'Bad Request'}, status_code=400)
 
 
 @router.post('/accept/order/')
+@idempotent('order-accept')
 async def accept_or_cancel_order(
         booking_id: int,
         obj_in: List[schemas.AcceptOrderWithRoom],
@@ -86,16 +124,17 @@ async def accept_or_cancel_order(
         return JSONResponse({'ok': False, 'detail': 'Must choose the main hotel'}, status_code=406)
 
     booking_ = await crud_booking.get_booking_(booking_id=booking_id, property_id=user.dashboard.default_property_id)
+    if not booking_:
+        return JSONResponse({'ok': False, 'detail': 'Not Found'}, status_code=404)
     total_with_draw_amount = sum(
-        with_draw for with_draw, _ in
-        [await crud_booking.with_draw_amount(room) for room in booking_.rooms]
+        with_draw for with_draw, _ in await crud_booking.with_draw_amounts(booking_.rooms)
     )
 
     if user.dashboard.balance < total_with_draw_amount:
         return JSONResponse({'ok': False, 'detail': 'You need to top up your balance to accept the order.'},
                             status_code=422)
 
-    is_accepted, status_code, user = await crud_booking.accept_or_cancel_order(
+    is_accepted, status_code, _ = await crud_booking.accept_or_cancel_order(
         property_id=user.dashboard.default_property_id,
         added_by_id=user.dashboard.id,
         booking_id=booking_id,
@@ -105,29 +144,14 @@ async def accept_or_cancel_order(
 
     if is_accepted:
         if status_code == 201:
-            if not settings.DEBUG and user.phone != settings.DEBUG_PHONE:
-                user: models.User
-                if user.phone:
-                    text = order_accept_send_sms(user.language)
-                    response_message = await eskiz.send_sms(user.phone, text)
-                    return JSONResponse(
-                        {'ok': True, 'detail': 'Successfully Accepted', 'message': f'{response_message.message}'},
-                        status_code=201)
             return JSONResponse({'ok': True, 'detail': 'Successfully Accepted'}, status_code=201)
         elif status_code == 402:
             return JSONResponse({'ok': True, 'detail': 'Payment Failed'}, status_code=402)
+        elif status_code == 409:
+            return JSONResponse({'ok': False, 'detail': 'Order or room is already taken'}, status_code=409)
         else:
             return JSONResponse({'ok': False, 'detail': 'Bad Request'}, status_code=400)
     else:
-        if not settings.DEBUG and user.phone != settings.DEBUG_PHONE:
-            user: models.User
-            if user.phone:
-                text = order_accept_send_sms(user.language, is_accept=False)
-                response_message = await eskiz.send_sms(user.phone, text)
-                return JSONResponse({
-                    'ok': True, 'detail': 'Successfully Canceled',
-                    'message': f'{response_message.message}'},
-                    status_code=201)
         return JSONResponse({'ok': True, 'detail': 'Successfully Canceled'}, status_code=201)
 
 
@@ -163,9 +187,9 @@ async def booking_history(
         sort_by: enums.HistorySortBy = Query(None, alias='sort_by'),
         sort_type: enums.SortType = Query('desc', alias='sort_type'),
         filter_by: enums.StatusBy = Query(None, alias='filter_by'),
-        user: schemas.MerchantUser = Depends(deps.get_current_user)
+        property_ids: list[int] = Depends(deps.get_property_ids)
 ):
-    if not user.dashboard or not user.dashboard.default_property_id:
+    if not property_ids:
         return JSONResponse({'ok': False, 'detail': 'Must choose the main hotel'}, status_code=406)
     return await paginator.execute(
         crud_booking.merchant_booking_history(
@@ -173,18 +197,41 @@ async def booking_history(
             search_type=search_type,
             sort_by=sort_by,
             sort_type=sort_type,
-            property_id=user.dashboard.default_property_id,
+            property_ids=property_ids,
             filter_by=filter_by)
     )
 
 
+@router.get("/booking/history/export/")
+async def export_booking_history(
+        export_format: enums.ExportFormat = Query('csv', alias='format'),
+        q: str = Query(None),
+        search_type: enums.SearchType = Query(None, alias='search_type'),
+        sort_by: enums.HistorySortBy = Query(None, alias='sort_by'),
+        sort_type: enums.SortType = Query('desc', alias='sort_type'),
+        filter_by: enums.StatusBy = Query(None, alias='filter_by'),
+        property_ids: list[int] = Depends(deps.get_property_ids)
+):
+    if not property_ids:
+        return JSONResponse({'ok': False, 'detail': 'Must choose the main hotel'}, status_code=406)
+    query = crud_booking.merchant_booking_history(
+        q=q,
+        search_type=search_type,
+        sort_by=sort_by,
+        sort_type=sort_type,
+        property_ids=property_ids,
+        filter_by=filter_by
+    )
+    return export_response(query, schemas.Booking, BOOKING_EXPORT_COLUMNS, export_format, 'booking-history')
+
+
 @router.get("/booking/history/statistics/")
 async def get_booking_statistics(
-        user: schemas.MerchantUser = Depends(deps.get_current_user),
+        property_ids: list[int] = Depends(deps.get_property_ids),
         days: CountByDays = CountByDays.LAST_30_DAYS):
-    if not user.dashboard or not user.dashboard.default_property_id:
+    if not property_ids:
         return JSONResponse({'ok': False, 'detail': 'Must choose the main hotel'}, status_code=406)
-    return await crud_booking.get_booking_statistics(days, property_id=user.dashboard.default_property_id)
+    return await crud_booking.get_booking_statistics(days, property_ids=property_ids)
 
 
 @router.get("/order/history/", response_model=schemas.DataResponse[schemas.Booking])
@@ -195,9 +242,9 @@ async def order_history(
         sort_type: enums.SortType = Query('desc', alias='sort_type'),
         sort_by: enums.HistorySortBy = Query(None, alias='sort_by'),
         filter_by: enums.OrderHistoryStatus = Query(None, alias='filter_by'),
-        user: schemas.MerchantUser = Depends(deps.get_current_user)
+        property_ids: list[int] = Depends(deps.get_property_ids)
 ):
-    if not user.dashboard or not user.dashboard.default_property_id:
+    if not property_ids:
         return JSONResponse({'ok': False, 'detail': 'Must choose the main hotel'}, status_code=406)
 
     return await paginator.execute(crud_booking.order_history(
@@ -205,6 +252,29 @@ async def order_history(
         search_type=search_type,
         sort_type=sort_type,
         filter_by=filter_by,
-        property_id=user.dashboard.default_property_id,
+        property_ids=property_ids,
         sort_by=sort_by)
     )
+
+
+@router.get("/order/history/export/")
+async def export_order_history(
+        export_format: enums.ExportFormat = Query('csv', alias='format'),
+        q: str = Query(None),
+        search_type: enums.SearchType = Query(None, alias='search_type'),
+        sort_type: enums.SortType = Query('desc', alias='sort_type'),
+        sort_by: enums.HistorySortBy = Query(None, alias='sort_by'),
+        filter_by: enums.OrderHistoryStatus = Query(None, alias='filter_by'),
+        property_ids: list[int] = Depends(deps.get_property_ids)
+):
+    if not property_ids:
+        return JSONResponse({'ok': False, 'detail': 'Must choose the main hotel'}, status_code=406)
+    query = crud_booking.order_history(
+        q=q,
+        search_type=search_type,
+        sort_type=sort_type,
+        filter_by=filter_by,
+        property_ids=property_ids,
+        sort_by=sort_by
+    )
+    return export_response(query, schemas.Booking, BOOKING_EXPORT_COLUMNS, export_format, 'order-history')
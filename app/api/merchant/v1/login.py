@@ -1,4 +1,3 @@
-from eskiz_sms.exceptions import EskizException
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -6,9 +5,9 @@ from starlette.responses import JSONResponse
 
 from app import schemas
 from app.api import deps
-from app.core.conf import settings, eskiz
+from app.core.conf import settings
 from app.core.security import Auth
-from app.crud import crud_merchant_user, crud_user
+from app.crud import crud_merchant_user, crud_user, crud_sms_outbox
 from app.utils import CodeConfirmation
 from app.utils.rate_limiter import rate_limit
 
@@ -53,12 +52,8 @@ async def check_phone(data: schemas.Login):
         return JSONResponse({'ok': False, 'detail': 'User with this phone number exists'}, status_code=400)
     token, code = await CodeConfirmation.get_code(data.phone)
     if not settings.DEBUG and data.phone != settings.DEBUG_PHONE:
-        try:
-            resp = await eskiz.send_sms(data.phone, message=settings.ESKIZ_SMS_TEXT.format(code=code))
-        except EskizException as e:
-            return JSONResponse({'ok': False, 'detail': str(e)})
-        else:
-            return {'ok': True, 'token': token, 'message': resp.message}
+        message = await crud_sms_outbox.send_code(data.phone, code)
+        return {'ok': True, 'token': token, 'message': message}
     return {'ok': True, 'token': token}
 
 
@@ -1,21 +1,48 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query
 from starlette import status
 from starlette.responses import JSONResponse
 
 from app import schemas
 from app.api import deps
 from app.crud import crud_transaction
+from app.models import enums
+from app.utils.export import export_response
 from app.utils.paginator import Paginator, paginate
 
 router = APIRouter()
 
+TRANSACTION_EXPORT_COLUMNS = {
+    'id': lambda transaction: transaction.id,
+    'created_at': lambda transaction: transaction.created_at,
+    'title': lambda transaction: transaction.title,
+    'status': lambda transaction: transaction.status,
+    'order_id': lambda transaction: transaction.order_id,
+    'property_id': lambda transaction: transaction.property_id,
+    'room_type': lambda transaction: transaction.room_type and transaction.room_type.type,
+    'amount': lambda transaction: transaction.amount,
+    'balance': lambda transaction: transaction.balance,
+}
+
 
 @router.get('/', response_model=schemas.DataResponse[schemas.Transaction])
 async def get_all_transactions(
         paginator: Paginator = Depends(paginate),
+        property_ids: list[int] = Depends(deps.get_property_ids),
         user: schemas.MerchantUser = Depends(deps.get_current_user)):
-    if not user.dashboard or not user.dashboard.default_property_id:
+    if not property_ids:
         return JSONResponse({'ok': False, 'detail': 'Must choose the main hotel'}, status_code=406)
     return await paginator.execute(
-        crud_transaction.get_all_transactions_by_property_id(property_id=user.dashboard.default_property_id,
+        crud_transaction.get_all_transactions_by_property_id(property_ids=property_ids,
                                                              dashboard_id=user.dashboard.id))
+
+
+@router.get('/export/')
+async def export_transactions(
+        export_format: enums.ExportFormat = Query('csv', alias='format'),
+        property_ids: list[int] = Depends(deps.get_property_ids),
+        user: schemas.MerchantUser = Depends(deps.get_current_user)):
+    if not property_ids:
+        return JSONResponse({'ok': False, 'detail': 'Must choose the main hotel'}, status_code=406)
+    query = crud_transaction.get_all_transactions_by_property_id(property_ids=property_ids,
+                                                                 dashboard_id=user.dashboard.id)
+    return export_response(query, schemas.Transaction, TRANSACTION_EXPORT_COLUMNS, export_format, 'transactions')
@@ -7,10 +7,10 @@ from starlette.responses import JSONResponse
 
 from app import schemas
 from app.api import deps
-from app.core.conf import settings, eskiz
+from app.core.conf import settings
 from app.core.dependencies import get_db
 from app.core.security import Auth
-from app.crud import crud_merchant_user, crud_user
+from app.crud import crud_merchant_user, crud_user, crud_sms_outbox
 from app.models import MerchantUser, enums
 from app.utils import CodeConfirmation
 from app.utils.jwt_token import JWTToken
@@ -43,8 +43,8 @@ async def update_user_phone(data: schemas.Login,
         return JSONResponse({'ok': False}, status_code=400)
     token, code = await CodeConfirmation.get_code(data.phone)
     if not settings.DEBUG and data.phone != settings.DEBUG_PHONE:
-        sms_response = await eskiz.send_sms(data.phone, message=code)
-        return {'ok': True, 'token': token, 'message': sms_response.message}
+        message = await crud_sms_outbox.send_code(data.phone, code)
+        return {'ok': True, 'token': token, 'message': message}
     return {'ok': True, 'token': token}
 
 
@@ -92,8 +92,8 @@ async def forgot_password(phone: str):
         if user.role == enums.MerchantUserRole.CHIEF and user.dashboard:
             token, code = await CodeConfirmation.get_code(user.phone)
             if not settings.DEBUG and user.phone != settings.DEBUG_PHONE:
-                sms_response = await eskiz.send_sms(user.phone, message=code)
-                return {'ok': True, 'token': token, 'message': sms_response.message}
+                message = await crud_sms_outbox.send_code(user.phone, code)
+                return {'ok': True, 'token': token, 'message': message}
             return {'ok': True, 'token': token}
         else:
             JSONResponse({
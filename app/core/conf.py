@@ -88,6 +88,26 @@ class Settings(BaseSettings):
 
     RATE_LIMIT_PREFIX: str = 'app:rl:'
     CODE_LIFETIME: int = 300  # seconds
+    PROPERTY_SEARCH_CACHE_TTL: int = 60 * 5  # seconds
+    PROPERTY_CARD_SERVICES: int = 3
+    IDEMPOTENCY_KEY_TTL: int = 60 * 60 * 24  # seconds
+    IDEMPOTENCY_LOCK_TTL: int = 60  # seconds
+    DASHBOARD_SERIES_MAX_DAYS: int = 366 * 3  # longest range of a dashboard time series
+    EXPORT_BATCH_SIZE: int = 500  # rows fetched from the server-side cursor at a time
+
+    # SMS outbox
+    SMS_PROVIDER: str = 'eskiz'  # 'stub' only logs the messages
+    SMS_OUTBOX_BATCH_SIZE: int = 50
+    SMS_OUTBOX_CONCURRENCY: int = 5
+    SMS_OUTBOX_MAX_ATTEMPTS: int = 5
+    SMS_OUTBOX_RETRY_DELAY: int = 30  # seconds, doubled after every failed attempt
+    SMS_OUTBOX_SEND_TIMEOUT: int = 10  # seconds
+    SMS_OUTBOX_LEASE: int = 60  # seconds a claimed message is hidden from other workers
+    SMS_OUTBOX_POLL_INTERVAL: int = 2  # seconds
+
+    # Booking lifecycle
+    BOOKING_PENDING_HOLD: int = 60 * 60 * 24  # seconds a pending booking waits for the merchant
+    BOOKING_LIFECYCLE_INTERVAL: int = 0  # seconds between in-app runs, 0 leaves it to `manage.py booking_lifecycle`
 
     # Debug Config
     DEBUG_SMS_CODE: str = '******'
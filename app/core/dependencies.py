@@ -14,9 +14,12 @@ from .sessions import AsyncSessionLocal
 session_context_var: ContextVar[Optional[AsyncSessionLocal]] = ContextVar("_session", default=None)
 
 
-async def set_db():
-    """Store db session in the context var and reset it"""
-    db = AsyncSessionLocal()
+async def set_db(request: Request):
+    """
+    Store db session in the context var and reset it. Only read requests load translations of the current locale,
+    a request that may save translations gets all of them.
+    """
+    db = AsyncSessionLocal(info={'localized': request.method in ('GET', 'HEAD')})
     token = session_context_var.set(db)
     try:
         yield
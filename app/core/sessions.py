@@ -1,6 +1,6 @@
 from redis.asyncio import Redis
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, Session
 
 from .conf import settings
 
@@ -11,7 +11,18 @@ database = create_async_engine(
     echo=False,
 )
 
-AsyncSessionLocal = sessionmaker(bind=database, autoflush=False, expire_on_commit=False, class_=AsyncSession)
+
+class LocalizedSession(Session):
+    """Session the ``do_orm_execute`` locale filter of ``app.models.base.filter_translations`` hooks into"""
+
+
+AsyncSessionLocal = sessionmaker(
+    bind=database,
+    autoflush=False,
+    expire_on_commit=False,
+    class_=AsyncSession,
+    sync_session_class=LocalizedSession
+)
 
 
 async def close():
@@ -6,6 +6,11 @@ from . import contract as crud_contract
 from .about import about as crud_about
 from .article import crud_article
 from . import transaction as crud_transaction
+from . import inventory as crud_inventory
+from . import search_index as crud_search_index
+from . import sms_outbox as crud_sms_outbox
+from . import lifecycle as crud_lifecycle
+from . import stats as crud_stats
 from .chat import crud_chat
 from .city import crud_city
 from .doc import crud_doc
@@ -1,21 +1,69 @@
 import logging
-from datetime import datetime, timedelta, date
+from datetime import timedelta, date
 
 import sqlalchemy as sa
 from sqlalchemy import func, desc, asc
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import joinedload, noload, selectinload
 from sqlalchemy.sql import operators
 from app import models
 from app import schemas
 from app.core.conf import settings
 from app.core.dependencies import get_db
 from app.models import enums
+from app.utils.text_search import fuzzy_match, fuzzy_rank
+from app.utils.withdrawal_rules import WithdrawalRulesCache
+from . import inventory as crud_inventory
+from . import pricing as crud_pricing
+from . import sms_outbox as crud_sms_outbox
+from . import stats as crud_stats
+from . import transaction as crud_transaction
+from . import property as crud_property
 
 logger = logging.getLogger(__name__)
 
 
+def booking_list_options(with_reviews: bool = False) -> list:
+    """
+    Loader options of the booking lists: only the relationships ``schemas.Booking`` renders are loaded
+    (``schemas.BookingHistory`` ones with ``with_reviews``), one query per relationship for the whole page.
+    Without them every booking brings in the whole catalog of its property; the detail views keep the full graph.
+    """
+    template = models.PropertyRoomTemplate
+    options = [
+        selectinload(models.Booking.user).noload('*'),
+        selectinload(models.Booking.property).options(
+            joinedload(models.Property.type).options(selectinload(models.PropertyType.translations), noload('*')),
+            joinedload(models.Property.city).options(selectinload(models.City.translations), noload('*')),
+            selectinload(models.Property.photos).selectinload(models.PropertyPhoto.photo),
+            selectinload(models.Property.translations),
+            noload('*'),
+        ),
+        selectinload(models.Booking.rooms).options(
+            selectinload(models.BookedRoom.property_room).noload('*'),
+            selectinload(models.BookedRoom.room).options(
+                joinedload(template.type).options(selectinload(models.RoomType.translations), noload('*')),
+                joinedload(template.name).selectinload(models.RoomName.translations),
+                selectinload(template.beds).selectinload(models.RoomBed.bed_type),
+                selectinload(template.photos).selectinload(models.RoomPhoto.photo),
+                noload('*'),
+            ),
+            selectinload(models.BookedRoom.beds).joinedload(models.BookedRoomBed.bed_type),
+            noload('*'),
+        ),
+    ]
+    if with_reviews:
+        options += [
+            selectinload(models.Booking.reviews).options(
+                selectinload(models.ReviewQuestionAnswer.question), noload('*')
+            ),
+            selectinload(models.Booking.comment).noload('*'),
+        ]
+    return options + [noload('*')]
+
+
 def get_all_bookings(user_id: int):
-    query = sa.select(models.Booking).where(
+    query = sa.select(models.Booking).options(*booking_list_options()).where(
         models.Booking.user_id == user_id
     ).where(
         models.Booking.status != enums.BookingStatus.CANCELED,
@@ -72,7 +120,7 @@ async def get_booking_(booking_id: int, property_id: int):
 
 
 def get_booking_history(user_id: int):
-    query = sa.select(models.Booking).where(
+    query = sa.select(models.Booking).options(*booking_list_options(with_reviews=True)).where(
         models.Booking.user_id == user_id
     ).where(
         models.Booking.status != enums.BookingStatus.PENDING,
@@ -83,51 +131,22 @@ def get_booking_history(user_id: int):
     return query
 
 
-def _calculate_discount(price: float, from_: datetime | None, to: datetime | None, unit: enums.BillingUnit,
-                        amount: float):
-    now = settings.datetime
-
-    if (from_ is not None and from_ <= now <= to) or from_ is None:
-        if unit == enums.BillingUnit.FIXED_VALUE:
-            price -= amount
-        else:
-            price -= price * amount / 100
-
-    return price
-
-
-def calculate_price(room: schemas.RoomTemplate, number_of_people: int = 1, for_resident: bool = False):
-    price = room.price_for_resident if for_resident else room.price
-    discount_from = room.price_for_resident_discount_from if for_resident else room.price_discount_from
-    discount_until = room.price_for_resident_discount_until if for_resident else room.price_discount_until
-    discount_unit = room.price_for_resident_discount_unit if for_resident else room.price_discount_unit
-    discount_amount = room.price_for_resident_discount_amount if for_resident else room.price_discount_amount
-    price_for_less_people_ = room.price_for_resident_less_people if for_resident else room.price_for_less_people
-
-    if room.max_number_of_guests == number_of_people:
-        final_price = _calculate_discount(price, discount_from, discount_until, discount_unit, discount_amount)
-    else:
-        final_price = None
-        for price_for_less_people in price_for_less_people_ or []:
-            if price_for_less_people['is_active'] and price_for_less_people['number_of_people'] == number_of_people:
-                final_price = _calculate_discount(price, None, None, price_for_less_people['discount_unit'],
-                                                  price_for_less_people['discount_amount'])
-                break
-    return final_price
-
-
 async def create(user_id: int, booking_in: schemas.BookingCreate):
     db = get_db()
     try:
+        if (prices := await price_booked_rooms(booking_in)) is None:
+            return None
         booking = models.Booking(
             user_id=user_id,
             **booking_in.dict(exclude={"rooms"})
         )
         await booking.save(refresh=True)
-        total_number_of_people, total_price = await create_booked_room(booking_id=booking.id, booking_in=booking_in)
-        difference = booking.booked_to.date() - booking.booked_from.date()
-        booking.total_price = total_price * int(difference.days)
+        total_number_of_people, total_price = await create_booked_room(
+            booking_id=booking.id, booking_in=booking_in, prices=prices
+        )
+        booking.total_price = total_price
         booking.total_number_of_people = total_number_of_people
+        await crud_stats.refresh_booking_stats(booking.id)
         await db.commit()
         await db.refresh(booking)
         return booking
@@ -137,18 +156,65 @@ async def create(user_id: int, booking_in: schemas.BookingCreate):
         raise e
 
 
-async def create_booked_room(booking_id: int, booking_in: schemas.BookingCreate):
+async def price_booked_rooms(booking_in: schemas.BookingCreate) -> dict[tuple, crud_pricing.RoomPrice] | None:
+    """Prices of all rooms of ``booking_in``, None when the property offers a room for no such number of people"""
+    keys = [(room.room_id, room.number_of_people, room.for_resident) for room in booking_in.rooms]
+    prices = await crud_pricing.get_room_prices(
+        keys, booking_in.booked_from.date(), booking_in.booked_to.date(), property_id=booking_in.property_id
+    )
+    if all(key in prices for key in keys):
+        return prices
+    return None
+
+
+async def quote(booking_in: schemas.BookingCreate) -> dict | None:
+    """Prices of ``booking_in`` as :func:`create` would store them, nothing is written"""
+    if (prices := await price_booked_rooms(booking_in)) is None:
+        return None
+    rooms = [
+        prices[room.room_id, room.number_of_people, room.for_resident]
+        for room in booking_in.rooms
+    ]
+    return dict(
+        nights=rooms[0].nights if rooms else 0,
+        total_number_of_people=sum(room.number_of_people for room in rooms),
+        total_discount=sum(room.discount for room in rooms),
+        total_price=sum(room.total for room in rooms),
+        rooms=[
+            dict(
+                room_id=room.room_id,
+                number_of_people=room.number_of_people,
+                for_resident=room.for_resident,
+                price=room.price,
+                nightly_prices=room.nightly,
+                discount=room.discount,
+                total_price=room.total,
+            )
+            for room in rooms
+        ],
+    )
+
+
+async def create_booked_room(booking_id: int, booking_in: schemas.BookingCreate,
+                             prices: dict[tuple, crud_pricing.RoomPrice]):
     db = get_db()
+    if not booking_in.rooms:
+        return 0, 0
     try:
-        rooms: list[models.PropertyRoomTemplate] = await models.PropertyRoomTemplate.filter(
-            {'id__in': [room.room_id for room in booking_in.rooms]}
-        )
-        rooms_map = {room.id: room for room in rooms}
-        total_number_of_people, total_price = 0, 0
-
-        for booked_room in booking_in.rooms:
-            booked_room_id, number_of_people, price = (await db.execute(
-                sa.insert(models.BookedRoom).values(dict(
+        room_prices = [
+            prices[booked_room.room_id, booked_room.number_of_people, booked_room.for_resident]
+            for booked_room in booking_in.rooms
+        ]
+        # the ids are drawn first: the beds are paired with their room by id, not by the order RETURNING gives
+        booked_room_ids = (await db.execute(sa.select(
+            sa.func.nextval(sa.func.pg_get_serial_sequence(models.BookedRoom.__tablename__, 'id'))
+        ).select_from(
+            sa.func.generate_series(1, len(booking_in.rooms))
+        ))).scalars().all()
+        await db.execute(
+            sa.insert(models.BookedRoom).values([
+                dict(
+                    id=booked_room_id,
                     booking_id=booking_id,
                     property_id=booking_in.property_id,
                     property_room_template_id=booked_room.room_id,
@@ -156,25 +222,23 @@ async def create_booked_room(booking_id: int, booking_in: schemas.BookingCreate)
                     booked_to=booking_in.booked_to,
                     number_of_people=booked_room.number_of_people,
                     for_resident=booked_room.for_resident,
-                    price=calculate_price(
-                        rooms_map[booked_room.room_id],
-                        number_of_people=booked_room.number_of_people,
-                        for_resident=booked_room.for_resident,
-                    )
-                )).returning(
-                    models.BookedRoom.id,
-                    models.BookedRoom.number_of_people,
-                    models.BookedRoom.price
+                    price=room_price.price,
+                )
+                for booked_room_id, booked_room, room_price in zip(booked_room_ids, booking_in.rooms, room_prices)
+            ])
+        )
+        await db.execute(
+            sa.insert(models.BookedRoomBed).values([
+                dict(
+                    booked_room_id=booked_room_id,
+                    bed_type_id=booked_room.bed_type_id,
+                    bed_for_children=booked_room.bed_for_children,
                 )
-            )).fetchone()
-            total_number_of_people += number_of_people
-            total_price += price
-
-            await models.BookedRoomBed(
-                booked_room_id=booked_room_id,
-                bed_type_id=booked_room.bed_type_id,
-                bed_for_children=booked_room.bed_for_children,
-            ).save()
+                for booked_room_id, booked_room in zip(booked_room_ids, booking_in.rooms)
+            ])
+        )
+        total_number_of_people = sum(booked_room.number_of_people for booked_room in booking_in.rooms)
+        total_price = sum(room_price.total for room_price in room_prices)
         return total_number_of_people, total_price
     except Exception as e:
         logger.error(e)
@@ -190,23 +254,29 @@ async def update_booking(
     db = get_db()
     try:
         booking = await models.Booking.get({'id': booking_id, 'user_id': user_id})
-        if booking and booking.status == enums.BookingStatus.PENDING:
+        if not booking:
+            return None
+        booking_create = schemas.BookingCreate(property_id=booking.property_id, **booking_in.dict())
+        if booking.status in (enums.BookingStatus.PENDING, enums.BookingStatus.CONFIRMED):
+            if (prices := await price_booked_rooms(booking_create)) is None:
+                return None
+
+        if booking.status == enums.BookingStatus.PENDING:
             booking.name = booking_in.name
             booking.booked_from = booking_in.booked_from
             booking.booked_to = booking_in.booked_to
-            difference = booking.booked_to.date() - booking.booked_from.date()
 
             await db.execute(
                 sa.delete(models.BookedRoom).where(models.BookedRoom.booking_id == booking_id)
             )
             total_number_of_people, total_price = await create_booked_room(
                 booking_id=booking.id,
-                booking_in=schemas.BookingCreate(
-                    property_id=booking.property_id,
-                    **booking_in.dict())
+                booking_in=booking_create,
+                prices=prices,
             )
             booking.total_number_of_people = total_number_of_people
-            booking.total_price = total_price * int(difference.days)
+            booking.total_price = total_price
+            await crud_stats.refresh_booking_stats(booking.id)
             await db.commit()
             await db.refresh(booking)
             return booking
@@ -219,10 +289,14 @@ async def update_booking(
             ))).scalars().unique().all()
             property_rooms = {room.id: room for room in property_rooms}
 
+            await crud_inventory.release_rooms(
+                [room.property_room_template_id for room in booking.rooms if room.property_room_id],
+                booking.booked_from.date(), booking.booked_to.date()
+            )
+
             booking.name = booking_in.name
             booking.booked_from = booking_in.booked_from
             booking.booked_to = booking_in.booked_to
-            difference = booking.booked_to.date() - booking.booked_from.date()
 
             for property_room in property_rooms.values():
                 property_room.status = enums.RoomStatus.EMPTY
@@ -238,15 +312,15 @@ async def update_booking(
 
             total_number_of_people, total_price = await create_booked_room(
                 booking_id=booking.id,
-                booking_in=schemas.BookingCreate(
-                    property_id=booking.property_id,
-                    **booking_in.dict(),
-                )
+                booking_in=booking_create,
+                prices=prices,
             )
-            booking.total_price = total_price * int(difference.days)
+            booking.total_price = total_price
             booking.total_number_of_people = total_number_of_people
+            await crud_stats.refresh_booking_stats(booking.id)
             await db.commit()
             await db.refresh(booking)
+            await crud_property.invalidate_property_search(booking.property_id)
             return booking
         return None
     except Exception as e:
@@ -259,7 +333,9 @@ async def delete_booking(booking_id: int, user_id: int, reason_of_cancellation:
     db = get_db()
     try:
         booking = await models.Booking.get({'id': booking_id, 'user_id': user_id})
-        if booking and booking.status == enums.BookingStatus.PENDING:
+        if not booking:
+            return None
+        if booking.status == enums.BookingStatus.PENDING:
             booking.status = enums.BookingStatus.CANCELED
             booking.canceled_by = enums.BookingCanceledBy.CLIENT
             booking.reason_of_cancellation = reason_of_cancellation
@@ -271,6 +347,7 @@ async def delete_booking(booking_id: int, user_id: int, reason_of_cancellation:
                 rooms.append(room)
             if rooms:
                 db.add_all(rooms)
+                await crud_stats.refresh_booking_stats(booking.id)
                 await db.commit()
                 return True
         elif booking and booking.status == enums.BookingStatus.CONFIRMED:
@@ -285,12 +362,10 @@ async def delete_booking(booking_id: int, user_id: int, reason_of_cancellation:
             await db.execute(sa.delete(models.PropertyRoomStatus).where(
                 operators.in_op(models.PropertyRoomStatus.booked_room_id, booked_room_ids)
             ))
-
-            dashboard_ = (await db.execute(sa.select(models.MerchantDashboard).join(
-                models.Property, models.Property.added_by_id == models.MerchantDashboard.id
-            ).where(
-                models.Property.id == booking.property_id
-            ))).scalar_one_or_none()
+            await crud_inventory.release_rooms(
+                [room.property_room_template_id for room in booking.rooms if room.property_room_id],
+                booking.booked_from.date(), booking.booked_to.date()
+            )
 
             booking.status = enums.BookingStatus.CANCELED
             booking.canceled_by = enums.BookingCanceledBy.CLIENT
@@ -299,20 +374,10 @@ async def delete_booking(booking_id: int, user_id: int, reason_of_cancellation:
             for room in booking.rooms:
                 property_room = property_rooms[room.property_room_id]
                 property_room.status = enums.RoomStatus.EMPTY
-                with_draw, type_id = await with_draw_amount(room)
-                dashboard_.balance += with_draw
-                transaction = await models.Transaction(
-                    title=enums.TransactionTitle.FOR_SERVICE,
-                    status=enums.TransactionStatus.ERROR,
-                    amount=with_draw,
-                    order_id=booking.id,
-                    balance=dashboard_.balance,
-                    dashboard_id=dashboard_.id,
-                    property_id=booking.property_id,
-                    room_type_id=type_id,
-                )
-                db.add(transaction)
+            await refund_fees(booking)
+            await crud_stats.refresh_booking_stats(booking.id)
             await db.commit()
+            await crud_property.invalidate_property_search(booking.property_id)
             return True
         else:
             return False
@@ -333,13 +398,7 @@ async def cancel_order(
     try:
         booking = await get_booking_(booking_id=booking_id, property_id=property_id)
 
-        dashboard_ = (await db.execute(sa.select(models.MerchantDashboard).join(
-            models.Property, models.Property.added_by_id == models.MerchantDashboard.id
-        ).where(
-            models.Property.id == property_id
-        ))).scalar_one_or_none()
-
-        if booking.status == enums.BookingStatus.CONFIRMED and dashboard_:
+        if booking.status == enums.BookingStatus.CONFIRMED:
             property_room_ids = [room.property_room_id for room in booking.rooms]
             booked_room_ids = [room.id for room in booking.rooms]
 
@@ -354,29 +413,24 @@ async def cancel_order(
                     booked_room_ids
                 )
             ))
+            await crud_inventory.release_rooms(
+                [room.property_room_template_id for room in booking.rooms if room.property_room_id],
+                booking.booked_from.date(), booking.booked_to.date()
+            )
             booking.is_arrived = is_arrived
             booking.status = enums.BookingStatus.CANCELED
             booking.canceled_by = enums.BookingCanceledBy.MERCHANT_USER
             booking.reason_of_cancellation = reason_of_cancellation
             for room in booking.rooms:
-                with_draw, room_type_id = await with_draw_amount(room)
                 room.status = enums.BookingStatus.CANCELED
                 property_room = property_rooms[room.property_room_id]
                 property_room.status = enums.RoomStatus.EMPTY
-                dashboard_.balance += with_draw
-                transaction = models.Transaction(
-                    title=enums.TransactionTitle.FOR_SERVICE,
-                    status=enums.TransactionStatus.ERROR,
-                    amount=with_draw,
-                    order_id=booking.id,
-                    balance=dashboard_.balance,
-                    dashboard_id=dashboard_.id,
-                    property_id=booking.property_id,
-                    room_type_id=room_type_id,
-                )
-                db.add(transaction)
+            await refund_fees(booking)
+            await crud_sms_outbox.enqueue_order_sms(booking.user, booking.id, is_accept=False)
+            await crud_stats.refresh_booking_stats(booking.id)
             await db.commit()
             await db.refresh(booking)
+            await crud_property.invalidate_property_search(property_id)
             return booking.user, True
         return None, False
     except Exception as e:
@@ -399,6 +453,7 @@ async def change_order_status(status: enums.BookingStatus, booking_id: int, prop
                 result.append(room)
             if result:
                 db.add_all(result)
+                await crud_stats.refresh_booking_stats(booking.id)
                 await db.commit()
                 await db.refresh(booking)
                 return True
@@ -409,6 +464,17 @@ async def change_order_status(status: enums.BookingStatus, booking_id: int, prop
             ))).scalars().unique().all()
             property_rooms = {room.id: room for room in property_rooms}
 
+            # the guest has left: rooms are free from today on
+            today = settings.datetime.date()
+            await db.execute(sa.update(models.PropertyRoomStatus).where(
+                operators.in_op(models.PropertyRoomStatus.booked_room_id, [room.id for room in booking.rooms]),
+                models.PropertyRoomStatus.status_until > today
+            ).values(status_until=today))
+            await crud_inventory.release_rooms(
+                [room.property_room_template_id for room in booking.rooms if room.property_room_id],
+                booking.booked_from.date(), booking.booked_to.date()
+            )
+
             booking.status = enums.BookingStatus.CLOSED
             result = []
             for room in booking.rooms:
@@ -419,8 +485,10 @@ async def change_order_status(status: enums.BookingStatus, booking_id: int, prop
                 result.append(room)
             if result:
                 db.add_all(result)
+                await crud_stats.refresh_booking_stats(booking.id)
                 await db.commit()
                 await db.refresh(booking)
+                await crud_property.invalidate_property_search(property_id)
                 return True
         return False
     except Exception as e:
@@ -429,33 +497,67 @@ async def change_order_status(status: enums.BookingStatus, booking_id: int, prop
         raise e
 
 
-async def with_draw_amount(room: models.BookedRoom):
+async def _load_withdrawal_rules() -> dict[int, dict]:
     db = get_db()
-    price = room.price
-    room_type_id = room.room.type_id
-
-    with_draw_obj: models.WithdrawalAmount = (
-        await db.execute(sa.select(models.WithdrawalAmount).where(
-            models.WithdrawalAmount.room_type_id == room_type_id))
-    ).scalar_one_or_none()
-
-    if with_draw_obj:
-        if room.for_resident:
-            amount_unit = with_draw_obj.amount_unit_for_resident
-            amount = (
-                with_draw_obj.amount_for_resident if amount_unit == enums.BillingUnit.FIXED_VALUE
-                else price * with_draw_obj.amount_for_resident / 100
-            )
-        else:
-            amount_unit = with_draw_obj.amount_unit
-            amount = (
-                with_draw_obj.amount if amount_unit == enums.BillingUnit.FIXED_VALUE
-                else price * with_draw_obj.amount / 100
-            )
+    rules = (await db.execute(sa.select(
+        models.WithdrawalAmount.room_type_id,
+        models.WithdrawalAmount.amount,
+        models.WithdrawalAmount.amount_unit,
+        models.WithdrawalAmount.amount_for_resident,
+        models.WithdrawalAmount.amount_unit_for_resident,
+    ))).mappings().all()
+    return {rule['room_type_id']: dict(rule) for rule in rules}
+
+
+def _with_draw(rule: dict | None, room: models.BookedRoom) -> float:
+    if rule is None:
+        return 1000
+    if room.for_resident:
+        amount_unit, amount = rule['amount_unit_for_resident'], rule['amount_for_resident']
     else:
-        amount = 1000
+        amount_unit, amount = rule['amount_unit'], rule['amount']
+    return amount if amount_unit == enums.BillingUnit.FIXED_VALUE else room.price * amount / 100
+
+
+async def with_draw_amounts(rooms: list[models.BookedRoom]) -> list[tuple[float, int]]:
+    """Fee and room type id of every booked room, from the cached fee rules"""
+    rules = await WithdrawalRulesCache.get_rules(_load_withdrawal_rules)
+    return [(_with_draw(rules.get(room.room.type_id), room), room.room.type_id) for room in rooms]
+
+
+def fee_entry(booking: models.Booking, amount: float, room_type_id: int) -> dict:
+    """Ledger entry of the service fee of a booked room, charged with a negative ``amount``, refunded with a positive"""
+    return dict(
+        title=enums.TransactionTitle.FOR_SERVICE,
+        status=enums.TransactionStatus.SUCCESS if amount < 0 else enums.TransactionStatus.ERROR,
+        amount=amount,
+        order_id=booking.id,
+        property_id=booking.property_id,
+        room_type_id=room_type_id,
+    )
+
 
-    return amount, room_type_id
+async def refund_fees(booking: models.Booking):
+    """Gives the merchant back the fees of the rooms of a canceled confirmed booking"""
+    db = get_db()
+    dashboard_id = (await db.execute(sa.select(models.Property.added_by_id).where(
+        models.Property.id == booking.property_id
+    ))).scalar_one_or_none()
+    if dashboard_id:
+        await crud_transaction.post_entries(dashboard_id, [
+            fee_entry(booking, with_draw, type_id)
+            for with_draw, type_id in await with_draw_amounts(booking.rooms) if with_draw > 0
+        ])
+
+
+def property_rooms_query(property_id: int, rooms: list[tuple[int, int]]):
+    """``PropertyRoom`` rows of the ``(property_room_id, template_id)`` pairs whose template is of the property"""
+    return sa.select(models.PropertyRoom).join(
+        models.PropertyRoomTemplate, models.PropertyRoomTemplate.id == models.PropertyRoom.room_id
+    ).where(
+        sa.tuple_(models.PropertyRoom.id, models.PropertyRoom.room_id).in_(rooms),
+        models.PropertyRoomTemplate.property_id == property_id,
+    )
 
 
 async def accept_or_cancel_order(
@@ -465,68 +567,111 @@ async def accept_or_cancel_order(
         obj_in: list[schemas.AcceptOrderWithRoom],
         accept_or_cancel: enums.AcceptOrCancel
 ):
+    """
+    Accepting locks only the rows of this booking, its rooms and the merchant's dashboard:
+    400 when ``obj_in`` does not give every booked room its own room of the booked template of this property,
+    409 when another accept got the booking or a room first or a night has no free room left,
+    402 when the balance is short. Every booked room is assigned; only the rooms with a fee are charged.
+    """
     db = get_db()
     try:
         room_ids = {room.booked_room_id: room.room_id for room in obj_in}
-        property_rooms = (
-            await db.execute(sa.select(models.PropertyRoom).where(
-                operators.in_op(models.PropertyRoom.id, [x.room_id for x in obj_in])))
-        ).scalars().unique().all()
-
-        property_rooms = {room.id: room for room in property_rooms}
 
         booking: schemas.Booking = await get_booking_(property_id=property_id, booking_id=booking_id)
         if booking:
             if accept_or_cancel == enums.AcceptOrCancel.ACCEPT:
-                dashboard_: models.MerchantDashboard = (await db.execute(
-                    sa.select(models.MerchantDashboard).where(models.MerchantDashboard.id == added_by_id)
+                if (
+                        room_ids.keys() != {room.id for room in booking.rooms}
+                        or len(obj_in) != len(room_ids)
+                        or len(set(room_ids.values())) < len(room_ids)
+                ):
+                    return True, 400, None
+                rooms_of_templates = [(room_ids[room.id], room.property_room_template_id) for room in booking.rooms]
+                if len((await db.execute(
+                        property_rooms_query(property_id, rooms_of_templates)
+                )).scalars().all()) < len(rooms_of_templates):
+                    return True, 400, None
+                fees = await with_draw_amounts(booking.rooms)
+                total_with_draw_amount = sum(with_draw for with_draw, _ in fees)
+                if total_with_draw_amount <= 0:
+                    return True, 402, None
+
+                # conditional update: of two concurrent accepts only one still sees the booking pending
+                claimed = (await db.execute(
+                    sa.update(models.Booking).where(
+                        models.Booking.id == booking.id,
+                        models.Booking.status == enums.BookingStatus.PENDING,
+                    ).values(
+                        status=enums.BookingStatus.CONFIRMED
+                    ).returning(
+                        models.Booking.id
+                    ).execution_options(synchronize_session=False)
                 )).scalar_one_or_none()
+                if not claimed:
+                    await db.rollback()
+                    return True, 409, None
+
+                rooms = [(room, *fee) for room, fee in zip(booking.rooms, fees)]
+                property_room_ids = sorted(room_ids.values())
+                # a room locked by another accept is skipped, not waited for
+                property_rooms = (await db.execute(
+                    property_rooms_query(property_id, rooms_of_templates).order_by(
+                        models.PropertyRoom.id
+                    ).with_for_update(skip_locked=True, of=models.PropertyRoom)
+                )).scalars().unique().all()
+                property_rooms = {room.id: room for room in property_rooms}
+                is_taken = (await db.execute(sa.select(sa.exists().where(
+                    operators.in_op(models.PropertyRoomStatus.property_room_id, property_room_ids),
+                    models.PropertyRoomStatus.status == enums.RoomStatus.BUSY,
+                    models.PropertyRoomStatus.status_from < booking.booked_to.date(),
+                    booking.booked_from.date() < models.PropertyRoomStatus.status_until,
+                )))).scalar()
+                if is_taken or len(property_rooms) < len(property_room_ids):
+                    await db.rollback()
+                    return True, 409, None
+
+                if not await crud_inventory.reserve_rooms(
+                        [room.property_room_template_id for room, _, _ in rooms],
+                        booking.booked_from.date(), booking.booked_to.date()
+                ):
+                    await db.rollback()
+                    return True, 409, None
+
+                # the dashboard row stays locked only from here to the commit
+                balance = await crud_transaction.post_entries(added_by_id, [
+                    fee_entry(booking, -with_draw, type_id) for _, with_draw, type_id in rooms if with_draw > 0
+                ], min_balance=0)
+                if balance is None:
+                    await db.rollback()
+                    return True, 402, None
 
                 booking.status = enums.BookingStatus.CONFIRMED
-                db.add(booking)
-                total_with_draw_amount = sum(
-                    with_draw for with_draw, _ in
-                    [await with_draw_amount(room) for room in booking.rooms]
-                )
-                if dashboard_.balance >= total_with_draw_amount > 0:
-                    for room, (with_draw, type_id) in zip(
-                            booking.rooms,
-                            [await with_draw_amount(room) for room in booking.rooms]
-                    ):
-                        if dashboard_.balance >= with_draw > 0:
-                            room.property_room_id = room_ids[room.id]
-                            property_room = property_rooms[room.property_room_id]
-                            property_room.status = enums.RoomStatus.BUSY
-                            db.add(property_room)
-                            room.status = enums.BookingStatus.CONFIRMED
-                            db.add(room)
-                            dashboard_.balance -= with_draw
-                            db.add(dashboard_)
-                            room_status = models.PropertyRoomStatus(
-                                property_room_id=room.property_room_id,
-                                booked_room_id=room.id,
-                                status=enums.RoomStatus.BUSY,
-                                status_from=booking.booked_from.date(),
-                                status_until=booking.booked_to.date()
-                            )
-                            db.add(room_status)
-                            transaction = models.Transaction(
-                                title=enums.TransactionTitle.FOR_SERVICE,
-                                status=enums.TransactionStatus.SUCCESS,
-                                amount=-with_draw,
-                                order_id=booking.id,
-                                balance=dashboard_.balance,
-                                dashboard_id=added_by_id,
-                                property_id=property_id,
-                                room_type_id=type_id,
-                            )
-                            db.add(transaction)
-                    await db.commit()
-                    return True, 201, booking.user
-                return True, 402, None
+                for room, _, _ in rooms:
+                    room.property_room_id = room_ids[room.id]
+                    property_room = property_rooms[room.property_room_id]
+                    property_room.status = enums.RoomStatus.BUSY
+                    room.status = enums.BookingStatus.CONFIRMED
+                    db.add_all([
+                        property_room,
+                        room,
+                        models.PropertyRoomStatus(
+                            property_room_id=room.property_room_id,
+                            booked_room_id=room.id,
+                            status=enums.RoomStatus.BUSY,
+                            status_from=booking.booked_from.date(),
+                            status_until=booking.booked_to.date()
+                        ),
+                    ])
+                await crud_sms_outbox.enqueue_order_sms(booking.user, booking.id)
+                await crud_stats.refresh_booking_stats(booking.id)
+                await db.commit()
+                await crud_property.invalidate_property_search(property_id)
+                return True, 201, booking.user
             else:
                 booking.status = enums.BookingStatus.CANCELED
                 booking.cancellation_from_whom = enums.BookingCanceledBy.MERCHANT_USER
+                await crud_sms_outbox.enqueue_order_sms(booking.user, booking.id, is_accept=False)
+                await crud_stats.refresh_booking_stats(booking.id)
                 await db.commit()
                 await db.refresh(booking)
                 return False, 200, booking.user
@@ -537,11 +682,11 @@ async def accept_or_cancel_order(
 
 
 def get_orders(
-        property_id: int,
+        property_ids: list[int],
         sort_by: enums.OrderSortBy
 ):
-    query = sa.select(models.Booking).where(
-        models.Booking.property_id == property_id,
+    query = sa.select(models.Booking).options(*booking_list_options()).where(
+        operators.in_op(models.Booking.property_id, property_ids),
         models.Booking.status == enums.BookingStatus.PENDING
     )
 
@@ -559,6 +704,9 @@ async def get_order(booking_id: int):
 
 
 async def get_empty_template_rooms(room_id: int, booked_from: date, booked_to: date, is_client: bool = False):
+    if is_client:
+        return await crud_inventory.get_free_rooms_count(room_id, booked_from, booked_to)
+
     db = get_db()
     rooms = (
         await db.execute(sa.select(models.PropertyRoom).where(
@@ -567,103 +715,142 @@ async def get_empty_template_rooms(room_id: int, booked_from: date, booked_to: d
         )).scalars().unique().all()
 
     room_ids = (await db.execute(sa.select(models.PropertyRoomStatus.property_room_id).where(
+        operators.in_op(models.PropertyRoomStatus.property_room_id, [r.id for r in rooms]),
         models.PropertyRoomStatus.status_from >= booked_from,
         models.PropertyRoomStatus.status_until <= booked_to,
         models.PropertyRoomStatus.status == enums.RoomStatus.BUSY,
     ))).scalars().unique().all()
 
-    rooms = [r for r in rooms if r.id not in room_ids]
-    if is_client:
-        return len(rooms)
-    return rooms
+    return [r for r in rooms if r.id not in room_ids]
+
+
+def _period(days: enums.CountByDays) -> tuple[date, date]:
+    """First and last local day of a ``CountByDays`` period, the last N days include today"""
+    today = settings.datetime.date()
+    if days == enums.CountByDays.LAST_30_DAYS:
+        return today - timedelta(days=29), today
+    elif days == enums.CountByDays.LAST_15_DAYS:
+        return today - timedelta(days=14), today
+    elif days == enums.CountByDays.LAST_WEEK:
+        return today - timedelta(days=6), today
+    elif days == enums.CountByDays.YESTERDAY:
+        return today - timedelta(days=1), today - timedelta(days=1)
+    return today, today
+
+
+def _in_period(days: enums.CountByDays):
+    start, end = _period(days)
+    return models.PropertyDailyStats.date.between(start, end)
+
+
+def _total(column, *where):
+    total = func.sum(column)
+    return func.coalesce(total.filter(*where) if where else total, 0)
+
+
+def _per_property(property_ids: list[int], *columns, on=()):
+    """
+    ``columns`` summed over the daily rows of every property in ``property_ids`` (a property without rows gets
+    zeros) and, by ``ROLLUP``, over all of them in the row with ``property_id`` NULL. ``on`` filters the daily rows.
+    """
+    stats = models.PropertyDailyStats
+    return sa.select(
+        models.Property.id.label('property_id'), *columns
+    ).select_from(
+        models.Property
+    ).outerjoin(
+        stats, sa.and_(stats.property_id == models.Property.id, *on)
+    ).where(
+        operators.in_op(models.Property.id, property_ids)
+    ).group_by(
+        func.rollup(models.Property.id)
+    ).order_by(
+        models.Property.id
+    )
 
 
-async def get_orders_statistics(property_id: int):
-    db = get_db()
-    query = sa.select(models.Booking).where(models.Booking.property_id == property_id)
-    total_orders = (await db.execute(sa.select(sa.func.count()).select_from(query))).scalar()
-    last_30_days = (await db.execute(sa.select(sa.func.count()).select_from(
-        query.where(models.Booking.created_at >= datetime.now() - timedelta(days=30))))).scalar()
-    yesterday = (await db.execute(sa.select(sa.func.count()).select_from(
-        query.where(models.Booking.created_at >= datetime.now() - timedelta(days=1))))).scalar()
-    today = (await db.execute(sa.select(sa.func.count()).select_from(
-        query.where(sa.func.DATE(models.Booking.created_at) == datetime.now().date())))).scalar()
-
-    return {
-        'total_orders': total_orders,
-        'last_30_days': last_30_days,
-        'yesterday': yesterday,
-        'today': today
-    }
-
-
-async def get_booking_statistics(days: enums.CountByDays, property_id: int):
-    db = get_db()
-    query = sa.select(models.Booking).where(models.Booking.property_id == property_id)
-    if days.LAST_30_DAYS:
-        query = query.where(models.Booking.created_at >= datetime.now() - timedelta(days=30))
-    elif days.LAST_15_DAYS:
-        query = query.where(models.Booking.created_at >= datetime.now() - timedelta(days=15))
-    elif days.LAST_WEEK:
-        query = query.where(models.Booking.created_at >= datetime.now() - timedelta(weeks=1))
-    elif days.YESTERDAY:
-        query = query.where(sa.func.DATE(models.Booking.created_at) == datetime.now().date() - timedelta(days=1))
-    else:
-        query = query.where(sa.func.DATE(models.Booking.created_at) == datetime.now().date())
+def _breakdown(rows) -> dict:
+    """The totals row of a :func:`_per_property` query, with the rows of the properties under ``properties``"""
+    totals, properties = {}, []
+    for row in rows:
+        row = dict(row)
+        if row['property_id'] is None:
+            totals = {key: value for key, value in row.items() if key != 'property_id'}
+        else:
+            properties.append(row)
+    return dict(totals, properties=properties)
+
+
+def orders_statistics_query(property_ids: list[int]):
+    stats = models.PropertyDailyStats
+    today = settings.datetime.date()
+    return _per_property(
+        property_ids,
+        _total(stats.orders).label('total_orders'),
+        _total(stats.orders, _in_period(enums.CountByDays.LAST_30_DAYS)).label('last_30_days'),
+        _total(stats.orders, stats.date == today - timedelta(days=1)).label('yesterday'),
+        _total(stats.orders, stats.date == today).label('today'),
+    )
 
-    total_booking = (await db.execute(sa.select(sa.func.count()).select_from(query))).scalar()
-    booked = (await db.execute(sa.select(func.count()).select_from(
-        query.where(models.Booking.status == enums.BookingStatus.PENDING)))).scalar()
-    reside = (await db.execute(
-        sa.select(func.count()).select_from(query.where(models.Booking.status == enums.BookingStatus.ACTIVE)))).scalar()
 
-    return {
-        'total_booking': total_booking,
-        'booked': booked,
-        'reside': reside
-    }
+def booking_statistics_query(days: enums.CountByDays, property_ids: list[int]):
+    stats = models.PropertyDailyStats
+    return _per_property(
+        property_ids,
+        _total(stats.orders).label('total_booking'),
+        _total(stats.pending).label('booked'),
+        _total(stats.active).label('reside'),
+        on=[_in_period(days)],
+    )
 
 
-async def get_accounting(property_id: int, days: enums.CountByDays):
-    db = get_db()
-    query = sa.select(models.Booking).where(
-        models.Booking.property_id == property_id).where(
-        models.Booking.status == enums.BookingStatus.CLOSED
+def accounting_query(days: enums.CountByDays, property_ids: list[int]):
+    stats = models.PropertyDailyStats
+    return _per_property(
+        property_ids,
+        _total(stats.revenue).label('total'),
+        _total(stats.fees).label('withdraw'),
+        (_total(stats.revenue) - _total(stats.fees)).label('profit'),
+        on=[_in_period(days)],
     )
 
-    query_transaction = sa.select(models.Transaction).where(
-        models.Transaction.property_id == property_id,
-        models.Transaction.title == enums.TransactionTitle.FOR_SERVICE
-    )
 
-    if days.LAST_30_DAYS:
-        query = query.where(models.Booking.created_at >= datetime.now() - timedelta(days=30))
-        query_transaction = query_transaction.where(
-            models.Transaction.created_at >= datetime.now() - timedelta(days=30)
-        )
-    elif days.LAST_15_DAYS:
-        query = query.where(models.Booking.created_at >= datetime.now() - timedelta(days=15))
-        query_transaction = query_transaction.where(
-            models.Transaction.created_at >= datetime.now() - timedelta(days=15)
-        )
-    elif days.YESTERDAY:
-        query = query.where(sa.func.DATE(models.Booking.created_at) == datetime.now().date() - timedelta(days=1))
-        query_transaction = query_transaction.where(
-            sa.func.DATE(models.Transaction.created_at) == datetime.now().date() - timedelta(days=1))
-    else:
-        query = query.where(sa.func.DATE(models.Booking.created_at) == datetime.now().date())
-        query_transaction = query_transaction.where(
-            sa.func.DATE(models.Transaction.created_at) == datetime.now().date())
+async def get_orders_statistics(property_ids: list[int]):
+    db = get_db()
+    return _breakdown((await db.execute(orders_statistics_query(property_ids))).mappings())
+
+
+async def get_booking_statistics(days: enums.CountByDays, property_ids: list[int]):
+    db = get_db()
+    return _breakdown((await db.execute(booking_statistics_query(days, property_ids))).mappings())
 
-    total = (await db.execute(sa.select(sa.func.sum(models.Booking.total_price)).select_from(query))).scalar() or 0
-    withdraw = (await db.execute(
-        sa.select(sa.func.sum(models.Transaction.amount)).select_from(query_transaction))).scalar() or 0
 
-    return {
-        'total': total,
-        'withdraw': withdraw,
-        'profit': total - withdraw
-    }
+async def get_accounting(property_ids: list[int], days: enums.CountByDays):
+    db = get_db()
+    return _breakdown((await db.execute(accounting_query(days, property_ids))).mappings())
+
+
+async def get_dashboard_summary(property_ids: list[int], days: enums.CountByDays):
+    """The orders, bookings and accounting widgets in one query, joined on the property of their rows"""
+    db = get_db()
+    widgets = dict(
+        orders=orders_statistics_query(property_ids).subquery(),
+        bookings=booking_statistics_query(days, property_ids).subquery(),
+        accounting=accounting_query(days, property_ids).subquery(),
+    )
+    orders, *others = widgets.values()
+    joined = orders
+    for widget in others:
+        joined = joined.join(widget, widget.c.property_id.isnot_distinct_from(orders.c.property_id))
+
+    rows = {name: [] for name in widgets}
+    for row in (await db.execute(
+            sa.select(*widgets.values()).select_from(joined).order_by(orders.c.property_id)
+    )).all():
+        values = iter(row)
+        for name, widget in widgets.items():
+            rows[name].append({column.key: next(values) for column in widget.c})
+    return {name: _breakdown(widget_rows) for name, widget_rows in rows.items()}
 
 
 def orders_sort_by_type(query, sort_by):
@@ -681,33 +868,25 @@ def orders_sort_by_type(query, sort_by):
 
 def merchant_booking_history(
         q: str,
-        property_id: int,
+        property_ids: list[int],
         search_type: enums.SearchType,
         sort_by: enums.HistorySortBy,
         sort_type: enums.SortType,
         filter_by: enums.StatusBy,
 
 ):
-    query = sa.select(models.Booking).where(
-        models.Booking.property_id == property_id
+    query = sa.select(models.Booking).options(*booking_list_options()).where(
+        operators.in_op(models.Booking.property_id, property_ids)
     )
     if q:
         if search_type == enums.SearchType.ALL:
             if q.isnumeric():
                 query = query.where(models.Booking.total_price == float(q))
             else:
-                query = query.where(
-                    operators.ilike_op(
-                        models.Booking.name, f"%{q}%"
-                    )
-                )
-        elif search_type.NAME:
-            query = query.where(
-                operators.ilike_op(
-                    models.Booking.name, f"%{q}%"
-                )
-            )
-        elif search_type.PRICE:
+                query = filter_by_name(query, q, sort_by)
+        elif search_type == enums.SearchType.NAME:
+            query = filter_by_name(query, q, sort_by)
+        elif search_type == enums.SearchType.PRICE:
             query = query.where(
                 models.Booking.total_price == float(q)
             )
@@ -734,28 +913,20 @@ def order_history(
         sort_type: enums.SortType,
         sort_by: enums.HistorySortBy,
         filter_by: enums.OrderHistoryStatus,
-        property_id: int,
+        property_ids: list[int],
 ):
-    query = sa.select(models.Booking).where(
-        models.Booking.property_id == property_id
+    query = sa.select(models.Booking).options(*booking_list_options()).where(
+        operators.in_op(models.Booking.property_id, property_ids)
     )
     if q:
         if search_type == enums.SearchType.ALL:
             if q.isnumeric():
                 query = query.where(models.Booking.total_price == float(q))
             else:
-                query = query.where(
-                    operators.ilike_op(
-                        models.Booking.name, f"%{q}%"
-                    )
-                )
-        elif search_type.NAME:
-            query = query.where(
-                operators.ilike_op(
-                    models.Booking.name, f"%{q}%"
-                )
-            )
-        elif search_type.PRICE:
+                query = filter_by_name(query, q, sort_by)
+        elif search_type == enums.SearchType.NAME:
+            query = filter_by_name(query, q, sort_by)
+        elif search_type == enums.SearchType.PRICE:
             query = query.where(
                 models.Booking.total_price == float(q)
             )
@@ -776,9 +947,16 @@ def order_history(
     return query
 
 
+def filter_by_name(query, q: str, sort_by=None):
+    """Fuzzy guest name search, closest names first unless an explicit ``sort_by`` orders the results"""
+    query = query.where(fuzzy_match(models.Booking.name, q))
+    if not sort_by:
+        query = query.order_by(desc(fuzzy_rank(models.Booking.name, q)))
+    return query
+
+
 def filter_by_sort_type(query, sort_type, sorty_by):
     sort_type_ = desc if sort_type == enums.SortType.DESC else asc
-    query = query.order_by(desc(models.Booking.id))
     if sorty_by:
         if sorty_by == enums.HistorySortBy.ROOM_NAME:
             pass
@@ -792,4 +970,6 @@ def filter_by_sort_type(query, sort_type, sorty_by):
             query = query.order_by(sort_type_(models.Booking.status))
         elif sorty_by == enums.HistorySortBy.PRICE:
             query = query.order_by(sort_type_(models.Booking.total_price))
+    # newest first among equal sort keys, the id is unique so the order is stable across pages
+    query = query.order_by(desc(models.Booking.id))
     return query
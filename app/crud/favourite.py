@@ -4,6 +4,7 @@ import sqlalchemy as sa
 
 from app import models
 from app.core.dependencies import get_db
+from . import property as crud_property
 
 
 class CRUDUserFavourite:
@@ -22,8 +23,7 @@ class CRUDUserFavourite:
             await db.delete(user_favourite)
             await db.commit()
             return True
-        fav_list = await crud_favourite.favourite_list(user_id)
-        if len(fav_list) < 20:
+        if await crud_favourite.favourite_count(user_id) < 20:
             favourite_instance = models.UserFavourite(user_id=user_id, property_id=property_id)
             db.add(favourite_instance)
             await db.commit()
@@ -32,18 +32,19 @@ class CRUDUserFavourite:
         return None
 
     @staticmethod
-    async def favourite_list(user_id: int):
+    async def favourite_count(user_id: int) -> int:
         db = get_db()
-        query = sa.select(
-            models.Property
-        ).select_from(
-            models.UserFavourite
-        ).join(
-            models.Property
-        ).where(
+        query = sa.select(sa.func.count()).where(models.UserFavourite.user_id == user_id)
+        return (await db.execute(query)).scalar_one()
+
+    @staticmethod
+    async def favourite_cards(user_id: int) -> list[dict]:
+        db = get_db()
+        query = sa.select(models.UserFavourite.property_id).where(
             models.UserFavourite.user_id == user_id
-        )
-        return (await db.execute(query)).scalars().unique().all()
+        ).order_by(models.UserFavourite.id.desc())
+        property_ids = (await db.execute(query)).scalars().all()
+        return await crud_property.get_property_cards(property_ids)
 
 
 crud_favourite = CRUDUserFavourite()
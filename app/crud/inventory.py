@@ -0,0 +1,168 @@
+import logging
+from collections import defaultdict
+from datetime import date, timedelta
+
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.sql import operators
+
+from app import models
+from app.core.conf import settings
+from app.core.dependencies import get_db
+from app.models import enums
+from app.utils.datetime import utcnow
+
+logger = logging.getLogger(__name__)
+
+
+def stay_nights(start: date, end: date) -> list[date]:
+    """Nights occupied by a stay from ``start`` to ``end``, a same-day stay occupies one night"""
+    return [start + timedelta(days=i) for i in range(max((end - start).days, 1))]
+
+
+def total_rooms(room_id):
+    """Capacity of a room template: the number of its physical rooms, every count of free rooms starts from it"""
+    return sa.select(sa.func.count(models.PropertyRoom.id)).where(
+        models.PropertyRoom.room_id == room_id
+    ).scalar_subquery()
+
+
+def has_free_rooms(checkin: date, checkout: date, rooms: int = 1):
+    """Condition on PropertyRoomTemplate: ``rooms`` rooms are free for every night of the stay"""
+    nights = stay_nights(checkin, checkout)
+    return sa.and_(
+        total_rooms(models.PropertyRoomTemplate.id) >= rooms,
+        ~sa.exists().where(
+            models.RoomInventory.room_id == models.PropertyRoomTemplate.id,
+            models.RoomInventory.date >= nights[0],
+            models.RoomInventory.date <= nights[-1],
+            models.RoomInventory.available < rooms,
+        )
+    )
+
+
+async def get_free_rooms_count(room_id: int, checkin: date, checkout: date) -> int:
+    db = get_db()
+    nights = stay_nights(checkin, checkout)
+    query = sa.select(
+        sa.func.coalesce(sa.func.min(models.RoomInventory.available), total_rooms(room_id))
+    ).where(
+        models.RoomInventory.room_id == room_id,
+        models.RoomInventory.date >= nights[0],
+        models.RoomInventory.date <= nights[-1],
+    )
+    return max((await db.execute(query)).scalar() or 0, 0)
+
+
+async def update_inventory(changes: dict[tuple[int, date], int]) -> bool:
+    """
+    Apply ``{(room_id, night): delta}`` to the inventory within the current transaction. A night is never taken
+    below zero free rooms: False when one of them would be, the caller has to roll back.
+    """
+    db = get_db()
+    by_delta = defaultdict(list)
+    for (room_id, night), delta in changes.items():
+        if delta:
+            by_delta[delta].append((room_id, night))
+
+    for delta, keys in by_delta.items():
+        nights = sa.values(
+            sa.column('room_id', sa.Integer), sa.column('date', sa.Date), name='nights'
+        ).data(keys)
+        available = total_rooms(nights.c.room_id) + delta
+        stmt = insert(models.RoomInventory).from_select(
+            ['room_id', 'date', 'available', 'created_at', 'updated_at'],
+            sa.select(nights.c.room_id, nights.c.date, available, sa.func.now(), sa.func.now()).where(available >= 0)
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[models.RoomInventory.room_id, models.RoomInventory.date],
+            set_=dict(available=models.RoomInventory.available + delta, updated_at=utcnow()),
+            where=models.RoomInventory.available + delta >= 0
+        )
+        changed = (await db.execute(stmt.returning(models.RoomInventory.id))).all()
+        if len(changed) < len(keys):
+            return False
+    return True
+
+
+async def reserve_rooms(room_ids: list[int], start: date, end: date) -> bool:
+    """Take one room of each template in ``room_ids`` (repeats allowed) for the stay, False when one is full"""
+    return await _change_rooms(room_ids, start, end, -1)
+
+
+async def release_rooms(room_ids: list[int], start: date, end: date):
+    """Give back rooms taken by :func:`reserve_rooms`, past nights are left untouched"""
+    start = max(start, settings.datetime.date())
+    if start < end:
+        await _change_rooms(room_ids, start, end, 1)
+
+
+async def _change_rooms(room_ids: list[int], start: date, end: date, sign: int) -> bool:
+    changes = defaultdict(int)
+    for room_id in room_ids:
+        for night in stay_nights(start, end):
+            changes[(room_id, night)] += sign
+    return await update_inventory(changes)
+
+
+async def resize_room(room_id: int, delta: int):
+    """
+    Shift upcoming nights of a template whose number of physical rooms changed by ``delta``,
+    a night with more rooms taken than are left keeps none free
+    """
+    if delta:
+        db = get_db()
+        await db.execute(sa.update(models.RoomInventory).where(
+            models.RoomInventory.room_id == room_id,
+            models.RoomInventory.date >= settings.datetime.date()
+        ).values(
+            available=sa.func.greatest(models.RoomInventory.available + delta, 0)
+        ))
+
+
+async def rebuild_inventory(room_id: int = None):
+    """Recompute upcoming nights from busy ``PropertyRoomStatus`` rows"""
+    db = get_db()
+    today = settings.datetime.date()
+    try:
+        delete_stmt = sa.delete(models.RoomInventory).where(models.RoomInventory.date >= today)
+        if room_id:
+            delete_stmt = delete_stmt.where(models.RoomInventory.room_id == room_id)
+        await db.execute(delete_stmt)
+
+        night = sa.cast(sa.func.generate_series(
+            models.PropertyRoomStatus.status_from,
+            sa.func.greatest(models.PropertyRoomStatus.status_until - 1, models.PropertyRoomStatus.status_from),
+            sa.literal_column("interval '1 day'")
+        ), sa.Date).label('date')
+        busy_nights = sa.select(models.PropertyRoom.room_id, night).join(
+            models.PropertyRoom, models.PropertyRoom.id == models.PropertyRoomStatus.property_room_id
+        ).where(
+            models.PropertyRoomStatus.status == enums.RoomStatus.BUSY,
+            operators.isnot(models.PropertyRoomStatus.status_from, None),
+            models.PropertyRoomStatus.status_until >= today,
+        )
+        if room_id:
+            busy_nights = busy_nights.where(models.PropertyRoom.room_id == room_id)
+        busy_nights = busy_nights.subquery()
+
+        busy = sa.select(
+            busy_nights.c.room_id,
+            busy_nights.c.date,
+            sa.func.greatest(total_rooms(busy_nights.c.room_id) - sa.func.count(), 0).label('available'),
+            sa.func.now(),
+            sa.func.now(),
+        ).where(
+            busy_nights.c.date >= today
+        ).group_by(
+            busy_nights.c.room_id,
+            busy_nights.c.date
+        )
+        await db.execute(sa.insert(models.RoomInventory).from_select(
+            ['room_id', 'date', 'available', 'created_at', 'updated_at'], busy
+        ))
+        await db.commit()
+    except Exception as e:
+        logger.error(e)
+        await db.rollback()
+        raise e
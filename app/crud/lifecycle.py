@@ -0,0 +1,138 @@
+import logging
+from datetime import timedelta
+
+import sqlalchemy as sa
+from sqlalchemy.sql import operators
+
+from app import models
+from app.core.conf import settings
+from app.core.dependencies import get_db
+from app.models import enums
+from . import sms_outbox as crud_sms_outbox
+from . import stats as crud_stats
+
+logger = logging.getLogger(__name__)
+
+# key of the transaction level advisory lock taken by a run, only one worker moves the bookings at a time
+LIFECYCLE_LOCK_ID = 7_320_118
+
+
+async def _update_bookings(*where, **values) -> list[int]:
+    """Moves the matching bookings together with their booked rooms, returns the booking ids"""
+    db = get_db()
+    booking_ids = (await db.execute(
+        sa.update(models.Booking).where(*where).values(**values).returning(
+            models.Booking.id
+        ).execution_options(synchronize_session=False)
+    )).scalars().all()
+    if booking_ids:
+        await db.execute(sa.update(models.BookedRoom).where(
+            operators.in_op(models.BookedRoom.booking_id, booking_ids)
+        ).values(**values).execution_options(synchronize_session=False))
+    return booking_ids
+
+
+async def activate_bookings() -> list[int]:
+    """Check in the confirmed bookings whose ``booked_from`` has come"""
+    db = get_db()
+    booking_ids = await _update_bookings(
+        models.Booking.status == enums.BookingStatus.CONFIRMED,
+        models.Booking.booked_from <= sa.func.now(),
+        status=enums.BookingStatus.ACTIVE,
+    )
+    if booking_ids:
+        await db.execute(sa.update(models.PropertyRoom).where(
+            operators.in_op(models.PropertyRoom.id, sa.select(models.BookedRoom.property_room_id).where(
+                operators.in_op(models.BookedRoom.booking_id, booking_ids)
+            ).scalar_subquery())
+        ).values(status=enums.RoomStatus.BUSY).execution_options(synchronize_session=False))
+    return booking_ids
+
+
+async def close_bookings() -> list[int]:
+    """Check out the active bookings whose ``booked_to`` has passed and free their rooms"""
+    db = get_db()
+    booking_ids = await _update_bookings(
+        models.Booking.status == enums.BookingStatus.ACTIVE,
+        models.Booking.booked_to <= sa.func.now(),
+        status=enums.BookingStatus.CLOSED,
+    )
+    if not booking_ids:
+        return booking_ids
+
+    booked_rooms = sa.select(models.BookedRoom.id).where(
+        operators.in_op(models.BookedRoom.booking_id, booking_ids)
+    ).scalar_subquery()
+    today = settings.datetime.date()
+    await db.execute(sa.update(models.PropertyRoomStatus).where(
+        operators.in_op(models.PropertyRoomStatus.booked_room_id, booked_rooms),
+        models.PropertyRoomStatus.status_until > today
+    ).values(status_until=today).execution_options(synchronize_session=False))
+
+    # a room already taken by the next guest stays busy; the inventory is not touched,
+    # the nights of a stay that is over are all in the past
+    room = models.BookedRoom
+    next_guest = sa.exists().where(
+        room.property_room_id == models.PropertyRoom.id,
+        operators.in_op(room.status, [enums.BookingStatus.CONFIRMED, enums.BookingStatus.ACTIVE]),
+    )
+    await db.execute(sa.update(models.PropertyRoom).where(
+        operators.in_op(models.PropertyRoom.id, sa.select(room.property_room_id).where(
+            operators.in_op(room.booking_id, booking_ids)
+        ).scalar_subquery()),
+        ~next_guest
+    ).values(status=enums.RoomStatus.EMPTY).execution_options(synchronize_session=False))
+    return booking_ids
+
+
+async def expire_bookings() -> list[int]:
+    """
+    Cancel the pending bookings not accepted within ``BOOKING_PENDING_HOLD`` or by the end of the check-in day,
+    and tell their guests the way a merchant's cancellation does.
+    ``booked_from`` is the midnight of that day, a same-day booking stays pending until the day is over.
+    """
+    db = get_db()
+    booking_ids = await _update_bookings(
+        models.Booking.status == enums.BookingStatus.PENDING,
+        sa.or_(
+            models.Booking.created_at <= sa.func.now() - timedelta(seconds=settings.BOOKING_PENDING_HOLD),
+            crud_stats.local_date(models.Booking.booked_from) < crud_stats.local_date(sa.func.now()),
+        ),
+        status=enums.BookingStatus.CANCELED,
+        canceled_by=enums.BookingCanceledBy.SYSTEM,
+        reason_of_cancellation='Expired',
+    )
+    if booking_ids:
+        guests = (await db.execute(sa.select(models.Booking.id, models.User).join(
+            models.User, models.User.id == models.Booking.user_id
+        ).where(
+            operators.in_op(models.Booking.id, booking_ids)
+        ))).all()
+        for booking_id, user in guests:
+            await crud_sms_outbox.enqueue_order_sms(user, booking_id, is_accept=False)
+    return booking_ids
+
+
+async def run_lifecycle() -> dict[str, int] | None:
+    """
+    Moves the bookings whose time has come in one transaction: expires the pending ones,
+    then checks in and checks out. Returns the number of bookings of every step,
+    or None when another worker is running at the moment.
+    """
+    db = get_db()
+    try:
+        if not (await db.execute(sa.select(sa.func.pg_try_advisory_xact_lock(LIFECYCLE_LOCK_ID)))).scalar():
+            await db.rollback()
+            return None
+        moved = dict(
+            expired=await expire_bookings(),
+            activated=await activate_bookings(),
+            closed=await close_bookings(),
+        )
+        await crud_stats.refresh_booking_stats(*{booking_id for ids in moved.values() for booking_id in ids})
+        await db.commit()
+    except Exception as e:
+        logger.error(e)
+        await db.rollback()
+        raise e
+    return {step: len(ids) for step, ids in moved.items()}
@@ -0,0 +1,194 @@
+import math
+from dataclasses import dataclass
+from datetime import date
+
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB, aggregate_order_by
+from sqlalchemy.sql import operators
+
+from app import models
+from app.core.conf import settings
+from app.core.dependencies import get_db
+from app.models import enums
+from . import inventory as crud_inventory
+
+
+@dataclass
+class RoomPrice:
+    room_id: int
+    number_of_people: int
+    for_resident: bool
+    nightly: list[float]
+    discount: float
+
+    @property
+    def nights(self) -> int:
+        return len(self.nightly)
+
+    @property
+    def total(self) -> float:
+        return sum(self.nightly)
+
+    @property
+    def price(self) -> float:
+        """Average price of one night"""
+        return self.total / self.nights
+
+
+def _occupancy_options(for_resident):
+    """
+    The full room and the active ``price_for_less_people`` entries of a template as one JSONB array,
+    the full room carries the template discount window, the other entries are discounted every night
+    """
+    template = models.PropertyRoomTemplate
+
+    def options(unit, amount, from_, until, less_people):
+        full = sa.func.jsonb_build_object(
+            'number_of_people', template.max_number_of_guests,
+            'discount_unit', sa.case(
+                (unit == enums.BillingUnit.FIXED_VALUE, enums.BillingUnit.FIXED_VALUE.value),
+                else_=enums.BillingUnit.PERCENTAGE_VALUE.value
+            ),
+            'discount_amount', sa.func.coalesce(amount, 0),
+            'discount_from', from_,
+            'discount_until', until,
+            'is_active', True,
+        )
+        return sa.func.jsonb_build_array(full).op('||')(
+            sa.func.coalesce(sa.cast(less_people, JSONB), sa.cast(sa.literal('[]'), JSONB))
+        )
+
+    return sa.case(
+        (for_resident, options(
+            template.price_for_resident_discount_unit,
+            template.price_for_resident_discount_amount,
+            template.price_for_resident_discount_from,
+            template.price_for_resident_discount_until,
+            template.price_for_resident_less_people,
+        )),
+        else_=options(
+            template.price_discount_unit,
+            template.price_discount_amount,
+            template.price_discount_from,
+            template.price_discount_until,
+            template.price_for_less_people,
+        )
+    )
+
+
+def nightly_rates(nights: list[date], *columns):
+    """
+    Effective price of every template x occupancy x resident flag x night in ``nights``, one row each.
+
+    The row columns ``room_id``, ``number_of_people``, ``for_resident``, ``night``, ``price`` and ``discount``
+    are built from ``PropertyRoomTemplate`` in the same FROM, so callers filter and correlate on the template itself.
+    """
+    template = models.PropertyRoomTemplate
+    resident = sa.values(
+        sa.column('for_resident', sa.Boolean), name='resident', literal_binds=True
+    ).data([(False,), (True,)])
+    option = sa.func.jsonb_array_elements(
+        _occupancy_options(resident.c.for_resident)
+    ).table_valued(sa.column('value', JSONB)).lateral('option')
+    night = sa.func.unnest(sa.cast(nights, ARRAY(sa.Date))).table_valued('night').alias('night')
+
+    option_ = option.c.value
+    price = sa.case((resident.c.for_resident, template.price_for_resident), else_=template.price)
+    discount_from = option_['discount_from'].astext.cast(sa.DateTime(timezone=True))
+    discount_until = option_['discount_until'].astext.cast(sa.DateTime(timezone=True))
+    discount_amount = option_['discount_amount'].astext.cast(sa.Float)
+
+    def local_date(value):
+        return sa.cast(sa.func.timezone(settings.TIMEZONE, value), sa.Date)
+
+    discount = sa.case(
+        (
+            sa.or_(
+                operators.is_(discount_from, None),
+                sa.and_(local_date(discount_from) <= night.c.night, night.c.night <= local_date(discount_until))
+            ),
+            sa.case(
+                (option_['discount_unit'].astext == enums.BillingUnit.FIXED_VALUE.value, discount_amount),
+                else_=price * discount_amount / 100
+            )
+        ),
+        else_=0
+    )
+    return sa.select(
+        template.id.label('room_id'),
+        option_['number_of_people'].astext.cast(sa.Integer).label('number_of_people'),
+        resident.c.for_resident,
+        night.c.night,
+        (price - discount).label('price'),
+        discount.label('discount'),
+        *columns
+    ).select_from(
+        template
+    ).join(
+        resident, sa.true()
+    ).join(
+        option, sa.true()
+    ).join(
+        night, sa.true()
+    ).where(
+        option_['is_active'].astext.cast(sa.Boolean)
+    )
+
+
+async def get_room_prices(
+        rooms: list[tuple[int, int, bool]], checkin: date, checkout: date, property_id: int = None
+) -> dict[tuple[int, int, bool], RoomPrice]:
+    """
+    Prices of a stay for every ``(room_id, number_of_people, for_resident)`` of ``rooms``, in one query.
+    Combinations the template does not offer, or templates of another property than ``property_id``,
+    are missing from the result.
+    """
+    if not rooms:
+        return {}
+    db = get_db()
+    rates = nightly_rates(crud_inventory.stay_nights(checkin, checkout)).where(
+        operators.in_op(models.PropertyRoomTemplate.id, list({room_id for room_id, _, _ in rooms}))
+    )
+    if property_id is not None:
+        rates = rates.where(models.PropertyRoomTemplate.property_id == property_id)
+    rates = rates.subquery()
+    query = sa.select(
+        rates.c.room_id,
+        rates.c.number_of_people,
+        rates.c.for_resident,
+        sa.func.array_agg(aggregate_order_by(rates.c.price, rates.c.night)),
+        sa.func.sum(rates.c.discount),
+    ).where(
+        sa.tuple_(rates.c.room_id, rates.c.number_of_people, rates.c.for_resident).in_(list(set(rooms)))
+    ).group_by(
+        rates.c.room_id, rates.c.number_of_people, rates.c.for_resident
+    )
+    return {
+        (room_id, number_of_people, for_resident): RoomPrice(
+            room_id, number_of_people, for_resident, nightly=list(nightly), discount=discount or 0
+        )
+        for room_id, number_of_people, for_resident, nightly, discount in (await db.execute(query)).all()
+    }
+
+
+def stay_price(checkin: date, checkout: date, adults: int = 1, rooms: int = 1, for_resident: bool = False):
+    """
+    LATERAL subquery with the cheapest average nightly ``price`` of a free template of the correlated
+    ``PropertySearchIndex`` row, for an occupancy that fits ``adults`` spread over ``rooms``
+    """
+    template = models.PropertyRoomTemplate
+    rates = nightly_rates(crud_inventory.stay_nights(checkin, checkout))
+    occupancy = math.ceil((adults or 1) / (rooms or 1))
+    return rates.with_only_columns(
+        sa.func.avg(rates.selected_columns.price).label('price')
+    ).where(
+        template.property_id == models.PropertySearchIndex.property_id,
+        operators.is_(template.is_deleted, False),
+        crud_inventory.has_free_rooms(checkin, checkout, rooms or 1),
+        rates.selected_columns.for_resident == for_resident,
+        rates.selected_columns.number_of_people >= occupancy,
+    ).group_by(
+        template.id, rates.selected_columns.number_of_people
+    ).order_by(
+        sa.func.avg(rates.selected_columns.price)
+    ).limit(1).lateral('stay')
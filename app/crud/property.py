@@ -4,6 +4,7 @@ from datetime import datetime
 from typing import List
 
 import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import contains_eager, selectinload
@@ -12,8 +13,14 @@ from sqlalchemy.sql import operators
 
 from app import models
 from app import schemas
+from app.core.conf import settings
 from app.core.dependencies import get_db
 from app.models import enums
+from app.utils.search_cache import PropertySearchCache
+from app.utils.text_search import fuzzy_match, fuzzy_rank
+from . import inventory as crud_inventory
+from . import pricing as crud_pricing
+from . import search_index as crud_search_index
 
 logger = logging.getLogger(__name__)
 
@@ -56,6 +63,7 @@ async def create_property(added_by_id: int, property_in: schemas.PropertyCreate)
             models.PropertyLanguage(property_id=property_instance.id, language_id=language)
             for language in property_in.languages
         ])
+        await crud_search_index.refresh_search_index(property_instance.id)
 
         await db.commit()
 
@@ -163,8 +171,10 @@ async def create_room_template_one_object(property_id: int, room: schemas.RoomTe
             models.RoomService(room_id=room_instance.id, service_id=service)
             for service in room.services
         ])
+        await crud_search_index.refresh_search_index(property_id)
         await db.commit()
         await db.refresh(room_instance)
+        await invalidate_property_search(property_id)
         return room_instance
     except Exception as e:
         logger.error(e)
@@ -186,6 +196,15 @@ def get_all_merchant_properties(added_by_id: int):
     return query
 
 
+async def get_merchant_property_ids(added_by_id: int, property_ids: list[int] = None) -> list[int]:
+    """Ids of the merchant's properties, of the given ones only when ``property_ids`` is passed"""
+    db = get_db()
+    query = sa.select(models.Property.id).where(models.Property.added_by_id == added_by_id)
+    if property_ids is not None:
+        query = query.where(operators.in_op(models.Property.id, property_ids))
+    return (await db.execute(query.order_by(models.Property.id))).scalars().all()
+
+
 async def update_property_priority(added_by_id: int, property_id: int):
     db = get_db()
     dashboard = (
@@ -223,20 +242,10 @@ async def property_get_by_id(property_id: int, checkin: datetime, checkout: date
     db = get_db()
     query = sa.select(models.Property)
 
-    subquery = sa.select(models.PropertyRoomStatus.property_room_id).where(
-        models.PropertyRoomStatus.status_from >= checkin.date(),
-        models.PropertyRoomStatus.status_until <= checkout.date(),
-    ).where(
-        models.PropertyRoomStatus.property_room_id != None
-    )
-
     query = query.join(
         models.PropertyRoomTemplate, models.Property.id == models.PropertyRoomTemplate.property_id
-    ).join(
-        models.PropertyRoom,
-        models.PropertyRoomTemplate.id == models.PropertyRoom.room_id
     ).where(
-        ~operators.in_op(models.PropertyRoom.id, subquery)
+        crud_inventory.has_free_rooms(checkin.date(), checkout.date())
     ).where(
         models.Property.id == property_id,
         models.Property.is_active == enums.PropertyStatus.ACTIVE,
@@ -266,143 +275,288 @@ async def get_properties_by_criteria(
         is_resident: bool,
         children: int,
         ratings: List[int],
+        latitude: float = None,
+        longitude: float = None,
+        radius: float = None,
+        bbox: tuple[float, float, float, float] = None,
         page: int = 1,
         per_page: int = 10
 ):
-    db = get_db()
-    query = sa.select(models.Property)
+    filters = dict(
+        q=q,
+        breakfast=breakfast,
+        property_type=property_type,
+        star_rating=star_rating,
+        city=city,
+        city_centre_distance=city_centre_distance,
+        services=services,
+        price_gte=price_gte,
+        price_lte=price_lte,
+        checkin=checkin,
+        checkout=checkout,
+        rooms=rooms,
+        adults=adults,
+        is_resident=is_resident,
+        children=children,
+        ratings=ratings,
+        latitude=latitude,
+        longitude=longitude,
+        radius=radius,
+        bbox=bbox,
+    )
+    cache_key = PropertySearchCache.make_key(
+        sort_by=sort_by, sort_type=sort_type, page=page, per_page=per_page, **filters
+    )
+    if cached := await PropertySearchCache.get_result(cache_key):
+        property_ids, total = cached
+    else:
+        db = get_db()
+        query = get_properties_query(**filters)
+
+        total = (await db.execute(sa.select(sa.func.count()).select_from(query.subquery()))).scalar_one()
+
+        origin = search_origin(latitude, longitude, bbox)
+        query = filter_by_sort_type(query, sort_type, sort_by, origin=origin, q=q)
+        property_ids = (
+            await db.execute(query.offset((page - 1) * per_page).limit(per_page))
+        ).scalars().all()
+        await PropertySearchCache.set_result(cache_key, property_ids, total, city=city)
+
+    return await get_property_cards(property_ids, rooms), total
+
+
+def get_properties_query(
+        q: str,
+        breakfast: bool,
+        property_type: List[int],
+        star_rating: List[enums.PropertyStarRating],
+        city: str,
+        city_centre_distance: List[enums.CityCentreDistance],
+        services: List[int],
+
+        price_gte: int,
+        price_lte: int,
+        checkin: datetime,
+        checkout: datetime,
+        rooms: int,
+        adults: int,
+        is_resident: bool,
+        children: int,
+        ratings: List[int],
+        latitude: float = None,
+        longitude: float = None,
+        radius: float = None,
+        bbox: tuple[float, float, float, float] = None,
+):
+    """Ids of the properties matching the search filters, read from ``PropertySearchIndex``"""
+    index = models.PropertySearchIndex
+    query = sa.select(index.property_id).where(
+        index.is_active == enums.PropertyStatus.ACTIVE
+    )
     if q:
         query = query.where(
-            operators.ilike_op(models.Property.name, f"%{q}%")
+            fuzzy_match(index.search_text, q)
         )
     if property_type:
         query = query.where(
-            operators.in_op(models.Property.type_id, property_type)
+            operators.in_op(index.type_id, property_type)
         )
     if city:
-        subquery = sa.select(models.Property.id).join(
-            models.City, models.City.id == models.Property.city_id
-        ).where(
-            models.City.name_slug == city
-        )
         query = query.where(
-            operators.in_op(models.Property.id, subquery)
+            index.city_slug == city
         )
     if services:
-        subquery = sa.select(models.PropertyService.property_id).where(
-            operators.in_op(models.PropertyService.service_id, services)
-        )
         query = query.where(
-            operators.in_op(models.Property.id, subquery)
+            index.service_ids.overlap(sa.cast(services, ARRAY(sa.Integer)))
         )
     if star_rating:
         query = query.where(
-            models.Property.star_rating.in_([r.value for r in star_rating])
+            index.star_rating.in_([r.value for r in star_rating])
         )
     if breakfast:
         query = query.where(
-            models.Property.is_breakfast_served == True
+            index.is_breakfast_served == True
         )
     if ratings:
         ratings.sort()
         max_rating = [6, 9, 10][len(ratings) - 1] if len(ratings) >= 3 else 10
-        subquery = sa.select(models.PropertyRating.property_id).where(
-            operators.between_op(models.PropertyRating.avg, 0, max_rating)
-        )
         query = query.where(
-            operators.in_op(models.Property.id, subquery)
+            operators.between_op(index.rating, 0, max_rating)
         )
-
     if rooms:
-        subquery = sa.select(
-            models.PropertyRoomTemplate.property_id
-        ).where(
-            models.PropertyRoomTemplate.number_of_rooms >= rooms,
-            models.PropertyRoomTemplate.is_deleted == False
-        ).join(
-            models.PropertyRoom,
-            models.PropertyRoomTemplate.id == models.PropertyRoom.room_id
-        ).group_by(
-            models.PropertyRoomTemplate.property_id
-        )
-
         query = query.where(
-            operators.in_op(models.Property.id, subquery)
+            index.max_number_of_rooms >= rooms
         )
-
     if adults:
-        subquery = sa.select(models.PropertyRoomTemplate.property_id).where(
-            models.PropertyRoomTemplate.max_number_of_guests >= adults
-        ).group_by(
-            models.PropertyRoomTemplate.property_id
-        )
-
         query = query.where(
-            operators.in_op(models.Property.id, subquery)
+            index.max_number_of_guests >= adults
         )
-
-    if is_resident:
-        # TODO: add filtering by residency status
-        pass
-
     if children:
-        subquery = sa.select(models.PropertyRoomTemplate.property_id).where(
-            models.PropertyRoomTemplate.max_number_of_children >= children
-        ).group_by(
-            models.PropertyRoomTemplate.property_id
-        )
-
         query = query.where(
-            operators.in_op(models.Property.id, subquery)
-        )
-
-    if sort_by.RATING:
-        query = query.outerjoin(
-            models.PropertyRating, models.PropertyRating.property_id == models.Property.id, full=True
+            index.max_number_of_children >= children
         )
 
-    subquery = sa.select(models.PropertyRoomStatus.property_room_id).where(
-        models.PropertyRoomStatus.status_from >= checkin.date(),
-        models.PropertyRoomStatus.status_until <= checkout.date(),
-    ).where(
-        models.PropertyRoomStatus.property_room_id != None
-    )
-
-    query = query.join(
-        models.PropertyRoomTemplate,
-        models.PropertyRoomTemplate.property_id == models.Property.id
+    # priced for the stay and the occupancy, a property without a free template that fits gets no row
+    stay = crud_pricing.stay_price(checkin.date(), checkout.date(), adults, rooms, is_resident)
+    query = query.add_columns(
+        stay.c.price.label('stay_price')
     ).join(
-        models.PropertyRoom, models.PropertyRoom.room_id == models.PropertyRoomTemplate.id
-    ).where(
-        ~operators.in_op(models.PropertyRoom.id, subquery)
-    ).where(
-        models.Property.is_active == enums.PropertyStatus.ACTIVE
+        stay, sa.true()
     ).where(
-        operators.between_op(models.PropertyRoomTemplate.price, price_gte, price_lte)
-    ).where(
-        models.PropertyRoomTemplate.is_deleted == False
+        operators.between_op(stay.c.price, price_gte, price_lte)
     )
 
-    query = filter_by_sort_type(query, sort_type, sort_by, is_resident)
-    query = filter_by_city_distance(query, city_centre_distance)
+    query = filter_by_location(query, latitude, longitude, radius, bbox)
+    return filter_by_city_distance(query, city_centre_distance)
 
-    results: List[schemas.Property] = (await db.execute(query)).scalars().unique().all()
-    return multiple_(paginate(results, page, per_page, rooms), rooms), len(results)
 
+async def get_property_facets(**filters) -> dict:
+    """
+    Counts per star rating, type, service, breakfast flag and city centre distance of the properties
+    matching ``filters`` (arguments of :func:`get_properties_query`), in one query
+    """
+    cache_key = PropertySearchCache.make_key(facets=True, **filters)
+    if cached := await PropertySearchCache.get_facets(cache_key):
+        return cached
 
-def paginate(results, page, per_page, rooms: int = 1):
-    skip = (page - 1) * per_page
-    return multiple_(results[skip: skip + per_page], rooms)
+    db = get_db()
+    index = models.PropertySearchIndex
+    distance = index.city_centre_distance
+    # same buckets as filter_by_city_distance
+    distance_bucket = sa.case(
+        (sa.and_(distance >= 1, distance <= 3), enums.CityCentreDistance.ONE_THREE.value),
+        (sa.and_(distance >= 4, distance <= 6), enums.CityCentreDistance.FOUR_SIX.value),
+        (distance >= 7, enums.CityCentreDistance.SEVEN_PLUS.value),
+    )
+    matched = get_properties_query(**filters).with_only_columns(
+        index.star_rating,
+        index.type_id,
+        index.service_ids,
+        index.is_breakfast_served,
+        distance_bucket.label('distance_bucket'),
+    ).cte('matched')
+    service = sa.func.unnest(matched.c.service_ids).table_valued('service_id').render_derived(name='service').lateral()
+
+    def facet(name: str, value, from_=matched):
+        return sa.select(
+            sa.literal(name).label('facet'),
+            sa.cast(value, sa.String).label('value'),
+            sa.func.count().label('count')
+        ).select_from(from_).where(operators.isnot(value, None)).group_by(value)
+
+    query = sa.union_all(
+        sa.select(sa.literal('total'), sa.cast(sa.null(), sa.String), sa.func.count()).select_from(matched),
+        facet('star_rating', matched.c.star_rating),
+        facet('type', matched.c.type_id),
+        facet('service', service.c.service_id, from_=matched.join(service, sa.true())),
+        facet('breakfast', matched.c.is_breakfast_served),
+        facet('city_centre_distance', matched.c.distance_bucket),
+    )
 
+    facets = dict(total=0, star_rating={}, type={}, service={}, breakfast={}, city_centre_distance={})
+    for name, value, count in (await db.execute(query)).all():
+        if name == 'total':
+            facets['total'] = count
+        elif name == 'star_rating':
+            facets[name][enums.PropertyStarRating[value].value] = count
+        else:
+            facets[name][value] = count
 
-def multiple_(results, rooms: int = 1):
-    results_ = []
-    for result in results:
-        result: schemas.Property.from_orm(result)
-        result.minimum_price_per_night = result.minimum_price_per_night * rooms
-        result.minimum_price_per_night_for_resident = result.minimum_price_per_night_for_resident * rooms
-        results_.append(result)
-    return results_
+    await PropertySearchCache.set_facets(cache_key, facets, city=filters.get('city'))
+    return facets
+
+
+async def get_property_cards(property_ids: List[int], rooms: int = 1) -> List[dict]:
+    """
+    List cards of ``schemas.PropertyCard`` in the order of ``property_ids``, loaded with two queries
+    instead of the full ``Property`` graph. Prices are for ``rooms`` rooms.
+    """
+    if not property_ids:
+        return []
+    db = get_db()
+    index = models.PropertySearchIndex
+    photo = sa.select(models.DocFile.path).join(
+        models.PropertyPhoto, models.PropertyPhoto.photo_id == models.DocFile.id
+    ).where(
+        models.PropertyPhoto.property_id == models.Property.id
+    ).order_by(
+        models.PropertyPhoto.is_default.desc(), models.PropertyPhoto.id
+    ).limit(1).scalar_subquery()
+
+    query = sa.select(
+        models.Property.id,
+        models.Property.name,
+        models.Property.star_rating,
+        models.PropertyTypeTranslation.localized(
+            models.PropertyTypeTranslation.type,
+            models.PropertyTypeTranslation.property_type_id == models.PropertyType.id,
+            models.PropertyType.type
+        ).label('type'),
+        models.CityTranslation.localized(
+            models.CityTranslation.name, models.CityTranslation.city_id == models.City.id, models.City.name
+        ).label('city'),
+        models.City.name_slug.label('city_slug'),
+        photo.label('photo'),
+        sa.func.coalesce(index.min_price, models.Property.minimum_price_per_night).label('min_price'),
+        sa.func.coalesce(
+            index.min_price_for_resident, models.Property.minimum_price_per_night_for_resident
+        ).label('min_price_for_resident'),
+        models.PropertyRating.avg.label('rating'),
+    ).join(
+        models.PropertyType, models.PropertyType.id == models.Property.type_id
+    ).outerjoin(
+        models.City, models.City.id == models.Property.city_id
+    ).outerjoin(
+        index, index.property_id == models.Property.id
+    ).outerjoin(
+        models.PropertyRating, models.PropertyRating.property_id == models.Property.id
+    ).where(
+        operators.in_op(models.Property.id, property_ids)
+    )
+    cards = {row['id']: dict(row) for row in (await db.execute(query)).mappings().all()}
+
+    service_order = sa.func.row_number().over(
+        partition_by=models.PropertyService.property_id, order_by=models.PropertyService.id
+    ).label('n')
+    services = sa.select(
+        models.PropertyService.property_id,
+        models.ServiceTranslation.localized(
+            models.ServiceTranslation.service_name,
+            models.ServiceTranslation.service_id == models.Service.id,
+            models.Service.service_name
+        ).label('name'),
+        service_order,
+    ).join(
+        models.Service, models.Service.id == models.PropertyService.service_id
+    ).where(
+        operators.in_op(models.PropertyService.property_id, property_ids)
+    ).subquery()
+    services = sa.select(services.c.property_id, services.c.name).where(
+        services.c.n <= settings.PROPERTY_CARD_SERVICES
+    ).order_by(services.c.property_id, services.c.n)
+
+    for card in cards.values():
+        card['services'] = []
+        card['photo'] = card['photo'] and models.DocFile.url_for(card['photo'])
+        for price in ('min_price', 'min_price_for_resident'):
+            if card[price] is not None:
+                card[price] *= rooms
+    for property_id, name in (await db.execute(services)).all():
+        cards[property_id]['services'].append(name)
+
+    return [cards[property_id] for property_id in property_ids if property_id in cards]
+
+
+async def invalidate_property_search(property_id: int, *cities: str):
+    """Drop cached searches the property may affect, its current city is looked up when not given"""
+    if not cities:
+        db = get_db()
+        cities = (await db.execute(
+            sa.select(models.City.name_slug).join(
+                models.Property, models.Property.city_id == models.City.id
+            ).where(models.Property.id == property_id)
+        )).scalars().all()
+    await PropertySearchCache.invalidate(*cities, property_id=property_id)
 
 
 def get_property_types():
@@ -410,35 +564,77 @@ def get_property_types():
     return query
 
 
+def filter_by_location(query, latitude: float = None, longitude: float = None, radius: float = None,
+                       bbox: tuple[float, float, float, float] = None):
+    """
+    ``bbox`` is ``(min_longitude, min_latitude, max_longitude, max_latitude)``, ``radius`` is in km around
+    ``latitude``/``longitude``. Both are answered by the indexes of ``PropertySearchIndex``.
+    """
+    index = models.PropertySearchIndex
+    if bbox:
+        min_longitude, min_latitude, max_longitude, max_latitude = bbox
+        query = query.where(
+            operators.between_op(index.latitude, min_latitude, max_latitude),
+            operators.between_op(index.longitude, min_longitude, max_longitude),
+        )
+    if radius and latitude is not None and longitude is not None:
+        origin = crud_search_index.earth_point(latitude, longitude)
+        location = crud_search_index.property_location()
+        query = query.where(
+            # earth_box() uses the GiST index, it is a cube around the circle so the exact distance is checked too
+            sa.func.earth_box(origin, radius * 1000).op('@>')(location),
+            sa.func.earth_distance(origin, location) <= radius * 1000,
+        )
+    return query
+
+
+def search_origin(latitude: float = None, longitude: float = None,
+                  bbox: tuple[float, float, float, float] = None) -> tuple[float, float] | None:
+    if latitude is not None and longitude is not None:
+        return latitude, longitude
+    if bbox:
+        min_longitude, min_latitude, max_longitude, max_latitude = bbox
+        return (min_latitude + max_latitude) / 2, (min_longitude + max_longitude) / 2
+    return None
+
+
 def filter_by_city_distance(query, city_centre_distance):
+    distance = models.PropertySearchIndex.city_centre_distance
     if city_centre_distance:
         if city_centre_distance == enums.CityCentreDistance.ONE_THREE:
-            query = query.where(
-                models.Property.city_centre_distance >= 1, models.Property.city_centre_distance <= 3
-            )
+            query = query.where(distance >= 1, distance <= 3)
         elif city_centre_distance == enums.CityCentreDistance.FOUR_SIX:
-            query = query.where(
-                models.Property.city_centre_distance >= 4, models.Property.city_centre_distance <= 6
-            )
+            query = query.where(distance >= 4, distance <= 6)
         else:
-            query = query.where(
-                models.Property.city_centre_distance >= 7
-            )
+            query = query.where(distance >= 7)
     return query
 
 
-def filter_by_sort_type(query, sort_type, sort_by, is_resident: bool = False):
+def filter_by_sort_type(query, sort_type, sort_by, origin: tuple[float, float] | None = None, q: str = None):
+    index = models.PropertySearchIndex
     sort_type_ = desc if sort_type == enums.SortType.DESC else asc
     if sort_by:
-        if sort_by == enums.PropertySortBy.NEWEST:
-            query = query.order_by(sort_type_(models.Property.id))
+        if sort_by == enums.PropertySortBy.RELEVANCE:
+            # the matches below come first, with nothing to match the best rated properties do
+            if not q:
+                query = query.order_by(desc(index.rating).nulls_last())
+        elif sort_by == enums.PropertySortBy.NEWEST:
+            query = query.order_by(sort_type_(index.property_id))
         elif sort_by == enums.PropertySortBy.PRICE:
-            if is_resident:
-                query = query.order_by(sort_type_(models.Property.minimum_price_per_night_for_resident))
-            query = query.order_by(sort_type_(models.Property.minimum_price_per_night))
+            query = query.order_by(sort_type_(query.selected_columns.stay_price).nulls_last())
         elif sort_by == enums.PropertySortBy.DISCOUNT:
-            query = query.order_by(sort_type_(models.PropertyRoomTemplate.price_has_discount))
-    return query
+            query = query.order_by(sort_type_(index.has_discount))
+        elif sort_by == enums.PropertySortBy.RATING:
+            query = query.order_by(sort_type_(index.rating).nulls_last())
+        elif sort_by == enums.PropertySortBy.DISTANCE and origin:
+            query = query.order_by(sort_type_(
+                sa.func.earth_distance(crud_search_index.earth_point(*origin), crud_search_index.property_location())
+            ))
+    if q:
+        # best name matches first, then matches in descriptions and addresses
+        query = query.order_by(desc(fuzzy_rank(index.name, q)), desc(fuzzy_rank(index.search_text, q)))
+    # stable order for LIMIT/OFFSET
+    return query.order_by(index.property_id)
 
 
 async def create_property_room_type(db: AsyncSession, type_: str):
@@ -567,7 +763,7 @@ async def get_property_settings(added_by_id: int, property_id: int) -> schemas.P
     query = sa.select(models.Property).where(
         models.Property.added_by_id == added_by_id,
         models.Property.id == property_id,
-    )
+    ).execution_options(all_translations=True, populate_existing=True)
     result = (await db.execute(query)).scalar_one_or_none()
 
     return result
@@ -578,6 +774,8 @@ async def update_property_settings(added_by_id: int, default_property_id: int,
     db = get_db()
     property_obj = await get_property_settings(added_by_id, default_property_id)
     if property_obj:
+        # the update below writes the new values onto property_obj
+        old_city_id, old_city = property_obj.city_id, property_obj.city.name_slug
         update_stmt = (sa.update(
             models.Property
         ).where(
@@ -603,7 +801,12 @@ async def update_property_settings(added_by_id: int, default_property_id: int,
 
         await db.execute(update_stmt, params)
         await db.execute(update_translation_stmt)
+        await crud_search_index.refresh_search_index(property_obj.id)
         await db.commit()
+        await invalidate_property_search(property_obj.id, old_city)
+        if property_in.city_id != old_city_id:
+            # the slug of the new city is looked up
+            await invalidate_property_search(property_obj.id)
         return True
     return False
 
@@ -692,9 +895,24 @@ async def create_or_update_room_status(room_id: int, obj_in: List[schemas.RoomSt
                     models.PropertyRoomStatus.status_from,
                     [x.status_from for x in obj_in if x.for_delete]
                 )
-            )
-            await db.execute(query)
+            ).returning(models.PropertyRoomStatus.status_from)
+            deleted_days = (await db.execute(query)).scalars().all()
             obj_in = [x for x in obj_in if not x.for_delete]
+
+            template_id, property_id = (await db.execute(
+                sa.select(models.PropertyRoom.room_id, models.PropertyRoomTemplate.property_id).join(
+                    models.PropertyRoomTemplate, models.PropertyRoomTemplate.id == models.PropertyRoom.room_id
+                ).where(models.PropertyRoom.id == room_id)
+            )).one()
+            changes = {}
+            for day in deleted_days:
+                changes[(template_id, day)] = changes.get((template_id, day), 0) + 1
+            for obj in obj_in:
+                changes[(template_id, obj.status_from)] = changes.get((template_id, obj.status_from), 0) - 1
+            if not await crud_inventory.update_inventory(changes):
+                await db.rollback()
+                return False
+
             await models.PropertyRoomStatus.bulk_create([
                 models.PropertyRoomStatus(
                     property_room_id=room_id,
@@ -705,6 +923,7 @@ async def create_or_update_room_status(room_id: int, obj_in: List[schemas.RoomSt
                 ) for obj in obj_in
             ])
             await db.commit()
+            await invalidate_property_search(property_id)
             return True
         return False
     except Exception as e:
@@ -719,7 +938,10 @@ async def update_property_room_template_rooms(
     db = get_db()
     try:
         if numbers:
-            await db.execute(sa.delete(models.PropertyRoom).where(models.PropertyRoom.room_id == room_id))
+            deleted = (await db.execute(
+                sa.delete(models.PropertyRoom).where(models.PropertyRoom.room_id == room_id)
+            )).rowcount
+            await crud_inventory.resize_room(room_id, len(numbers) - deleted)
             rooms = await models.PropertyRoom.bulk_create([
                 models.PropertyRoom(room_id=room_id, name=n)
                 for n in numbers
@@ -762,7 +984,9 @@ async def update_property_room_template(room_id: int, obj_in: schemas.RoomTempla
             await create_room_bed(room_id=room.id, beds_in=obj_in.beds)
             await update_property_room_template_rooms(room_id=room.id, numbers=obj_in.numbers)
             await create_room_photos(room_id=room.id, photos=obj_in.photos)
+            await crud_search_index.refresh_search_index(room.property_id)
             await db.commit()
+            await invalidate_property_search(room.property_id)
             return True
         return False
     except Exception as e:
@@ -782,6 +1006,8 @@ async def delete_property_room_template(room_id: int):
     ).scalar_one_or_none()
     if room:
         room.is_deleted = True
+        await crud_search_index.refresh_search_index(room.property_id)
         await db.commit()
+        await invalidate_property_search(room.property_id)
         return True
     return False
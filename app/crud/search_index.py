@@ -0,0 +1,154 @@
+import logging
+
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from sqlalchemy.sql import operators
+
+from app import models
+from app.core.dependencies import get_db
+from app.models import enums
+from . import inventory as crud_inventory
+
+logger = logging.getLogger(__name__)
+
+
+def effective_price(for_resident: bool = False):
+    """SQL counterpart of ``crud.booking.calculate_price`` for a full room, discount applied if it is running"""
+    template = models.PropertyRoomTemplate
+    if for_resident:
+        price = template.price_for_resident
+        discount_from = template.price_for_resident_discount_from
+        discount_until = template.price_for_resident_discount_until
+        discount_unit = template.price_for_resident_discount_unit
+        discount_amount = template.price_for_resident_discount_amount
+    else:
+        price = template.price
+        discount_from = template.price_discount_from
+        discount_until = template.price_discount_until
+        discount_unit = template.price_discount_unit
+        discount_amount = template.price_discount_amount
+
+    now = sa.func.now()
+    discount = sa.case(
+        (discount_unit == enums.BillingUnit.FIXED_VALUE, discount_amount),
+        else_=price * discount_amount / 100
+    )
+    is_running = sa.or_(
+        operators.is_(discount_from, None),
+        sa.and_(discount_from <= now, now <= discount_until)
+    )
+    return price - sa.case((is_running, discount), else_=0)
+
+
+def earth_point(latitude, longitude):
+    """Point of the ``earthdistance`` extension, distances between them are in metres"""
+    return sa.func.ll_to_earth(latitude, longitude)
+
+
+def property_location():
+    return earth_point(models.PropertySearchIndex.latitude, models.PropertySearchIndex.longitude)
+
+
+def refresh_search_index_query(property_ids: list[int] = None):
+    """Upsert of ``PropertySearchIndex`` rows for ``property_ids``, all properties when not given"""
+    templates = sa.select(
+        models.PropertyRoomTemplate.property_id,
+        sa.func.min(effective_price()).label('min_price'),
+        sa.func.min(effective_price(for_resident=True)).label('min_price_for_resident'),
+        sa.func.bool_or(models.PropertyRoomTemplate.price_has_discount).label('has_discount'),
+        sa.func.max(crud_inventory.total_rooms(models.PropertyRoomTemplate.id)).label('max_number_of_rooms'),
+        sa.func.max(models.PropertyRoomTemplate.max_number_of_guests).label('max_number_of_guests'),
+        sa.func.max(models.PropertyRoomTemplate.max_number_of_children).label('max_number_of_children'),
+    ).where(
+        operators.is_(models.PropertyRoomTemplate.is_deleted, False)
+    ).group_by(
+        models.PropertyRoomTemplate.property_id
+    )
+    services = sa.select(
+        models.PropertyService.property_id,
+        sa.func.array_agg(sa.distinct(models.PropertyService.service_id)).label('service_ids'),
+    ).where(
+        operators.isnot(models.PropertyService.service_id, None)
+    ).group_by(
+        models.PropertyService.property_id
+    )
+    translations = sa.select(
+        models.PropertyTranslation.property_id,
+        sa.func.string_agg(
+            sa.func.concat_ws(' ', models.PropertyTranslation.description, models.PropertyTranslation.address), ' '
+        ).label('text'),
+    ).group_by(
+        models.PropertyTranslation.property_id
+    )
+    if property_ids is not None:
+        templates = templates.where(operators.in_op(models.PropertyRoomTemplate.property_id, property_ids))
+        services = services.where(operators.in_op(models.PropertyService.property_id, property_ids))
+        translations = translations.where(operators.in_op(models.PropertyTranslation.property_id, property_ids))
+    templates = templates.subquery()
+    services = services.subquery()
+    translations = translations.subquery()
+
+    query = sa.select(
+        models.Property.id,
+        models.Property.name,
+        sa.func.concat_ws(' ', models.Property.name, translations.c.text),
+        models.City.name_slug,
+        models.Property.type_id,
+        models.Property.star_rating,
+        models.Property.is_active,
+        models.Property.is_breakfast_served,
+        models.Property.city_centre_distance,
+        models.Property.latitude,
+        models.Property.longitude,
+        templates.c.min_price,
+        templates.c.min_price_for_resident,
+        sa.func.coalesce(templates.c.has_discount, False),
+        sa.func.coalesce(templates.c.max_number_of_rooms, 0),
+        sa.func.coalesce(templates.c.max_number_of_guests, 0),
+        sa.func.coalesce(templates.c.max_number_of_children, 0),
+        models.PropertyRating.avg,
+        sa.func.coalesce(services.c.service_ids, sa.cast(sa.literal('{}'), ARRAY(sa.Integer))),
+        sa.func.now(),
+        sa.func.now(),
+    ).outerjoin(
+        models.City, models.City.id == models.Property.city_id
+    ).outerjoin(
+        templates, templates.c.property_id == models.Property.id
+    ).outerjoin(
+        services, services.c.property_id == models.Property.id
+    ).outerjoin(
+        translations, translations.c.property_id == models.Property.id
+    ).outerjoin(
+        models.PropertyRating, models.PropertyRating.property_id == models.Property.id
+    )
+    if property_ids is not None:
+        query = query.where(operators.in_op(models.Property.id, property_ids))
+
+    columns = [
+        'property_id', 'name', 'search_text', 'city_slug', 'type_id', 'star_rating', 'is_active', 'is_breakfast_served',
+        'city_centre_distance', 'latitude', 'longitude', 'min_price', 'min_price_for_resident', 'has_discount',
+        'max_number_of_rooms', 'max_number_of_guests', 'max_number_of_children', 'rating', 'service_ids', 'created_at',
+        'updated_at'
+    ]
+    stmt = insert(models.PropertySearchIndex).from_select(columns, query)
+    return stmt.on_conflict_do_update(
+        index_elements=[models.PropertySearchIndex.property_id],
+        set_={column: stmt.excluded[column] for column in columns if column not in ('property_id', 'created_at')}
+    )
+
+
+async def refresh_search_index(*property_ids: int):
+    """Recompute the search rows of the given properties within the current transaction"""
+    db = get_db()
+    await db.execute(refresh_search_index_query(list(property_ids)))
+
+
+async def rebuild_search_index():
+    db = get_db()
+    try:
+        await db.execute(refresh_search_index_query())
+        await db.commit()
+    except Exception as e:
+        logger.error(e)
+        await db.rollback()
+        raise e
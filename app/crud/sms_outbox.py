@@ -0,0 +1,46 @@
+from datetime import timedelta
+
+from sqlalchemy.dialects.postgresql import insert
+
+from app import models
+from app.core.conf import settings
+from app.core.dependencies import get_db
+from app.models import enums
+from app.utils.datetime import utcnow
+
+CODE_QUEUED_MESSAGE = 'Waiting for SMS provider'
+
+
+async def enqueue(
+        phone: str,
+        kind: enums.SmsKind,
+        language: enums.Languages = None,
+        params: dict = None,
+        dedupe_key: str = None,
+        expires_in: int = None,
+):
+    """Adds the message to the current transaction, the outbox worker sends it once committed"""
+    db = get_db()
+    await db.execute(insert(models.SmsOutbox).values(
+        phone=phone,
+        kind=kind,
+        language=language,
+        params=params or {},
+        dedupe_key=dedupe_key,
+        expires_at=utcnow() + timedelta(seconds=expires_in) if expires_in else None,
+    ).on_conflict_do_nothing(index_elements=[models.SmsOutbox.dedupe_key]))
+
+
+async def send_code(phone: str, code: str) -> str:
+    """Queues the confirmation code, returns the ``message`` of the response, the one Eskiz gives a queued SMS"""
+    db = get_db()
+    await enqueue(phone, enums.SmsKind.CODE, params=dict(code=code), expires_in=settings.CODE_LIFETIME)
+    await db.commit()
+    return CODE_QUEUED_MESSAGE
+
+
+async def enqueue_order_sms(user: models.User | None, booking_id: int, is_accept: bool = True):
+    if not user or not user.phone or settings.DEBUG or user.phone == settings.DEBUG_PHONE:
+        return
+    kind = enums.SmsKind.ORDER_ACCEPTED if is_accept else enums.SmsKind.ORDER_CANCELED
+    await enqueue(user.phone, kind, language=user.language, dedupe_key=f'{kind.value}:{booking_id}')
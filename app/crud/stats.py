@@ -0,0 +1,258 @@
+import logging
+from datetime import date, timedelta
+
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from sqlalchemy.sql import operators
+
+from app import models
+from app.core.conf import settings
+from app.core.dependencies import get_db
+from app.models import enums
+from . import inventory as crud_inventory
+
+logger = logging.getLogger(__name__)
+
+STATUS_COLUMNS = {
+    enums.BookingStatus.PENDING: 'pending',
+    enums.BookingStatus.CONFIRMED: 'confirmed',
+    enums.BookingStatus.ACTIVE: 'active',
+    enums.BookingStatus.CLOSED: 'closed',
+    enums.BookingStatus.CANCELED: 'canceled',
+}
+BOOKING_FIGURES = ['orders', *STATUS_COLUMNS.values(), 'revenue']
+FIGURES = [*BOOKING_FIGURES, 'fees']
+# day 0 of the advisory lock keys of the daily rows
+LOCK_EPOCH = date(2000, 1, 1)
+
+
+def _inline(value):
+    """Constant rendered into the SQL, so the expressions it is part of can be repeated in GROUP BY"""
+    return sa.bindparam(None, value, literal_execute=True)
+
+
+def local_date(column):
+    """Day of a timestamp in ``settings.TIMEZONE``"""
+    return sa.cast(sa.func.timezone(_inline(settings.TIMEZONE), column), sa.Date)
+
+
+def refresh_daily_stats_query(days):
+    """
+    Upsert of the ``PropertyDailyStats`` rows of ``days``, a select of distinct ``property_id`` and ``date`` pairs.
+    Every pair gets its row, with zeros for a day without bookings or fees.
+    """
+    days = days.cte('days')
+    booking = models.Booking
+    transaction = models.Transaction
+    booking_day = local_date(booking.created_at)
+    transaction_day = local_date(transaction.created_at)
+
+    bookings = sa.select(
+        booking.property_id,
+        booking_day.label('date'),
+        sa.func.count().label('orders'),
+        *(sa.func.count().filter(booking.status == status).label(name) for status, name in STATUS_COLUMNS.items()),
+        sa.func.sum(booking.total_price).filter(booking.status == enums.BookingStatus.CLOSED).label('revenue'),
+    ).where(
+        operators.in_op(booking.property_id, sa.select(days.c.property_id)),
+        sa.tuple_(booking.property_id, booking_day).in_(sa.select(days.c.property_id, days.c.date)),
+    ).group_by(
+        booking.property_id, booking_day
+    ).subquery()
+    fees = sa.select(
+        transaction.property_id,
+        transaction_day.label('date'),
+        sa.func.sum(transaction.amount).label('fees'),
+    ).where(
+        transaction.title == enums.TransactionTitle.FOR_SERVICE,
+        operators.in_op(transaction.property_id, sa.select(days.c.property_id)),
+        sa.tuple_(transaction.property_id, transaction_day).in_(sa.select(days.c.property_id, days.c.date)),
+    ).group_by(
+        transaction.property_id, transaction_day
+    ).subquery()
+
+    query = sa.select(
+        days.c.property_id,
+        days.c.date,
+        *(sa.func.coalesce(bookings.c[name], 0) for name in BOOKING_FIGURES),
+        sa.func.coalesce(fees.c.fees, 0),
+        sa.func.now(),
+        sa.func.now(),
+    ).select_from(
+        days
+    ).outerjoin(
+        bookings, sa.and_(bookings.c.property_id == days.c.property_id, bookings.c.date == days.c.date)
+    ).outerjoin(
+        fees, sa.and_(fees.c.property_id == days.c.property_id, fees.c.date == days.c.date)
+    )
+
+    columns = ['property_id', 'date', *FIGURES, 'created_at', 'updated_at']
+    stmt = insert(models.PropertyDailyStats).from_select(columns, query)
+    return stmt.on_conflict_do_update(
+        index_elements=[models.PropertyDailyStats.property_id, models.PropertyDailyStats.date],
+        set_={column: stmt.excluded[column] for column in [*FIGURES, 'updated_at']}
+    )
+
+
+def lock_days_query(days):
+    """
+    Takes the transaction level advisory lock of every ``property_id`` and ``date`` pair of ``days``, in one order
+    so that writers never deadlock. A writer recomputing the same day waits for the commit of the other one,
+    and its recompute, a later statement, sees the rows the other one wrote.
+    """
+    days = days.subquery()
+    return sa.select(
+        sa.func.pg_advisory_xact_lock(days.c.property_id, days.c.date - sa.cast(LOCK_EPOCH, sa.Date))
+    ).order_by(
+        days.c.property_id, days.c.date
+    )
+
+
+def booking_days(*booking_ids: int):
+    """Days the bookings were created on, and today for the fees just charged or refunded on them"""
+    booking = models.Booking
+    return sa.union(
+        sa.select(booking.property_id, local_date(booking.created_at).label('date')).where(
+            operators.in_op(booking.id, list(booking_ids))
+        ),
+        sa.select(booking.property_id, local_date(sa.func.now())).where(
+            operators.in_op(booking.id, list(booking_ids))
+        ),
+    )
+
+
+def all_days(property_id: int = None):
+    """Every day with a booking or a service fee, of one property or all of them"""
+    booking = models.Booking
+    transaction = models.Transaction
+    bookings = sa.select(booking.property_id, local_date(booking.created_at).label('date'))
+    fees = sa.select(transaction.property_id, local_date(transaction.created_at)).where(
+        transaction.title == enums.TransactionTitle.FOR_SERVICE,
+        operators.isnot(transaction.property_id, None),
+    )
+    if property_id is not None:
+        bookings = bookings.where(booking.property_id == property_id)
+        fees = fees.where(transaction.property_id == property_id)
+    return sa.union(bookings, fees)
+
+
+def bucket_start(day: date, bucket: enums.TimeBucket) -> date:
+    """Python counterpart of :func:`bucket_of`, weeks start on Monday"""
+    if bucket == enums.TimeBucket.WEEK:
+        return day - timedelta(days=day.weekday())
+    elif bucket == enums.TimeBucket.MONTH:
+        return day.replace(day=1)
+    return day
+
+
+def next_bucket(start: date, bucket: enums.TimeBucket) -> date:
+    if bucket == enums.TimeBucket.WEEK:
+        return start + timedelta(weeks=1)
+    elif bucket == enums.TimeBucket.MONTH:
+        return (start + timedelta(days=32)).replace(day=1)
+    return start + timedelta(days=1)
+
+
+def bucket_of(column, bucket: enums.TimeBucket):
+    """First day of the day, week or month of a date column"""
+    return sa.cast(sa.func.date_trunc(_inline(bucket.value), sa.cast(column, sa.DateTime)), sa.Date)
+
+
+def series_query(property_ids: list[int], date_from: date, date_to: date, bucket: enums.TimeBucket):
+    """
+    One row per bucket between the dates (both included): bookings, revenue and fees summed from the daily rows,
+    occupancy as the booked share of the room nights of the bucket days within the range. Rooms are the physical
+    rooms of the templates that are not deleted, the same capacity the inventory counts down from.
+    """
+    starts, nights = [], []
+    start = bucket_start(date_from, bucket)
+    while start <= date_to:
+        end = next_bucket(start, bucket)
+        starts.append(start)
+        nights.append((min(end, date_to + timedelta(days=1)) - max(start, date_from)).days)
+        start = end
+    spine = sa.func.unnest(
+        sa.cast(starts, ARRAY(sa.Date)), sa.cast(nights, ARRAY(sa.Integer))
+    ).table_valued('bucket', 'nights').render_derived(name='spine')
+
+    stats = models.PropertyDailyStats
+    figures = sa.select(
+        bucket_of(stats.date, bucket).label('bucket'),
+        sa.func.sum(stats.orders).label('bookings'),
+        sa.func.sum(stats.revenue).label('revenue'),
+        sa.func.sum(stats.fees).label('fees'),
+    ).where(
+        operators.in_op(stats.property_id, property_ids),
+        stats.date.between(date_from, date_to),
+    ).group_by(
+        bucket_of(stats.date, bucket)
+    ).subquery()
+
+    template = models.PropertyRoomTemplate
+    capacity = sa.select(
+        template.id.label('room_id'),
+        crud_inventory.total_rooms(template.id).label('rooms'),
+    ).where(
+        operators.in_op(template.property_id, property_ids),
+        operators.is_(template.is_deleted, False),
+    ).subquery()
+    inventory = models.RoomInventory
+    occupied = sa.select(
+        bucket_of(inventory.date, bucket).label('bucket'),
+        sa.func.sum(capacity.c.rooms - inventory.available).label('nights'),
+    ).join(
+        capacity, capacity.c.room_id == inventory.room_id
+    ).where(
+        inventory.date.between(date_from, date_to),
+    ).group_by(
+        bucket_of(inventory.date, bucket)
+    ).subquery()
+    rooms = sa.select(sa.func.coalesce(sa.func.sum(capacity.c.rooms), 0)).scalar_subquery()
+
+    return sa.select(
+        spine.c.bucket,
+        sa.func.coalesce(figures.c.bookings, 0).label('bookings'),
+        sa.func.coalesce(figures.c.revenue, 0).label('revenue'),
+        sa.func.coalesce(figures.c.fees, 0).label('fees'),
+        (
+            sa.cast(sa.func.coalesce(occupied.c.nights, 0), sa.Float) / sa.func.nullif(rooms * spine.c.nights, 0)
+        ).label('occupancy_rate'),
+    ).select_from(
+        spine
+    ).outerjoin(
+        figures, figures.c.bucket == spine.c.bucket
+    ).outerjoin(
+        occupied, occupied.c.bucket == spine.c.bucket
+    ).order_by(
+        spine.c.bucket
+    )
+
+
+async def get_series(property_ids: list[int], date_from: date, date_to: date, bucket: enums.TimeBucket) -> list[dict]:
+    db = get_db()
+    return [dict(row) for row in (await db.execute(series_query(property_ids, date_from, date_to, bucket))).mappings()]
+
+
+async def refresh_booking_stats(*booking_ids: int):
+    """Recompute the rows the bookings count in, within the current transaction and under their locks"""
+    if booking_ids:
+        db = get_db()
+        await db.flush()
+        await db.execute(lock_days_query(booking_days(*booking_ids)))
+        await db.execute(refresh_daily_stats_query(booking_days(*booking_ids)))
+
+
+async def rebuild_daily_stats(property_id: int = None):
+    db = get_db()
+    try:
+        stmt = sa.delete(models.PropertyDailyStats)
+        if property_id is not None:
+            stmt = stmt.where(models.PropertyDailyStats.property_id == property_id)
+        await db.execute(lock_days_query(all_days(property_id)))
+        await db.execute(stmt)
+        await db.execute(refresh_daily_stats_query(all_days(property_id)))
+        await db.commit()
+    except Exception as e:
+        logger.error(e)
+        await db.rollback()
+        raise e
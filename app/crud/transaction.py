@@ -1,16 +1,18 @@
 import sqlalchemy as sa
+from sqlalchemy.sql import operators
 
 from app import models
+from app.core.dependencies import get_db
 
 
-def get_all_transactions_by_property_id(property_id: int, dashboard_id: int):
+def get_all_transactions_by_property_id(property_ids: list[int], dashboard_id: int):
     query = sa.select(models.Transaction).outerjoin(
         models.Property, models.Transaction.property_id == models.Property.id
     ).outerjoin(
         models.MerchantDashboard, models.Transaction.dashboard_id == models.MerchantDashboard.id
     ).where(
         sa.or_(
-            models.Transaction.property_id == property_id,
+            operators.in_op(models.Transaction.property_id, property_ids),
             sa.and_(
                 models.Transaction.property_id == None,
                 models.Transaction.dashboard_id == dashboard_id
@@ -19,3 +21,37 @@ def get_all_transactions_by_property_id(property_id: int, dashboard_id: int):
     )
 
     return query.order_by(sa.desc(models.Transaction.created_at))
+
+
+async def post_entries(dashboard_id: int, entries: list[dict], min_balance: float = None) -> float | None:
+    """
+    Appends ``entries``, ``Transaction`` values with a signed ``amount``, to the merchant's ledger in one insert
+    and moves ``MerchantDashboard.balance`` by their sum in one ``UPDATE ... RETURNING``, so concurrent postings
+    never overwrite each other; every entry keeps the balance after it. Returns the new balance, or None without
+    posting anything when there are no entries or the balance would fall below ``min_balance``.
+    """
+    if not entries:
+        return None
+    db = get_db()
+    dashboard = models.MerchantDashboard
+    delta = sum(entry['amount'] for entry in entries)
+    stmt = sa.update(dashboard).where(
+        dashboard.id == dashboard_id
+    ).values(
+        balance=dashboard.balance + delta
+    )
+    if min_balance is not None:
+        stmt = stmt.where(dashboard.balance + delta >= min_balance)
+    balance = (await db.execute(
+        stmt.returning(dashboard.balance).execution_options(synchronize_session=False)
+    )).scalar_one_or_none()
+    if balance is None:
+        return None
+
+    running = balance - delta
+    rows = []
+    for entry in entries:
+        running += entry['amount']
+        rows.append(dict(entry, balance=running, dashboard_id=dashboard_id))
+    await db.execute(sa.insert(models.Transaction).values(rows))
+    return balance
@@ -1,3 +1,4 @@
+import asyncio
 import logging
 from importlib import import_module
 from inspect import getmembers, isclass
@@ -13,6 +14,7 @@ from app.api import router
 from app.core import sessions
 from app.core.conf import settings, APP_DIR
 from app.middlewares import middleware
+from app.utils.booking_lifecycle import BookingLifecycleWorker
 from app.utils.exceptions import (
     parse_sqlalchemy_exc,
     DatabaseValidationError,
@@ -42,8 +44,18 @@ def init_admin_panel(app_: FastAPI):
                 admin_panel.add_view(obj, app_name=file.stem.capitalize())
 
 
+background_tasks: set[asyncio.Task] = set()
+
+
+async def on_startup():
+    if settings.BOOKING_LIFECYCLE_INTERVAL:
+        background_tasks.add(asyncio.create_task(BookingLifecycleWorker().run()))
+
+
 async def on_shutdown():
     logger.info("shutdown")
+    for task in background_tasks:
+        task.cancel()
     await sessions.close()
 
 
@@ -75,6 +87,7 @@ app = FastAPI(
     debug=settings.DEBUG,
     routes=router.routes,
     middleware=middleware,
+    on_startup=[on_startup],
     on_shutdown=[on_shutdown],
     exception_handlers={
         SQLAlchemyError: sqlalchemy_exp_handler,
@@ -37,6 +37,9 @@ from .language import (
     LanguageTranslation
 )
 from .property import *
+from .sms import (
+    SmsOutbox
+)
 from .user import (
     User,
     SocialAccount,
@@ -5,14 +5,16 @@ import sqlalchemy as sa
 from sqlalchemy.dialects.postgresql import ENUM
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.declarative import declared_attr, declarative_base
-from sqlalchemy.orm import selectinload
+from sqlalchemy import event
+from sqlalchemy.orm import selectinload, with_loader_criteria, ORMExecuteState
 from sqlalchemy.sql import Select, operators
 
 from app.core.dependencies import get_db
 from app.core.logging import app_logger
-from app.core.sessions import AsyncSessionLocal
+from app.core.sessions import AsyncSessionLocal, LocalizedSession
 from app.utils.datetime import utcnow
 from app.utils.exceptions import DatabaseValidationError
+from app.utils.i18n import translation
 from .enums import Languages
 
 snake_case_pattern = re.compile(r'(?<!^)(?=[A-Z])')
@@ -187,6 +189,51 @@ class TranslationBase(Base):
     language = sa.Column(ENUM(Languages), nullable=False)
     is_default = sa.Column(sa.Boolean, default=False, nullable=False)
 
+    @classmethod
+    def localized(cls, column, onclause, fallback=None):
+        """
+        Scalar subquery of ``column`` in the current locale, else of the default translation, else ``fallback``.
+        ``onclause`` correlates the translations with the owner row of the outer query.
+        """
+        value = sa.select(column).where(onclause).order_by(
+            (cls.language == current_language()).desc(),
+            cls.is_default.desc(),
+        ).limit(1).scalar_subquery()
+        return sa.func.coalesce(value, fallback) if fallback is not None else value
+
+
+def current_language() -> Languages:
+    try:
+        return Languages(translation.current_locale)
+    except ValueError:
+        return Languages(translation.default)
+
+
+@event.listens_for(LocalizedSession, 'do_orm_execute')
+def filter_translations(execute_state: ORMExecuteState):
+    """
+    Restrict every translation loaded by a localized session, the one of a read request, to the current locale
+    and the default one, instead of loading all languages and picking one in ``TranslatableModel``.
+    Other sessions load every translation, so an edited object is saved with all of its languages.
+    Reads that edit translations opt out with ``execution_options(all_translations=True)``.
+    """
+    if (
+            execute_state.session.info.get('localized', False)
+            and execute_state.is_select
+            and not execute_state.is_column_load
+            and not execute_state.is_relationship_load
+            and not execute_state.execution_options.get('all_translations', False)
+    ):
+        language = current_language()
+        execute_state.statement = execute_state.statement.options(
+            with_loader_criteria(
+                TranslationBase,
+                lambda cls: sa.or_(cls.language == language, cls.is_default == True),
+                include_aliases=True,
+                propagate_to_loaders=True,
+            )
+        )
+
 
 operators_map = {
     "isnull": lambda c, v: (c is None) if v else (c is not None),
@@ -7,6 +7,11 @@ from .enums import BookingStatus, BookingCanceledBy
 
 
 class Booking(Base):
+    __table_args__ = (
+        sa.Index('ix_booking_name', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        sa.Index('ix_booking_property_id_created_at', 'property_id', 'created_at'),
+    )
+
     name = sa.Column(sa.String, nullable=False)
     user_id = sa.Column(sa.Integer, sa.ForeignKey('user.id'), nullable=False)
     property_id = sa.Column(sa.Integer, sa.ForeignKey('property.id'), nullable=False)
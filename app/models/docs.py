@@ -27,7 +27,11 @@ class DocFile(BaseClass):
         return Path(settings.MEDIA_PATH, self.path).as_posix()
 
     def full_path(self) -> str:
-        return settings.SITE_URL + self.file_path()
+        return self.url_for(self.path)
+
+    @staticmethod
+    def url_for(path: str) -> str:
+        return settings.SITE_URL + Path(settings.MEDIA_PATH, path).as_posix()
 
     @property
     def url(self):
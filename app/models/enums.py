@@ -46,6 +46,8 @@ class PropertySortBy(Enum):
     PRICE = 'price'
     DISCOUNT = 'discount'
     RATING = 'rating'
+    DISTANCE = 'distance'
+    RELEVANCE = 'relevance'
 
 
 class SortType(Enum):
@@ -113,6 +115,17 @@ class CountByDays(Enum):
     TODAY = "today"
 
 
+class TimeBucket(Enum):
+    DAY = "day"
+    WEEK = "week"
+    MONTH = "month"
+
+
+class ExportFormat(Enum):
+    CSV = "csv"
+    NDJSON = "ndjson"
+
+
 class HistorySortBy(Enum):
     ROOM_NAME = 'room_name'
     NAME = 'name'
@@ -165,3 +178,16 @@ class RoomStatus(Enum):
 class BookingCanceledBy(Enum):
     CLIENT = "client"
     MERCHANT_USER = "merchant_user"
+    SYSTEM = "system"
+
+
+class SmsKind(Enum):
+    CODE = 'code'
+    ORDER_ACCEPTED = 'order_accepted'
+    ORDER_CANCELED = 'order_canceled'
+
+
+class SmsStatus(Enum):
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
@@ -5,6 +5,10 @@ from app.models.enums import TransactionStatus, TransactionTitle
 
 
 class Transaction(Base):
+    __table_args__ = (
+        sa.Index('ix_transaction_property_id_created_at', 'property_id', 'created_at'),
+    )
+
     title = sa.Column(sa.Enum(TransactionTitle), nullable=False)
     status = sa.Column(sa.Enum(TransactionStatus), nullable=False)
     order_id = sa.Column(sa.Integer, nullable=True)
@@ -15,6 +15,8 @@ from .property import (
     PropertyLanguage,
     PropertyTranslation,
     PropertyTypeTranslation,
+    PropertySearchIndex,
+    PropertyDailyStats,
 
 )
 from .review import (
@@ -35,6 +37,7 @@ from .room import (
     PropertyRoomTemplate,
     PropertyRoom,
     PropertyRoomStatus,
+    RoomInventory,
     RoomTypeTranslation,
     RoomNameTranslation
 
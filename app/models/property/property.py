@@ -1,6 +1,6 @@
 import sqlalchemy as sa
 from sqlalchemy import event
-from sqlalchemy.dialects.postgresql import UUID, ENUM
+from sqlalchemy.dialects.postgresql import UUID, ENUM, ARRAY
 from sqlalchemy.orm import relationship
 
 from app.core.logging import app_logger
@@ -193,6 +193,86 @@ class PropertyTranslation(TranslationBase):
         return 'PropertyTranslation Id {}'.format(self.id)
 
 
+class PropertySearchIndex(Base):
+    """One row per property with everything the search filters and sorts on, see ``crud.search_index``"""
+    __table_args__ = (
+        sa.Index('ix_property_search_index_service_ids', 'service_ids', postgresql_using='gin'),
+        sa.Index('ix_property_search_index_is_active_city_slug', 'is_active', 'city_slug'),
+        sa.Index('ix_property_search_index_latitude_longitude', 'latitude', 'longitude'),
+        sa.Index(
+            'ix_property_search_index_location', sa.text('ll_to_earth(latitude, longitude)'), postgresql_using='gist'
+        ),
+        sa.Index(
+            'ix_property_search_index_search_text', 'search_text',
+            postgresql_using='gin', postgresql_ops={'search_text': 'gin_trgm_ops'}
+        ),
+    )
+
+    property_id = sa.Column(
+        sa.Integer,
+        sa.ForeignKey('property.id', ondelete='CASCADE'),
+        nullable=False,
+        unique=True
+    )
+    property = relationship("Property", lazy="noload")
+    name = sa.Column(sa.String, nullable=False)
+    # name with descriptions and addresses of every translation
+    search_text = sa.Column(sa.String, server_default="", nullable=False)
+    city_slug = sa.Column(sa.String)
+    type_id = sa.Column(sa.Integer, nullable=False, index=True)
+    star_rating = sa.Column(ENUM(PropertyStarRating), nullable=False)
+    is_active = sa.Column(ENUM(PropertyStatus), nullable=False)
+    is_breakfast_served = sa.Column(sa.Boolean, default=False, nullable=False)
+    city_centre_distance = sa.Column(sa.Float, nullable=False)
+    latitude = sa.Column(sa.Float, nullable=False)
+    longitude = sa.Column(sa.Float, nullable=False)
+
+    min_price = sa.Column(sa.Float, index=True)
+    min_price_for_resident = sa.Column(sa.Float, index=True)
+    has_discount = sa.Column(sa.Boolean, default=False, nullable=False)
+    max_number_of_rooms = sa.Column(sa.Integer, default=0, nullable=False)
+    max_number_of_guests = sa.Column(sa.Integer, default=0, nullable=False)
+    max_number_of_children = sa.Column(sa.Integer, default=0, nullable=False)
+
+    rating = sa.Column(sa.Float, index=True)
+    service_ids = sa.Column(ARRAY(sa.Integer), server_default="{}", nullable=False)
+
+    def __repr__(self):
+        return 'PropertySearchIndex Id {}'.format(self.id)
+
+    def __str__(self):
+        return 'PropertySearchIndex Id {}'.format(self.id)
+
+
+class PropertyDailyStats(Base):
+    """
+    Dashboard figures of a property for one local day (``settings.TIMEZONE``), see ``crud.stats``.
+    Bookings are counted on the day they were created, by their current status.
+    """
+    __table_args__ = (
+        sa.UniqueConstraint('property_id', 'date'),
+    )
+
+    property_id = sa.Column(sa.Integer, sa.ForeignKey('property.id', ondelete='CASCADE'), nullable=False)
+    date = sa.Column(sa.Date, nullable=False)
+    orders = sa.Column(sa.Integer, default=0, nullable=False)
+    pending = sa.Column(sa.Integer, default=0, nullable=False)
+    confirmed = sa.Column(sa.Integer, default=0, nullable=False)
+    active = sa.Column(sa.Integer, default=0, nullable=False)
+    closed = sa.Column(sa.Integer, default=0, nullable=False)
+    canceled = sa.Column(sa.Integer, default=0, nullable=False)
+    # total price of the closed bookings
+    revenue = sa.Column(sa.Float, default=0, nullable=False)
+    # sum of the service fee transactions, charges are negative and refunds positive
+    fees = sa.Column(sa.Float, default=0, nullable=False)
+
+    def __repr__(self):
+        return 'PropertyDailyStats Id {}'.format(self.id)
+
+    def __str__(self):
+        return 'PropertyDailyStats Id {}'.format(self.id)
+
+
 # === EVENT LISTENERS === #
 
 @event.listens_for(Property, "after_insert")
@@ -5,6 +5,7 @@ from sqlalchemy.sql import operators
 import logging
 from app.core.sessions import database
 from app.models.base import Base, TranslationBase
+from .property import PropertySearchIndex
 
 
 class PropertyReviewQuestion(Base):
@@ -218,6 +219,9 @@ def update_or_create_property_rating(conn, property_id=None):
 
         calculate_property_rating(session, property_id, property_rating)
         calculate_property_question_answers(session, property_id, property_rating)
+        session.execute(sa.update(PropertySearchIndex).where(
+            PropertySearchIndex.property_id == property_id
+        ).values(rating=property_rating.avg))
 
         logging.info("PropertyRating and RatingItems calculated")
 
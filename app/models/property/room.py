@@ -157,6 +157,26 @@ class PropertyRoomStatus(Base):
     room = relationship("PropertyRoom", back_populates="statuses", lazy="noload")
 
 
+class RoomInventory(Base):
+    """Number of free rooms of a room template for the night of ``date``.
+
+    Rows are created lazily: a missing row means every room of the template is free.
+    """
+    __table_args__ = (
+        sa.UniqueConstraint('room_id', 'date'),
+        sa.CheckConstraint('available >= 0', name='room_inventory_available_check'),
+    )
+
+    room_id = sa.Column(
+        sa.Integer,
+        sa.ForeignKey('property_room_template.id', ondelete='CASCADE'),
+        nullable=False
+    )
+    date = sa.Column(sa.Date, nullable=False)
+    available = sa.Column(sa.Integer, default=0, nullable=False)
+    room = relationship("PropertyRoomTemplate", lazy="noload")
+
+
 class PropertyRoom(Base):
     room_id = sa.Column(
         sa.Integer,
@@ -0,0 +1,25 @@
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import ENUM, JSONB
+
+from .base import Base
+from .enums import Languages, SmsKind, SmsStatus
+
+
+class SmsOutbox(Base):
+    """SMS waiting for delivery, the text is rendered from ``kind``, ``language`` and ``params`` when it is sent"""
+    phone = sa.Column(sa.String, nullable=False)
+    kind = sa.Column(ENUM(SmsKind), nullable=False)
+    language = sa.Column(ENUM(Languages), nullable=True)
+    params = sa.Column(JSONB, nullable=False, server_default='{}')
+    # one message per key, e.g. per order and event
+    dedupe_key = sa.Column(sa.String, nullable=True, unique=True)
+    status = sa.Column(ENUM(SmsStatus), nullable=False, default=SmsStatus.PENDING)
+    attempts = sa.Column(sa.Integer, nullable=False, default=0)
+    next_attempt_at = sa.Column(sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now())
+    expires_at = sa.Column(sa.DateTime(timezone=True), nullable=True)
+    sent_at = sa.Column(sa.DateTime(timezone=True), nullable=True)
+    last_error = sa.Column(sa.String, nullable=True)
+
+    __table_args__ = (
+        sa.Index('ix_sms_outbox_pending', 'next_attempt_at', postgresql_where=sa.text("status = 'PENDING'")),
+    )
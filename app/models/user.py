@@ -1,17 +1,12 @@
-import logging
-
 import sqlalchemy as sa
-from sqlalchemy import event
 from sqlalchemy.dialects.postgresql import ENUM, UUID
-from sqlalchemy.orm import relationship, declared_attr, Session
+from sqlalchemy.orm import relationship, declared_attr
 
 from app.core.dependencies import get_db
 from app.core.security import Auth
 from app.models.enums import Languages
-from . import enums
 from .base import Base
 from .enums import Gender, MerchantUserRole, SocialType
-from .. import models
 from ..core.conf import settings
 
 
@@ -121,18 +116,3 @@ class MerchantUser(UserBase):
         )
         return (await db.execute(stmt)).scalars().first()
 
-
-@event.listens_for(MerchantDashboard, 'before_update')
-def merchant_dashboard_before_update(target, conn, initiator):
-    with Session(bind=conn) as session:
-        merchant_dashboard = session.get(target, initiator.id)
-        transaction = models.Transaction(
-            title=enums.TransactionTitle.TOP_UP_THE_BALANCE,
-            status=enums.TransactionStatus.SUCCESS,
-            balance=merchant_dashboard.balance,
-            amount=abs(float(initiator.balance) - float(merchant_dashboard.balance)),
-            dashboard_id=merchant_dashboard.id
-        )
-        session.add(transaction)
-        session.flush()
-    logging.info("The merchant's balance is filled and also written transaction")
@@ -21,6 +21,7 @@ from .booking import (
     BookedRoomCreate,
     BookingHistory,
     BookingUpdate,
+    BookingQuote,
     BookingReview,
     AcceptOrderWithRoom,
     PropertyHistoryOfBookings,
@@ -46,6 +47,10 @@ from .contract import (
     Contract,
     ContractCreateOrUpdate
 )
+from .dashboard import (
+    DashboardSeries,
+    DashboardSeriesPoint,
+)
 from .docs import (
     DocFile,
     DocFileCreate,
@@ -77,6 +82,8 @@ from .property import (
     PropertyEasy,
     PropertyUpdate,
     PropertySearch,
+    PropertyCard,
+    PropertyFacets,
     PropertyRating,
     PropertyCreate,
     SavedFilter,
@@ -31,17 +31,19 @@ class TranslatableModel(BaseModel):
     def change_fields_to_current_language(cls, values: GetterDict):
         values = {**values}
         if 'translations' in values:
+            # request sessions only load the current locale and the default translation
             translations: list = values.get('translations')
-            for tr in translations:
-                if tr.language.value == translation.current_locale:
-                    values.update(_get_translation_model_fields(tr))
-                    break
+            current = [tr for tr in translations if tr.language.value == translation.current_locale]
+            default = [tr for tr in translations if tr.is_default]
+            if tr := next(iter(current or default), None):
+                values.update(_get_translation_model_fields(tr))
         return values
 
 
 class DataResponse(GenericModel, Generic[TypeT]):
-    total: int = 0
+    total: int | None = 0
     items: list[TypeT | Any] = []
+    next_cursor: str | None = None
 
     class Config:
         orm_mode = True
@@ -45,6 +45,24 @@ class BookingUpdate(BaseModel):
     rooms: list[BookedRoomCreate]
 
 
+class BookedRoomQuote(BaseModel):
+    room_id: int
+    number_of_people: int
+    for_resident: bool
+    price: float
+    nightly_prices: list[float] = []
+    discount: float = 0
+    total_price: float
+
+
+class BookingQuote(BaseModel):
+    nights: int
+    total_number_of_people: int
+    total_discount: float = 0
+    total_price: float
+    rooms: list[BookedRoomQuote] = []
+
+
 class BookedRoomBed(BaseModel):
     id: int
     bed_type: BedType
@@ -0,0 +1,20 @@
+from datetime import date
+
+from pydantic import BaseModel
+
+from app.models import enums
+
+
+class DashboardSeriesPoint(BaseModel):
+    bucket: date
+    bookings: int = 0
+    revenue: float = 0
+    fees: float = 0
+    occupancy_rate: float | None = None
+
+
+class DashboardSeries(BaseModel):
+    bucket: enums.TimeBucket
+    date_from: date
+    date_to: date
+    items: list[DashboardSeriesPoint] = []
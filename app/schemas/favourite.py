@@ -1,12 +1,12 @@
 from pydantic import BaseModel
 
-from .property import Property
+from .property import PropertyCard
 from .user import User
 
 
 class UserFavouriteProperties(BaseModel):
     user: User
-    properties: list[Property]
+    properties: list[PropertyCard]
 
 
 class UserFavourite(BaseModel):
@@ -176,6 +176,29 @@ class PropertySearch(BaseModel):
     city_slug: str
 
 
+class PropertyCard(BaseModel):
+    id: int
+    name: str
+    type: str
+    city: str | None
+    city_slug: str | None
+    star_rating: enums.PropertyStarRating
+    photo: str | None
+    min_price: float | None
+    min_price_for_resident: float | None
+    rating: float | None
+    services: list[str] = []
+
+
+class PropertyFacets(BaseModel):
+    total: int = 0
+    star_rating: dict[str, int] = {}
+    type: dict[str, int] = {}
+    service: dict[str, int] = {}
+    breakfast: dict[str, int] = {}
+    city_centre_distance: dict[str, int] = {}
+
+
 class SavedFilter(TranslatableModel):
     name: str
     price_gte: float
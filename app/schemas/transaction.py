@@ -11,10 +11,11 @@ class Transaction(BaseModel):
     title: enums.TransactionTitle
     status: enums.TransactionStatus
     order_id: int
+    property_id: int | None = None
     balance: float
 
     amount: float
-    room_type: RoomType
+    room_type: RoomType | None = None
     created_at: datetime
 
     class Config:
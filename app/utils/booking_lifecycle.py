@@ -0,0 +1,40 @@
+import asyncio
+import logging
+
+from app.core.conf import settings
+from app.core.dependencies import session_context_var
+from app.core.sessions import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+
+class BookingLifecycleWorker:
+    """
+    Runs :func:`app.crud.lifecycle.run_lifecycle` every ``interval`` seconds. Several workers may run
+    at once (``manage.py booking_lifecycle --loop`` or the in-app scheduler of every server process),
+    a run that finds another one in progress is skipped.
+    """
+
+    def __init__(self, interval: int = None):
+        self.interval = interval or settings.BOOKING_LIFECYCLE_INTERVAL
+
+    async def run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.exception(e)
+            await asyncio.sleep(self.interval)
+
+    async def run_once(self) -> dict[str, int] | None:
+        from app.crud import lifecycle as crud_lifecycle
+
+        async with AsyncSessionLocal() as session:
+            token = session_context_var.set(session)
+            try:
+                result = await crud_lifecycle.run_lifecycle()
+            finally:
+                session_context_var.reset(token)
+        if result:
+            logger.info('Booking lifecycle: %s', result)
+        return result
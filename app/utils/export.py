@@ -0,0 +1,78 @@
+import csv
+import io
+from enum import Enum
+from typing import Any, AsyncIterator, Callable
+
+from pydantic import BaseModel
+from sqlalchemy.sql import Select
+from starlette.responses import StreamingResponse
+
+from app.core.conf import settings
+from app.core.sessions import AsyncSessionLocal
+from app.models import enums
+
+MEDIA_TYPES = {
+    enums.ExportFormat.CSV: 'text/csv',
+    enums.ExportFormat.NDJSON: 'application/x-ndjson',
+}
+
+
+def csv_value(value: Any):
+    if value is None:
+        return ''
+    if isinstance(value, Enum):
+        return value.value
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def _flush(buffer: io.StringIO) -> str:
+    value = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return value
+
+
+async def stream_rows(
+        query: Select,
+        schema: type[BaseModel],
+        columns: dict[str, Callable[[Any], Any]],
+        export_format: enums.ExportFormat,
+) -> AsyncIterator[str]:
+    """
+    Renders the rows of ``query`` as ``schema`` objects, one NDJSON line each or a CSV row of ``columns``.
+    The rows come from a server-side cursor ``EXPORT_BATCH_SIZE`` at a time and every batch is sent before
+    the next one is fetched; the session holds the objects weakly, so the memory does not grow with the rows.
+    The export has its own session, the one of the request may be closed before the body is sent.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if export_format == enums.ExportFormat.CSV:
+        writer.writerow(columns.keys())
+        yield _flush(buffer)
+
+    async with AsyncSessionLocal() as session:
+        result = await session.stream(query.execution_options(yield_per=settings.EXPORT_BATCH_SIZE))
+        async for rows in result.scalars().partitions():
+            for row in rows:
+                item = schema.from_orm(row)
+                if export_format == enums.ExportFormat.CSV:
+                    writer.writerow(csv_value(get(item)) for get in columns.values())
+                else:
+                    buffer.write(item.json() + '\n')
+            yield _flush(buffer)
+
+
+def export_response(
+        query: Select,
+        schema: type[BaseModel],
+        columns: dict[str, Callable[[Any], Any]],
+        export_format: enums.ExportFormat,
+        filename: str,
+) -> StreamingResponse:
+    return StreamingResponse(
+        stream_rows(query, schema, columns, export_format),
+        media_type=MEDIA_TYPES[export_format],
+        headers={'Content-Disposition': f'attachment; filename="{filename}.{export_format.value}"'},
+    )
@@ -0,0 +1,124 @@
+import functools
+import hashlib
+import json
+import logging
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+from redis.exceptions import RedisError
+from starlette.responses import JSONResponse, Response
+
+from app.core.conf import settings
+from app.core.sessions import redis
+from .rate_limiter import _add_request_to_signature, _find_request_obj
+from .redis_helper import RedisHelper
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+
+
+class IdempotentResponse(RedisHelper):
+    """
+    First response to a request sent with an ``Idempotency-Key`` header, stored as
+    ``{'fingerprint': ..., 'status_code': ..., 'content': ...}``. While the first request is still
+    running the entry only holds its fingerprint.
+    """
+    PREFIX = 'idempotency'
+
+    @classmethod
+    def make_key(cls, scope: str, owner_id, idempotency_key: str) -> str:
+        return f'{scope}:{owner_id}:{hashlib.md5(idempotency_key.encode("utf-8")).hexdigest()}'
+
+    @classmethod
+    async def acquire(cls, key: str, fingerprint: str) -> dict | None:
+        """Mark ``key`` as running, returns the stored entry instead when there is one"""
+        data = dict(fingerprint=fingerprint)
+        if await redis.set(cls._make_cache_key(key), json.dumps(data), ex=settings.IDEMPOTENCY_LOCK_TTL, nx=True):
+            return None
+        return await cls.get_data(key) or data
+
+    @classmethod
+    async def store(cls, key: str, fingerprint: str, response: JSONResponse):
+        try:
+            if response.status_code >= 500:
+                # like a raised error, a server error can be retried with the same key
+                await redis.delete(cls._make_cache_key(key))
+            else:
+                await cls.set_data(key, dict(
+                    fingerprint=fingerprint,
+                    status_code=response.status_code,
+                    content=json.loads(response.body),
+                ), ex=settings.IDEMPOTENCY_KEY_TTL)
+        except RedisError as e:
+            logger.warning(e)
+
+    @classmethod
+    async def release(cls, key: str):
+        try:
+            await redis.delete(cls._make_cache_key(key))
+        except RedisError as e:
+            logger.warning(e)
+
+
+def _fingerprint(kwargs: dict, exclude: tuple) -> str:
+    data = jsonable_encoder({k: v for k, v in kwargs.items() if k not in exclude})
+    return hashlib.md5(json.dumps(data, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def _to_json_response(response, response_model: type[BaseModel] | None, status_code: int) -> JSONResponse:
+    if isinstance(response, Response):
+        return JSONResponse(json.loads(response.body), status_code=response.status_code)
+    if response_model is not None and not isinstance(response, (dict, BaseModel)):
+        response = response_model.from_orm(response)
+    return JSONResponse(jsonable_encoder(response), status_code=status_code)
+
+
+def idempotent(scope: str, response_model: type[BaseModel] = None, status_code: int = 200, owner: str = 'user'):
+    """
+    Replays the stored response of an endpoint for a repeated ``Idempotency-Key`` header of the same owner
+    (the ``owner`` argument of the endpoint, by its id), without calling the endpoint again.
+    Requests without the header are not affected; a key reused with other arguments gets 422,
+    a key whose first request is still running gets 409.
+    """
+
+    def decorator(fn):
+        signature = _add_request_to_signature(fn)
+
+        @functools.wraps(fn)
+        async def _wrapped(**kwargs):
+            request, kwargs = _find_request_obj(kwargs, bool(signature))
+            if not (idempotency_key := request.headers.get(IDEMPOTENCY_HEADER)):
+                return await fn(**kwargs)
+
+            key = IdempotentResponse.make_key(scope, getattr(kwargs.get(owner), 'id', None), idempotency_key)
+            fingerprint = _fingerprint(kwargs, exclude=(owner,))
+            try:
+                stored = await IdempotentResponse.acquire(key, fingerprint)
+            except RedisError as e:
+                logger.warning(e)
+                return await fn(**kwargs)
+
+            if stored is not None:
+                if stored['fingerprint'] != fingerprint:
+                    return JSONResponse({'ok': False, 'detail': 'Idempotency key is used by another request'},
+                                        status_code=422)
+                if 'status_code' not in stored:
+                    return JSONResponse({'ok': False, 'detail': 'Request is already being processed'},
+                                        status_code=409)
+                return JSONResponse(stored['content'], status_code=stored['status_code'])
+
+            try:
+                response = _to_json_response(await fn(**kwargs), response_model, status_code)
+            except Exception:
+                # nothing is stored for a failed request, so it can be retried with the same key
+                await IdempotentResponse.release(key)
+                raise
+            await IdempotentResponse.store(key, fingerprint, response)
+            return response
+
+        if signature:
+            _wrapped.__signature__ = signature
+        return _wrapped
+
+    return decorator
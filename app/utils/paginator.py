@@ -1,30 +1,150 @@
+import base64
+import json
+from datetime import datetime, date
+from decimal import Decimal
+from enum import Enum
+from json import JSONDecodeError
+
 import sqlalchemy as sa
-from fastapi import Query
-from sqlalchemy.sql import Select
+from fastapi import Query, HTTPException
+from sqlalchemy.sql import Select, operators
+from sqlalchemy.sql.elements import UnaryExpression
 
 from app.core.dependencies import get_db
 
 
+def _to_json(value):
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def _from_json(value, column: sa.Column):
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return value
+    if value is None:
+        return None
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    if python_type is date:
+        return date.fromisoformat(value)
+    if issubclass(python_type, (Enum, Decimal)):
+        return python_type(value)
+    return value
+
+
+def encode_cursor(values: list) -> str:
+    data = json.dumps([_to_json(value) for value in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str, columns: list[sa.Column]) -> list:
+    """Values of the sort key columns, the ``columns`` of the query the cursor was made for"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError(cursor)
+        return [_from_json(value, column) for value, column in zip(values, columns)]
+    except (ValueError, TypeError, KeyError, JSONDecodeError):
+        raise HTTPException(status_code=400, detail='Invalid cursor')
+
+
 class Paginator:
-    def __init__(self):
-        self.limit = 10
-        self.offset = 0
+    """
+    Page mode: ``page``/``per-page`` with LIMIT/OFFSET and a total count.
 
-    def __call__(self, page: int = Query(default=1), per_page: int = Query(10, alias='per-page')):
-        self.limit = per_page
-        self.offset = per_page * (page - 1)
-        return self
+    Cursor mode, chosen by passing ``cursor`` (empty for the first page): the query is continued after the
+    ``next_cursor`` of the previous response, using its ORDER BY columns plus the primary key.
+    ``with-total=false`` skips the count in both modes.
+    """
+
+    def __init__(self, limit: int = 10, offset: int = 0, cursor: str | None = None, with_total: bool = True):
+        self.limit = limit
+        self.offset = offset
+        self.cursor = cursor
+        self.with_total = with_total
+
+    def __call__(self, page: int = Query(default=1), per_page: int = Query(10, alias='per-page'),
+                 cursor: str = Query(None), with_total: bool = Query(True, alias='with-total')):
+        # a new paginator per request, the dependency itself is shared
+        return Paginator(limit=per_page, offset=per_page * (page - 1), cursor=cursor, with_total=with_total)
 
     async def execute(self, query: Select, fetch_one: bool = False):
         db = get_db()
-        total = (await db.execute(sa.select(sa.func.count()).select_from(query.subquery()))).scalar_one()
-        db_execute = await db.execute(query.limit(self.limit).offset(self.offset))
+        total = None
+        if self.with_total:
+            total = (await db.execute(sa.select(sa.func.count()).select_from(query.subquery()))).scalar_one()
+
+        next_cursor = None
+        if self.cursor is None:
+            db_execute = await db.execute(query.limit(self.limit).offset(self.offset))
+        else:
+            query, keys = self._keyset_query(query)
+            db_execute = await db.execute(query.limit(self.limit + 1))
+
         if fetch_one:
             items = db_execute.scalars().unique().first()
         else:
             items = db_execute.scalars().unique().all()
+            if self.cursor is not None and len(items) > self.limit:
+                items = items[:self.limit]
+                last = items[-1]
+                next_cursor = encode_cursor([getattr(last, attribute) for attribute, _, _ in keys])
+
+        return dict(items=items, total=total, next_cursor=next_cursor)
+
+    def _keyset_query(self, query: Select) -> tuple[Select, list[tuple[str, sa.Column, bool]]]:
+        """
+        The query continued after the cursor, keyed on its whole ORDER BY plus the primary key as the tie-breaker.
+        Every ORDER BY item has to be a column of the listed model, read back from the last item for the next
+        cursor; other orderings (expressions, joined tables, NULLS FIRST/LAST) are refused with a 400.
+        """
+        entity = query.column_descriptions[0]['entity']
+        if entity is None:
+            raise HTTPException(status_code=400, detail='Cursor pagination is not supported here')
+        mapper = sa.inspect(entity)
+        primary_key = mapper.primary_key[0]
+
+        keys = []
+        for clause in query._order_by_clauses:  # noqa
+            column, is_desc = clause, False
+            if isinstance(clause, UnaryExpression):
+                if clause.modifier not in (operators.desc_op, operators.asc_op):
+                    column = None
+                else:
+                    column, is_desc = clause.element, clause.modifier == operators.desc_op
+            if not isinstance(column, sa.Column) or column.table is not primary_key.table:
+                raise HTTPException(status_code=400, detail='Cursor pagination is not supported for this sort')
+            if any(key.compare(column) for _, key, _ in keys):
+                continue
+            if column.nullable:
+                # NULL is neither before nor after a value, rows would be skipped
+                raise HTTPException(status_code=400, detail='Cursor pagination is not supported for this sort')
+            keys.append((mapper.get_property_by_column(column).key, column, is_desc))
+            if column.compare(primary_key):
+                break
+        else:
+            keys.append((mapper.get_property_by_column(primary_key).key, primary_key, keys[-1][2] if keys else False))
 
-        return dict(items=items, total=total)
+        query = query.order_by(None).order_by(
+            *((sa.desc if is_desc else sa.asc)(column) for _, column, is_desc in keys)
+        )
+        if self.cursor:
+            values = decode_cursor(self.cursor, [column for _, column, _ in keys])
+            query = query.where(sa.or_(*(
+                sa.and_(
+                    *(column == value for (_, column, _), value in zip(keys[:i], values)),
+                    column < values[i] if is_desc else column > values[i],
+                )
+                for i, (_, column, is_desc) in enumerate(keys)
+            )))
+        return query, keys
 
 
 paginate = Paginator()
@@ -0,0 +1,108 @@
+import hashlib
+import json
+import logging
+from datetime import datetime, date
+from enum import Enum
+from typing import Any
+
+from redis.exceptions import RedisError
+
+from app.core.conf import settings
+from app.core.sessions import redis
+from .redis_helper import RedisHelper
+
+logger = logging.getLogger(__name__)
+
+
+def _canonical(value: Any):
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, (list, tuple, set)):
+        return sorted(_canonical(v) for v in value)
+    return value
+
+
+class PropertySearchCache(RedisHelper):
+    """
+    Caches property search pages as ``{'ids': [...], 'total': n}``.
+
+    Every entry is tagged with the searched city (or ``ANY_CITY``) and with the ids it contains,
+    so a change of one property only drops the entries it can affect.
+    """
+    PREFIX = 'property-search'
+    ANY_CITY = '*'
+
+    @classmethod
+    def make_key(cls, **filters) -> str:
+        """
+        Same key for searches reading the same rows: the free text ``q`` is matched by ``pg_trgm``, which ignores
+        case and surrounding spaces, every other value is kept exactly as the database compares it
+        """
+        if isinstance(filters.get('q'), str):
+            filters['q'] = filters['q'].strip().lower()
+        data = json.dumps({k: _canonical(v) for k, v in filters.items()}, sort_keys=True, default=str)
+        return hashlib.md5(data.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def _make_tag_key(cls, kind: str, value: Any):
+        return cls._make_cache_key(f'tag:{kind}:{value}')
+
+    @classmethod
+    async def get_cached_data(cls, key: str) -> dict:
+        try:
+            return await cls.get_data(key)
+        except RedisError as e:
+            logger.warning(e)
+            return {}
+
+    @classmethod
+    async def get_result(cls, key: str) -> tuple[list[int], int] | None:
+        if data := await cls.get_cached_data(key):
+            return data['ids'], data['total']
+        return None
+
+    @classmethod
+    async def set_result(cls, key: str, ids: list[int], total: int, city: str | None = None):
+        await cls.set_tagged_data(key, dict(ids=ids, total=total), city=city, property_ids=ids)
+
+    @classmethod
+    async def get_facets(cls, key: str) -> dict | None:
+        return await cls.get_cached_data(key) or None
+
+    @classmethod
+    async def set_facets(cls, key: str, facets: dict, city: str | None = None):
+        # counts change with any property of the city, so they are tagged by the city only
+        await cls.set_tagged_data(key, facets, city=city)
+
+    @classmethod
+    async def set_tagged_data(cls, key: str, data: dict, city: str | None = None, property_ids: list[int] = ()):
+        ex = settings.PROPERTY_SEARCH_CACHE_TTL
+        tags = [
+            cls._make_tag_key('city', city or cls.ANY_CITY),
+            *(cls._make_tag_key('property', property_id) for property_id in property_ids)
+        ]
+        try:
+            async with redis.pipeline(transaction=False) as pipe:
+                pipe.set(cls._make_cache_key(key), json.dumps(data), ex=ex)
+                for tag in tags:
+                    pipe.sadd(tag, key)
+                    pipe.expire(tag, ex)
+                await pipe.execute()
+        except RedisError as e:
+            logger.warning(e)
+
+    @classmethod
+    async def invalidate(cls, *cities: str | None, property_id: int = None):
+        """Drop entries of the given cities, of city-less searches and entries containing ``property_id``"""
+        tags = [cls._make_tag_key('city', city) for city in {cls.ANY_CITY, *cities} if city]
+        if property_id:
+            tags.append(cls._make_tag_key('property', property_id))
+        try:
+            keys = await redis.sunion(*tags)
+            await redis.delete(*(cls._make_cache_key(key.decode()) for key in keys), *tags)
+        except RedisError as e:
+            logger.warning(e)
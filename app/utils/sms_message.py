@@ -1,19 +1,26 @@
+from app.core.conf import settings
 from app.models import enums
 
 
 def order_accept_send_sms(language: enums.Languages, is_accept: bool = True):
     if is_accept:
-        if language.UZ:
+        if language == enums.Languages.UZ:
             text = 'some text when sending sms'
-        elif language.RU:
+        elif language == enums.Languages.RU:
             text = 'some text when sending sms'
         else:
             text = 'some text when sending sms'
     else:
-        if language.UZ:
+        if language == enums.Languages.UZ:
             text = 'some text when sending sms'
-        elif language.RU:
+        elif language == enums.Languages.RU:
             text = 'some text when sending sms'
         else:
             text = 'some text when sending sms'
     return text
+
+
+def render_sms(kind: enums.SmsKind, language: enums.Languages | None, params: dict) -> str:
+    if kind == enums.SmsKind.CODE:
+        return settings.ESKIZ_SMS_TEXT.format(**params)
+    return order_accept_send_sms(language, is_accept=kind == enums.SmsKind.ORDER_ACCEPTED)
@@ -0,0 +1,140 @@
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from datetime import timedelta
+
+import sqlalchemy as sa
+from sqlalchemy.sql import operators
+
+from app import models
+from app.core.conf import settings, eskiz
+from app.core.sessions import AsyncSessionLocal
+from app.models import enums
+from .datetime import utcnow
+from .sms_message import render_sms
+
+logger = logging.getLogger(__name__)
+
+
+class SmsProvider(ABC):
+    @abstractmethod
+    async def send(self, phone: str, text: str):
+        """Sends one message, raises when the provider did not take it"""
+
+
+class EskizProvider(SmsProvider):
+    async def send(self, phone: str, text: str):
+        await eskiz.send_sms(phone, message=text)
+
+
+class StubProvider(SmsProvider):
+    """Keeps and logs the messages instead of sending them, for local runs and tests"""
+
+    def __init__(self):
+        self.sent: list[tuple[str, str]] = []
+
+    async def send(self, phone: str, text: str):
+        logger.info('SMS to %s: %s', phone, text)
+        self.sent.append((phone, text))
+
+
+def get_provider() -> SmsProvider:
+    return StubProvider() if settings.SMS_PROVIDER == 'stub' else EskizProvider()
+
+
+def retry_delay(attempts: int) -> timedelta:
+    return timedelta(seconds=settings.SMS_OUTBOX_RETRY_DELAY * 2 ** (attempts - 1))
+
+
+class SmsOutboxWorker:
+    """
+    Delivers ``SmsOutbox`` messages: claims a batch with ``FOR UPDATE SKIP LOCKED`` (several workers
+    can run side by side), sends it with at most ``concurrency`` provider calls at a time and
+    reschedules failures with exponential backoff until ``SMS_OUTBOX_MAX_ATTEMPTS``
+    """
+    outbox = models.SmsOutbox
+
+    def __init__(self, provider: SmsProvider = None, batch_size: int = None, concurrency: int = None):
+        self.provider = provider or get_provider()
+        self.batch_size = batch_size or settings.SMS_OUTBOX_BATCH_SIZE
+        self.semaphore = asyncio.Semaphore(concurrency or settings.SMS_OUTBOX_CONCURRENCY)
+
+    async def run(self):
+        while True:
+            try:
+                processed = await self.process_batch()
+            except Exception as e:
+                logger.exception(e)
+                processed = 0
+            if processed < self.batch_size:
+                await asyncio.sleep(settings.SMS_OUTBOX_POLL_INTERVAL)
+
+    async def process_batch(self) -> int:
+        async with AsyncSessionLocal() as session:
+            messages = (await session.execute(self._claim_query())).mappings().all()
+            await session.commit()
+        if not messages:
+            return 0
+
+        results = await asyncio.gather(*(self._send(message) for message in messages))
+        sent = [dict(_id=message['id']) for message, error in zip(messages, results) if error is None]
+        failed = [
+            dict(
+                _id=message['id'],
+                _status=(
+                    enums.SmsStatus.FAILED
+                    if message['attempts'] >= settings.SMS_OUTBOX_MAX_ATTEMPTS or error == 'expired'
+                    else enums.SmsStatus.PENDING
+                ),
+                _next_attempt_at=utcnow() + retry_delay(message['attempts']),
+                _last_error=error[:1000],
+            )
+            for message, error in zip(messages, results) if error is not None
+        ]
+
+        table = self.outbox.__table__
+        async with AsyncSessionLocal() as session:
+            if sent:
+                await session.execute(table.update().where(table.c.id == sa.bindparam('_id')).values(
+                    status=enums.SmsStatus.SENT, sent_at=sa.func.now(), updated_at=sa.func.now()
+                ), sent)
+            if failed:
+                await session.execute(table.update().where(table.c.id == sa.bindparam('_id')).values(
+                    status=sa.bindparam('_status'),
+                    next_attempt_at=sa.bindparam('_next_attempt_at'),
+                    last_error=sa.bindparam('_last_error'),
+                    updated_at=sa.func.now(),
+                ), failed)
+            await session.commit()
+        return len(messages)
+
+    def _claim_query(self):
+        """Takes the due messages and hides them for ``SMS_OUTBOX_LEASE``, so a crashed worker's batch is retried"""
+        outbox = self.outbox
+        due = sa.select(outbox.id).where(
+            outbox.status == enums.SmsStatus.PENDING,
+            outbox.next_attempt_at <= sa.func.now(),
+        ).order_by(
+            outbox.next_attempt_at
+        ).limit(self.batch_size).with_for_update(skip_locked=True).scalar_subquery()
+        return sa.update(outbox).where(
+            operators.in_op(outbox.id, due)
+        ).values(
+            attempts=outbox.attempts + 1,
+            next_attempt_at=sa.func.now() + timedelta(seconds=settings.SMS_OUTBOX_LEASE),
+        ).returning(
+            outbox.id, outbox.phone, outbox.kind, outbox.language, outbox.params, outbox.expires_at, outbox.attempts
+        ).execution_options(synchronize_session=False)
+
+    async def _send(self, message) -> str | None:
+        """Error of the delivery, None when the message is sent"""
+        if message['expires_at'] is not None and message['expires_at'] < utcnow():
+            return 'expired'
+        try:
+            text = render_sms(message['kind'], message['language'], message['params'])
+            async with self.semaphore:
+                await asyncio.wait_for(self.provider.send(message['phone'], text), settings.SMS_OUTBOX_SEND_TIMEOUT)
+        except Exception as e:
+            logger.warning('SMS %s is not sent: %r', message['id'], e)
+            return repr(e)
+        return None
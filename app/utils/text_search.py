@@ -0,0 +1,13 @@
+import sqlalchemy as sa
+
+
+def fuzzy_match(column, q: str):
+    """
+    ``column %> q`` of ``pg_trgm``: some word of ``column`` is similar to ``q``, so typos still match.
+    Served by a ``gin_trgm_ops`` index on ``column``.
+    """
+    return column.op('%>')(q)
+
+
+def fuzzy_rank(column, q: str):
+    return sa.func.word_similarity(q, column)
@@ -0,0 +1,46 @@
+import logging
+from typing import Awaitable, Callable
+
+from redis.exceptions import RedisError
+
+from app.core.sessions import redis
+from .redis_helper import RedisHelper
+
+logger = logging.getLogger(__name__)
+
+
+class WithdrawalRulesCache(RedisHelper):
+    """
+    In-process copy of the ``WithdrawalAmount`` rules by room type id.
+
+    Every process keeps the rules together with the version counter read from Redis,
+    a change of the rules bumps the counter so that all processes reload them on the next read.
+    Without Redis the rules are read from the database every time.
+    """
+    PREFIX = 'withdrawal-rules'
+    _version: int | None = None
+    _rules: dict | None = None
+
+    @classmethod
+    async def get_version(cls) -> int | None:
+        try:
+            return int(await redis.get(cls._make_cache_key('version')) or 0)
+        except RedisError as e:
+            logger.warning(e)
+            return None
+
+    @classmethod
+    async def get_rules(cls, load: Callable[[], Awaitable[dict]]) -> dict:
+        # the version is read before loading, so a change made meanwhile is reloaded next time
+        version = await cls.get_version()
+        if cls._rules is None or version is None or version != cls._version:
+            cls._rules, cls._version = await load(), version
+        return cls._rules
+
+    @classmethod
+    async def invalidate(cls):
+        cls._rules = None
+        try:
+            await redis.incr(cls._make_cache_key('version'))
+        except RedisError as e:
+            logger.warning(e)
@@ -17,7 +17,8 @@ from sqlalchemy.exc import DBAPIError
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.conf import settings
-from app.core.sessions import database
+from app.core.dependencies import session_context_var
+from app.core.sessions import database, AsyncSessionLocal
 from app.main import app
 
 typer_app = typer.Typer()
@@ -184,6 +185,74 @@ def coro(f):
     return wrapper
 
 
+def with_db(f):
+    """Runs the coroutine with a session available through ``get_db()``"""
+
+    @wraps(f)
+    async def wrapper(*args, **kwargs):
+        async with AsyncSessionLocal() as session:
+            token = session_context_var.set(session)
+            try:
+                return await f(*args, **kwargs)
+            finally:
+                session_context_var.reset(token)
+
+    return wrapper
+
+
+@typer_app.command(name="rebuild_inventory")
+@coro
+@with_db
+async def rebuild_inventory(room_id: int = typer.Option(None, '--room', '-r', help="Room template id")):
+    from app.crud import crud_inventory
+    await crud_inventory.rebuild_inventory(room_id=room_id)
+    typer.echo(typer.style('Room inventory rebuilt', fg='green', bold=True))
+
+
+@typer_app.command(name="rebuild_search_index")
+@coro
+@with_db
+async def rebuild_search_index():
+    from app.crud import crud_search_index
+    await crud_search_index.rebuild_search_index()
+    typer.echo(typer.style('Property search index rebuilt', fg='green', bold=True))
+
+
+@typer_app.command(name="rebuild_daily_stats")
+@coro
+@with_db
+async def rebuild_daily_stats(property_id: int = typer.Option(None, '--property', '-p', help="Property id")):
+    from app.crud import crud_stats
+    await crud_stats.rebuild_daily_stats(property_id)
+    typer.echo(typer.style('Property daily stats rebuilt', fg='green', bold=True))
+
+
+@typer_app.command(name="sms_worker")
+@coro
+async def sms_worker():
+    from app.utils.sms_outbox import SmsOutboxWorker
+    typer.echo(typer.style('Delivering SMS outbox messages...', fg='green', bold=True))
+    await SmsOutboxWorker().run()
+
+
+@typer_app.command(name="booking_lifecycle")
+@coro
+async def booking_lifecycle(
+        loop: bool = typer.Option(False, '--loop', '-l', help="Keep running every --interval seconds"),
+        interval: int = typer.Option(60, '--interval', '-i', help="Seconds between the runs"),
+):
+    from app.utils.booking_lifecycle import BookingLifecycleWorker
+    worker = BookingLifecycleWorker(interval)
+    if loop:
+        typer.echo(typer.style('Moving bookings through their lifecycle...', fg='green', bold=True))
+        await worker.run()
+    result = await worker.run_once()
+    if result is None:
+        typer.echo(typer.style('Another worker is running', fg='yellow', bold=True))
+    else:
+        typer.echo(typer.style(f'Bookings moved: {result}', fg='green', bold=True))
+
+
 @typer_app.command(name="auto_populate")
 @coro
 async def auto_populate_datas(test: bool = typer.Option(False, '--test', '-t'), ):
@@ -41,3 +41,1487 @@ def access_token(get_token):
 
 def test_login(access_token):
     assert get_token['ok'] is True
+
+
+def test_paginator_cursor():
+    from datetime import datetime, timezone
+    from app import models
+    from app.models import enums
+    from app.utils.paginator import encode_cursor, decode_cursor
+
+    created_at = datetime(2023, 5, 1, 12, 30, tzinfo=timezone.utc)
+    columns = [models.Booking.created_at, models.Booking.id]
+    assert decode_cursor(encode_cursor([created_at, 42]), columns) == [created_at, 42]
+    assert decode_cursor(encode_cursor([7]), [models.Booking.id]) == [7]
+    columns = [models.Booking.status, models.Booking.id]
+    assert decode_cursor(encode_cursor([enums.BookingStatus.CLOSED, 3]), columns) == [enums.BookingStatus.CLOSED, 3]
+
+
+def keyset_sql(query, cursor):
+    from sqlalchemy.dialects import postgresql
+    from app.utils.paginator import Paginator
+
+    query, keys = Paginator(cursor=cursor)._keyset_query(query)
+    return str(query.compile(dialect=postgresql.dialect())), [column.key for _, column, _ in keys]
+
+
+def test_paginator_cursor_pages_through_ties():
+    from datetime import datetime, timedelta, timezone
+    import sqlalchemy as sa
+    from app import models
+    from app.utils.paginator import Paginator
+
+    async def test():
+        hotel = await add_property()
+        created_at = datetime(2030, 1, 1, tzinfo=timezone.utc)
+        bookings = [
+            await add_booking(hotel, price=price, created_at=created_at + timedelta(hours=hours))
+            for price, hours in [(120.5, 0), (80.0, 1), (120.5, 1), (80.0, 0), (99.0, 1)]
+        ]
+
+        async def pages(query, **options):
+            cursor, ids = '', []
+            while cursor is not None:
+                page = await Paginator(limit=2, cursor=cursor, **options).execute(query)
+                ids.append([item.id for item in page['items']])
+                cursor = page['next_cursor']
+            return ids, page['total']
+
+        query = sa.select(models.Booking).order_by(sa.asc(models.Booking.total_price), sa.desc(models.Booking.id))
+        ids, total = await pages(query, with_total=False)
+        assert [len(page) for page in ids] == [2, 2, 1] and total is None
+        assert sum(ids, []) == [booking.id for booking in sorted(bookings, key=lambda b: (b.total_price, -b.id))]
+
+        query = sa.select(models.Booking).order_by(sa.desc(models.Booking.created_at))
+        ids, total = await pages(query.where(models.Booking.id != bookings[-1].id))
+        assert [len(page) for page in ids] == [2, 2] and total == 4
+        assert sum(ids, []) == [booking.id for booking in sorted(
+            bookings[:-1], key=lambda b: (b.created_at, b.id), reverse=True
+        )]
+
+    run_in_database(test())
+
+
+def test_paginator_cursor_refuses_unkeyable_sort():
+    import sqlalchemy as sa
+    from fastapi import HTTPException
+    from app import models
+    from app.utils.paginator import encode_cursor
+
+    for query in (
+            sa.select(models.Booking).order_by(sa.func.similarity(models.Booking.name, 'ali')),
+            sa.select(models.Booking).join(models.Property).order_by(models.Property.name),
+            sa.select(models.Booking).order_by(models.Booking.reason_of_cancellation),
+    ):
+        with pytest.raises(HTTPException) as error:
+            keyset_sql(query, '')
+        assert error.value.status_code == 400
+    with pytest.raises(HTTPException):
+        keyset_sql(sa.select(models.Booking).order_by(models.Booking.name), encode_cursor([1]))
+
+
+def test_name_search_keeps_the_requested_sort():
+    from fastapi import HTTPException
+    from app.crud import booking as crud_booking
+    from app.models import enums
+
+    def history(sort_by):
+        return crud_booking.order_history(
+            'alii', enums.SearchType.NAME, enums.SortType.ASC, sort_by, None, property_ids=[1]
+        )
+
+    # an explicit sort orders the matches and can be paged with a cursor
+    _, keys = keyset_sql(history(enums.HistorySortBy.NAME), '')
+    assert keys == ['name', 'id']
+    # without one the closest names come first, which only offset pages can follow
+    with pytest.raises(HTTPException) as error:
+        keyset_sql(history(None), '')
+    assert error.value.status_code == 400
+
+
+def test_fuzzy_name_search():
+    from app.core.dependencies import get_db
+    from app.crud import booking as crud_booking, search_index as crud_search_index
+    from app.models import enums
+
+    async def test():
+        hilton = await add_property('Hilton Tashkent')
+        await add_property('Hyatt Regency')
+        await crud_search_index.rebuild_search_index()
+        assert [card['id'] for card in (await search_properties(q='hiltn'))[0]] == [hilton.id]
+
+        for name in ('Alisher Navoiy', 'Bobur Mirzo', 'Alisher Usmonov'):
+            await add_booking(hilton, name, status=enums.BookingStatus.CLOSED)
+
+        async def history(q, sort_by=None):
+            query = crud_booking.order_history(
+                q, enums.SearchType.ALL, enums.SortType.DESC, sort_by, None, property_ids=[hilton.id]
+            )
+            return [booking.name for booking in (await get_db().execute(query)).scalars().all()]
+
+        assert sorted(await history('alishr')) == ['Alisher Navoiy', 'Alisher Usmonov']
+        assert await history('alishr', enums.HistorySortBy.NAME) == ['Alisher Usmonov', 'Alisher Navoiy']
+        assert await history('100') == ['Alisher Navoiy', 'Bobur Mirzo', 'Alisher Usmonov'][::-1]
+
+    run_in_database(test())
+
+
+def test_booking_lists_load_what_they_render():
+    import sqlalchemy as sa
+    from app import schemas
+    from app.core.dependencies import get_db
+    from app.crud import booking as crud_booking
+    from app.models import enums
+
+    async def test():
+        db = get_db()
+        hotel = await add_property(prices=(100.0, 80.0))
+        statements = []
+        sa.event.listen(db.sync_session.bind.engine, 'before_cursor_execute', lambda *args: statements.append(args))
+
+        async def render(query, schema):
+            statements.clear()
+            db.expunge_all()
+            return [schema.from_orm(booking) for booking in (await db.execute(query)).scalars().all()], len(statements)
+
+        booking = await add_booking(hotel, rooms=2)
+        bookings, _ = await render(crud_booking.get_all_bookings(booking.user_id), schemas.Booking)
+        assert [(item.id, len(item.rooms), item.property.name) for item in bookings] == [(booking.id, 2, 'Hotel')]
+
+        history_query = crud_booking.get_booking_history(booking.user_id)
+        await add_booking(hotel, status=enums.BookingStatus.CLOSED, user_id=booking.user_id)
+        history, queries = await render(history_query, schemas.BookingHistory)
+        assert len(history) == 1
+        for _ in range(3):
+            await add_booking(hotel, status=enums.BookingStatus.CLOSED, user_id=booking.user_id, rooms=2)
+        # one query per relationship for the whole page, not per booking
+        history, more_queries = await render(history_query, schemas.BookingHistory)
+        assert len(history) == 4 and more_queries == queries
+
+    run_in_database(test())
+
+
+def test_sms_outbox_send():
+    import asyncio
+    from datetime import timedelta
+    from app.models import enums
+    from app.utils.datetime import utcnow
+    from app.utils.sms_outbox import SmsOutboxWorker, SmsProvider, StubProvider
+
+    worker = SmsOutboxWorker(provider=StubProvider())
+    message = dict(id=1, phone='+998901234567', kind=enums.SmsKind.CODE, language=None, params={'code': '123456'},
+                   expires_at=None, attempts=1)
+    assert asyncio.run(worker._send(message)) is None
+    assert worker.provider.sent == [('+998901234567', settings.ESKIZ_SMS_TEXT.format(code='123456'))]
+    assert asyncio.run(worker._send({**message, 'expires_at': utcnow() - timedelta(seconds=1)})) == 'expired'
+    with pytest.raises(TypeError):
+        SmsProvider()
+
+
+def test_send_code_queues_the_code():
+    import sqlalchemy as sa
+    from app import models
+    from app.core.dependencies import get_db
+    from app.crud import sms_outbox as crud_sms_outbox
+    from app.models import enums
+
+    async def test():
+        assert await crud_sms_outbox.send_code('+998901234567', '123456') == 'Waiting for SMS provider'
+        rows = (await get_db().execute(sa.select(
+            models.SmsOutbox.phone, models.SmsOutbox.kind, models.SmsOutbox.params, models.SmsOutbox.status
+        ))).all()
+        assert rows == [('+998901234567', enums.SmsKind.CODE, {'code': '123456'}, enums.SmsStatus.PENDING)]
+
+    run_in_database(test())
+
+
+def run_in_database(coroutine):
+    """
+    Awaits ``coroutine`` with a request session on empty tables of the configured (migrated) database, created in
+    a throwaway schema that is dropped afterwards. Skipped when the database is not reachable.
+    """
+    import asyncio
+    import sqlalchemy as sa
+    from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+    from sqlalchemy.pool import NullPool
+    from app.core.dependencies import session_context_var
+    from app.core.sessions import LocalizedSession
+    from app.models.base import BaseClass
+
+    async def run():
+        engine = create_async_engine(settings.DB_CONFIG, poolclass=NullPool)
+        try:
+            connection = await engine.connect()
+        except (OSError, sa.exc.DBAPIError) as e:
+            coroutine.close()
+            pytest.skip(f'database is not reachable: {e}')
+        try:
+            # the extensions of the migrations stay in public
+            await connection.execute(sa.text('DROP SCHEMA IF EXISTS test_app CASCADE'))
+            await connection.execute(sa.text('CREATE SCHEMA test_app'))
+            await connection.execute(sa.text('SET search_path TO test_app, public'))
+            await connection.run_sync(BaseClass.metadata.create_all)
+            await connection.commit()
+            session = AsyncSession(
+                bind=connection, autoflush=False, expire_on_commit=False, sync_session_class=LocalizedSession
+            )
+            token = session_context_var.set(session)
+            try:
+                return await coroutine
+            finally:
+                session_context_var.reset(token)
+                await session.close()
+        finally:
+            coroutine.close()
+            await connection.rollback()
+            await connection.execute(sa.text('DROP SCHEMA IF EXISTS test_app CASCADE'))
+            await connection.commit()
+            await connection.close()
+            await engine.dispose()
+    return asyncio.run(run())
+
+
+async def add_property(name='Hotel', city='tashkent', prices=(100.0,), rooms=1, **values):
+    """An active property of ``city`` with a room template per price of ``prices``, ``rooms`` physical rooms each"""
+    import sqlalchemy as sa
+    from app import models
+    from app.core.dependencies import get_db
+    from app.models import enums
+
+    db = get_db()
+    city_ = (await db.execute(sa.select(models.City).where(models.City.name_slug == city))).scalar()
+    room_type = models.RoomType(type='Double', max_number_of_guests=2)
+    property_ = models.Property(**{
+        'name': name, 'description': name, 'phone': '+998901234567', 'address': name, 'latitude': 41.3,
+        'longitude': 69.3, 'city_centre_distance': 2, 'star_rating': enums.PropertyStarRating.THREE,
+        'is_active': enums.PropertyStatus.ACTIVE, 'type': models.PropertyType(type='Hotel'),
+        'city': city_ or models.City(name=city.title(), name_slug=city, latitude=41.3, longitude=69.3), **values
+    })
+    property_.rooms = [
+        models.PropertyRoomTemplate(
+            type=room_type, name=models.RoomName(type=room_type, name='Double'), price=price,
+            price_for_resident=price, max_number_of_guests=2,
+            rooms=[models.PropertyRoom(name=str(n)) for n in range(rooms)]
+        )
+        for price in prices
+    ]
+    db.add(property_)
+    await db.flush()
+    return property_
+
+
+async def add_booking(property_, name='Guest', status=None, booked_from=None, booked_to=None, rooms=1, price=100.0,
+                      **values):
+    """A booking of ``rooms`` rooms of the first template of ``property_``, from 1 to 3 January 2030 by default"""
+    import uuid
+    from datetime import datetime, timezone
+    from app import models
+    from app.core.dependencies import get_db
+    from app.models import enums
+
+    status = status or enums.BookingStatus.PENDING
+    booked_from = booked_from or datetime(2030, 1, 1, 9, tzinfo=timezone.utc)
+    booked_to = booked_to or datetime(2030, 1, 3, 7, tzinfo=timezone.utc)
+    if 'user_id' not in values:
+        values['user'] = models.User(phone=f'+998{uuid.uuid4().int % 10 ** 9:09}')
+    booking = models.Booking(
+        name=name, property_id=property_.id, booked_from=booked_from, booked_to=booked_to,
+        status=status, total_price=price * rooms, total_number_of_people=rooms, **values
+    )
+    booking.rooms = [
+        models.BookedRoom(
+            booked_from=booked_from, booked_to=booked_to, property_id=property_.id, status=status, price=price,
+            property_room_template_id=property_.rooms[0].id
+        )
+        for _ in range(rooms)
+    ]
+    db = get_db()
+    db.add(booking)
+    await db.flush()
+    return booking
+
+
+def search_properties(**filters):
+    """``get_properties_by_criteria`` with no filter but ``filters``"""
+    from datetime import datetime
+    from app.crud import property as crud_property
+    from app.models import enums
+
+    return crud_property.get_properties_by_criteria(**{
+        'q': None, 'sort_by': None, 'sort_type': enums.SortType.ASC, 'breakfast': None, 'property_type': None,
+        'star_rating': None, 'city': None, 'city_centre_distance': None, 'services': None, 'price_gte': 0,
+        'price_lte': 10 ** 6, 'checkin': datetime(2030, 1, 1), 'checkout': datetime(2030, 1, 3), 'rooms': 1,
+        'adults': 1, 'is_resident': False, 'children': 0, 'ratings': None, **filters
+    })
+
+
+def test_property_search_pages_and_counts_in_sql():
+    from app.crud import search_index as crud_search_index
+    from app.models import enums
+
+    async def test():
+        hotels = [await add_property(name) for name in ('A', 'B', 'C')]
+        await add_property('Pending', is_active=enums.PropertyStatus.PENDING)
+        await add_property('Elsewhere', city='samarkand')
+        await crud_search_index.rebuild_search_index()
+
+        cards, total = await search_properties(city='tashkent', page=2, per_page=2)
+        assert total == 3 and [card['id'] for card in cards] == [hotels[2].id]
+        cards, total = await search_properties(city='tashkent', price_lte=50)
+        assert (cards, total) == ([], 0)
+        cards, total = await search_properties(page=1, per_page=10)
+        assert total == 4 and len(cards) == 4
+
+    run_in_database(test())
+
+
+def test_client_cancels_pending_booking():
+    import sqlalchemy as sa
+    from app import models
+    from app.core.dependencies import get_db
+    from app.crud import booking as crud_booking
+    from app.models import enums
+
+    async def test():
+        db = get_db()
+        hotel = await add_property()
+        booking = await add_booking(hotel, rooms=2)
+        other = await add_booking(hotel)
+
+        assert await crud_booking.delete_booking(booking.id, other.user_id, 'Plans changed') is None
+        assert await crud_booking.delete_booking(booking.id, booking.user_id, 'Plans changed') is True
+        rows = (await db.execute(sa.select(
+            models.Booking.id, models.Booking.status, models.Booking.canceled_by, models.BookedRoom.status,
+            models.BookedRoom.reason_of_cancellation
+        ).join(
+            models.BookedRoom, models.BookedRoom.booking_id == models.Booking.id
+        ).order_by(models.BookedRoom.id))).all()
+        canceled, pending = enums.BookingStatus.CANCELED, enums.BookingStatus.PENDING
+        assert rows == [
+            (booking.id, canceled, enums.BookingCanceledBy.CLIENT, canceled, 'Plans changed'),
+            (booking.id, canceled, enums.BookingCanceledBy.CLIENT, canceled, 'Plans changed'),
+            (other.id, pending, None, pending, None),
+        ]
+        stats = (await db.execute(sa.select(
+            models.PropertyDailyStats.orders, models.PropertyDailyStats.pending, models.PropertyDailyStats.canceled
+        ))).all()
+        assert stats == [(2, 1, 1)]
+
+    run_in_database(test())
+
+
+def test_dashboard_widgets_sum_the_daily_rows():
+    from datetime import timedelta
+    from app import models
+    from app.core.conf import settings
+    from app.core.dependencies import get_db
+    from app.crud import booking as crud_booking
+    from app.models import enums
+
+    async def test():
+        db = get_db()
+        today = settings.datetime.date()
+        first, second, other = await add_property('A'), await add_property('B'), await add_property('C')
+        for property_, days_ago, figures in [
+            (first, 0, dict(orders=2, pending=1, revenue=300.0, fees=30.0)),
+            (first, 10, dict(orders=1, revenue=100.0, fees=10.0)),
+            (second, 1, dict(orders=1, active=1, revenue=50.0, fees=5.0)),
+            (other, 0, dict(orders=5, pending=5, revenue=500.0)),
+        ]:
+            day = today - timedelta(days=days_ago)
+            db.add(models.PropertyDailyStats(property_id=property_.id, date=day, **figures))
+        await db.flush()
+        ids = [first.id, second.id]
+
+        orders = await crud_booking.get_orders_statistics(ids)
+        assert {key: orders[key] for key in ('total_orders', 'last_30_days', 'yesterday', 'today')} == dict(
+            total_orders=4, last_30_days=4, yesterday=1, today=2
+        )
+        assert [(row['property_id'], row['total_orders']) for row in orders['properties']] == [
+            (first.id, 3), (second.id, 1)
+        ]
+        bookings = await crud_booking.get_booking_statistics(enums.CountByDays.LAST_WEEK, ids)
+        assert (bookings['total_booking'], bookings['booked'], bookings['reside']) == (3, 1, 1)
+        accounting = await crud_booking.get_accounting(ids, enums.CountByDays.TODAY)
+        assert (accounting['total'], accounting['withdraw'], accounting['profit']) == (300.0, 30.0, 270.0)
+        assert [(row['property_id'], row['total']) for row in accounting['properties']] == [
+            (first.id, 300.0), (second.id, 0)
+        ]
+
+        summary = await crud_booking.get_dashboard_summary(ids, enums.CountByDays.LAST_WEEK)
+        assert summary == dict(
+            orders=orders,
+            bookings=bookings,
+            accounting=await crud_booking.get_accounting(ids, enums.CountByDays.LAST_WEEK),
+        )
+        assert summary['accounting']['profit'] == 315.0
+        empty = await crud_booking.get_dashboard_summary([], enums.CountByDays.LAST_WEEK)
+        assert empty['orders']['properties'] == [] and empty['accounting']['properties'] == []
+
+    run_in_database(test())
+
+
+def test_merchant_scope_covers_owned_properties_only():
+    from types import SimpleNamespace
+    from fastapi import HTTPException
+    from app import models
+    from app.api import deps
+    from app.core.dependencies import get_db
+    from app.crud import transaction as crud_transaction
+    from app.models import enums
+
+    async def test():
+        db = get_db()
+        dashboard, stranger = models.MerchantDashboard(title='A', chief_id=1), models.MerchantDashboard(chief_id=2)
+        db.add_all([dashboard, stranger])
+        await db.flush()
+        first = await add_property('A', added_by_id=dashboard.id)
+        second = await add_property('B', added_by_id=dashboard.id)
+        foreign = await add_property('C', added_by_id=stranger.id)
+        dashboard.default_property_id = second.id
+
+        def scope(property_ids=None, all_properties=False, dashboard_=dashboard):
+            return deps.get_property_ids(property_ids, all_properties, SimpleNamespace(dashboard=dashboard_))
+
+        assert await scope(all_properties=True) == [first.id, second.id]
+        assert await scope([second.id, second.id]) == [second.id]
+        assert await scope() == [second.id]
+        assert await scope(dashboard_=None) == []
+        with pytest.raises(HTTPException) as error:
+            await scope([first.id, foreign.id])
+        assert error.value.status_code == 403
+
+        for property_id, dashboard_id in [(first.id, dashboard.id), (foreign.id, stranger.id), (None, dashboard.id)]:
+            db.add(models.Transaction(
+                title=enums.TransactionTitle.FOR_SERVICE, status=enums.TransactionStatus.SUCCESS, amount=-10.0,
+                balance=0, property_id=property_id, dashboard_id=dashboard_id
+            ))
+        await db.flush()
+        query = crud_transaction.get_all_transactions_by_property_id(await scope(all_properties=True), dashboard.id)
+        transactions = (await db.execute(query)).scalars().all()
+        assert sorted(transaction.property_id or 0 for transaction in transactions) == [0, first.id]
+
+    run_in_database(test())
+
+
+def test_refresh_booking_stats_recomputes_the_days_of_the_bookings():
+    from datetime import timedelta
+    import sqlalchemy as sa
+    from app import models
+    from app.core.conf import settings
+    from app.core.dependencies import get_db
+    from app.crud import stats as crud_stats
+    from app.models import enums
+
+    async def test():
+        db = get_db()
+        now = settings.datetime
+        today = now.date()
+        hotel, other = await add_property('A'), await add_property('B')
+        dashboard = models.MerchantDashboard(title='A', chief_id=1)
+        db.add(dashboard)
+        bookings = [
+            await add_booking(hotel, status=status, price=100.0, created_at=now)
+            for status in enums.BookingStatus
+        ]
+        earlier = await add_booking(hotel, price=40.0, created_at=now - timedelta(days=1))
+        untouched = await add_booking(other, created_at=now)
+        for title, amount in [(enums.TransactionTitle.FOR_SERVICE, -10.0),
+                              (enums.TransactionTitle.TOP_UP_THE_BALANCE, 500.0)]:
+            db.add(models.Transaction(
+                title=title, status=enums.TransactionStatus.SUCCESS, amount=amount, balance=0,
+                property_id=hotel.id, dashboard=dashboard
+            ))
+
+        async def daily_rows():
+            stats = models.PropertyDailyStats
+            rows = (await db.execute(sa.select(stats).order_by(stats.property_id, stats.date))).scalars().all()
+            return [(row.property_id, row.date, *(getattr(row, figure) for figure in crud_stats.FIGURES))
+                    for row in rows]
+
+        await crud_stats.refresh_booking_stats()
+        assert await daily_rows() == []
+
+        await crud_stats.refresh_booking_stats(*(booking.id for booking in bookings), earlier.id)
+        # orders, pending, confirmed, active, closed, canceled, revenue (closed only), fees
+        assert await daily_rows() == [
+            (hotel.id, today - timedelta(days=1), 1, 1, 0, 0, 0, 0, 0, 0),
+            (hotel.id, today, 5, 1, 1, 1, 1, 1, 100.0, -10.0),
+        ]
+
+        bookings[0].status = enums.BookingStatus.CLOSED
+        await crud_stats.refresh_booking_stats(bookings[0].id)
+        assert (await daily_rows())[1] == (hotel.id, today, 5, 0, 1, 1, 2, 1, 200.0, -10.0)
+        assert untouched.property_id not in {row[0] for row in await daily_rows()}
+
+    run_in_database(test())
+
+
+def test_lifecycle_moves_bookings_whose_time_has_come(monkeypatch):
+    from datetime import datetime, time, timedelta
+    import sqlalchemy as sa
+    from app import models
+    from app.core.conf import settings
+    from app.core.dependencies import get_db
+    from app.crud import lifecycle as crud_lifecycle
+    from app.models import enums
+
+    monkeypatch.setattr(settings, 'DEBUG', False)
+
+    async def test():
+        now = settings.datetime
+        today = settings.timezone.localize(datetime.combine(now.date(), time()))
+        hotel = await add_property()
+        pending, confirmed = enums.BookingStatus.PENDING, enums.BookingStatus.CONFIRMED
+        active, canceled = enums.BookingStatus.ACTIVE, enums.BookingStatus.CANCELED
+        for name, status, booked_from, booked_to, created_at in [
+            ('today', pending, today, today + timedelta(days=2), now),
+            ('yesterday', pending, today - timedelta(days=1), today + timedelta(days=1), now),
+            ('on hold too long', pending, today + timedelta(days=5), today + timedelta(days=6),
+             now - timedelta(seconds=settings.BOOKING_PENDING_HOLD + 60)),
+            ('arriving', confirmed, now - timedelta(hours=1), today + timedelta(days=2), now),
+            ('coming', confirmed, today + timedelta(days=1), today + timedelta(days=2), now),
+            ('leaving', active, today - timedelta(days=2), now - timedelta(hours=1), now),
+        ]:
+            await add_booking(hotel, name, status, booked_from, booked_to, created_at=created_at)
+
+        assert await crud_lifecycle.run_lifecycle() == dict(expired=2, activated=1, closed=1)
+        rows = (await get_db().execute(sa.select(
+            models.Booking.name, models.Booking.status, models.BookedRoom.status
+        ).join(
+            models.BookedRoom, models.BookedRoom.booking_id == models.Booking.id
+        ))).all()
+        assert {name: (status, room_status) for name, status, room_status in rows} == {
+            'today': (pending, pending),
+            'yesterday': (canceled, canceled),
+            'on hold too long': (canceled, canceled),
+            'arriving': (active, active),
+            'coming': (confirmed, confirmed),
+            'leaving': (enums.BookingStatus.CLOSED, enums.BookingStatus.CLOSED),
+        }
+        # the expired bookings are canceled by the system and their guests told so
+        expired = (await get_db().execute(sa.select(models.Booking.id, models.User.phone).join(
+            models.User, models.User.id == models.Booking.user_id
+        ).where(
+            models.Booking.canceled_by == enums.BookingCanceledBy.SYSTEM,
+            models.Booking.reason_of_cancellation == 'Expired',
+        ))).all()
+        assert len(expired) == 2
+        messages = (await get_db().execute(sa.select(models.SmsOutbox.phone, models.SmsOutbox.dedupe_key))).all()
+        assert sorted(messages) == sorted(
+            (phone, f'{enums.SmsKind.ORDER_CANCELED.value}:{booking_id}') for booking_id, phone in expired
+        )
+        assert await crud_lifecycle.run_lifecycle() == dict(expired=0, activated=0, closed=0)
+
+    run_in_database(test())
+
+
+@pytest.fixture
+def accepting(monkeypatch):
+    """
+    Runs a test of accepting the pending booking of a hotel with a room template of 100 (10% fee) and one of 80
+    (no fee), two rooms each, one booked room of each, and a merchant balance of 100
+    """
+    from app import models
+    from app.core.dependencies import get_db
+    from app.models import enums
+    from app.utils import redis_helper, search_cache, withdrawal_rules
+    from app.utils.withdrawal_rules import WithdrawalRulesCache
+
+    fake_redis = FakeRedis()
+    for module in (redis_helper, search_cache, withdrawal_rules):
+        monkeypatch.setattr(module, 'redis', fake_redis)
+    monkeypatch.setattr(WithdrawalRulesCache, '_rules', None)
+    monkeypatch.setattr(WithdrawalRulesCache, '_version', None)
+
+    def run(test):
+        async def setup():
+            db = get_db()
+            dashboard = models.MerchantDashboard(title='A', chief_id=1, balance=100.0)
+            db.add(dashboard)
+            await db.flush()
+            hotel = await add_property(prices=(100.0, 80.0), rooms=2, added_by_id=dashboard.id)
+            charged, free = hotel.rooms
+            free.type = models.RoomType(type='Single', max_number_of_guests=1)
+            await db.flush()
+            for template, amount in [(charged, 10.0), (free, 0.0)]:
+                db.add(models.WithdrawalAmount(
+                    room_type_id=template.type_id, amount=amount, amount_unit=enums.BillingUnit.PERCENTAGE_VALUE,
+                    amount_for_resident=amount, amount_unit_for_resident=enums.BillingUnit.PERCENTAGE_VALUE
+                ))
+            booking = await add_booking(hotel)
+            booking.rooms.append(models.BookedRoom(
+                booked_from=booking.booked_from, booked_to=booking.booked_to, property_id=hotel.id, price=80.0,
+                property_room_template_id=free.id
+            ))
+            # the failed accepts roll back
+            await db.commit()
+            return await test(dashboard, hotel, booking)
+
+        run_in_database(setup())
+    return run
+
+
+async def accept_order(hotel, booking, *rooms, booked_room_ids=None):
+    """Accepts ``booking`` of ``hotel`` with the physical ``rooms``, one per booked room in order"""
+    from app import schemas
+    from app.crud import booking as crud_booking
+    from app.models import enums
+
+    booked_room_ids = booked_room_ids or [room.id for room in booking.rooms]
+    return await crud_booking.accept_or_cancel_order(
+        property_id=hotel.id, added_by_id=hotel.added_by_id, booking_id=booking.id,
+        obj_in=[schemas.AcceptOrderWithRoom(booked_room_id=booked_room_id, room_id=room.id)
+                for booked_room_id, room in zip(booked_room_ids, rooms)],
+        accept_or_cancel=enums.AcceptOrCancel.ACCEPT
+    )
+
+
+async def accepted_state(booking):
+    """Status of the booking, the rooms assigned to its booked rooms and the merchant's ledger"""
+    import sqlalchemy as sa
+    from app import models
+    from app.core.dependencies import get_db
+
+    db = get_db()
+    status = (await db.execute(sa.select(models.Booking.status).where(models.Booking.id == booking.id))).scalar()
+    rooms = (await db.execute(sa.select(models.BookedRoom.property_room_id).where(
+        models.BookedRoom.booking_id == booking.id
+    ).order_by(models.BookedRoom.id))).scalars().all()
+    ledger = (await db.execute(sa.select(models.Transaction.amount, models.Transaction.balance))).all()
+    return status, rooms, ledger
+
+
+def test_accept_order_needs_a_room_for_every_booked_room(accepting):
+    from app.models import enums
+
+    async def test(dashboard, hotel, booking):
+        charged, free = hotel.rooms
+        first, other = charged.rooms[0], free.rooms[0]
+        assert (await accept_order(hotel, booking, first))[:2] == (True, 400)
+        assert (await accept_order(hotel, booking, first, first))[:2] == (True, 400)
+        booked_room_ids = [booking.rooms[0].id, booking.rooms[0].id + 100]
+        assert (await accept_order(hotel, booking, first, other, booked_room_ids=booked_room_ids))[:2] == (True, 400)
+        assert await accepted_state(booking) == (enums.BookingStatus.PENDING, [None, None], [])
+
+    accepting(test)
+
+
+def test_accept_order_needs_rooms_of_the_booked_templates(accepting):
+    from app.models import enums
+
+    async def test(dashboard, hotel, booking):
+        charged, free = hotel.rooms
+        foreign = await add_property('B', rooms=2)
+        assert (await accept_order(hotel, booking, free.rooms[0], charged.rooms[0]))[:2] == (True, 400)
+        assert (await accept_order(hotel, booking, charged.rooms[0], foreign.rooms[0].rooms[0]))[:2] == (True, 400)
+        assert await accepted_state(booking) == (enums.BookingStatus.PENDING, [None, None], [])
+
+    accepting(test)
+
+
+def test_accept_order_assigns_rooms_without_a_fee(accepting):
+    from datetime import date
+    import sqlalchemy as sa
+    from app import models
+    from app.core.dependencies import get_db
+    from app.crud import inventory as crud_inventory
+    from app.models import enums
+
+    async def test(dashboard, hotel, booking):
+        charged, free = hotel.rooms
+        rooms = charged.rooms[1], free.rooms[0]
+        is_accepted, status_code, user = await accept_order(hotel, booking, *rooms)
+        assert (is_accepted, status_code, user.id) == (True, 201, booking.user_id)
+        # only the room with a fee is charged, 10% of 100
+        assert await accepted_state(booking) == (
+            enums.BookingStatus.CONFIRMED, [room.id for room in rooms], [(-10.0, 90.0)]
+        )
+        busy = (await get_db().execute(sa.select(models.PropertyRoomStatus.property_room_id).where(
+            models.PropertyRoomStatus.status == enums.RoomStatus.BUSY
+        ))).scalars().all()
+        assert sorted(busy) == sorted(room.id for room in rooms)
+        for template in hotel.rooms:
+            assert await crud_inventory.get_free_rooms_count(template.id, date(2030, 1, 1), date(2030, 1, 3)) == 1
+
+        # a second accept finds the booking confirmed
+        assert (await accept_order(hotel, booking, *rooms))[:2] == (True, 409)
+
+    accepting(test)
+
+
+def test_stay_nights_and_nightly_rates():
+    from datetime import date, datetime
+    from app.core.conf import settings
+    from app.crud import pricing as crud_pricing
+    from app.crud.inventory import stay_nights
+    from app.models import enums
+
+    assert stay_nights(date(2024, 1, 30), date(2024, 2, 2)) == [date(2024, 1, 30), date(2024, 1, 31), date(2024, 2, 1)]
+    assert stay_nights(date(2024, 1, 1), date(2024, 1, 1)) == [date(2024, 1, 1)]
+    price = crud_pricing.RoomPrice(1, 2, False, nightly=[100.0, 80.0], discount=20.0)
+    assert (price.nights, price.total, price.price) == (2, 180.0, 90.0)
+
+    async def test():
+        hotel = await add_property(prices=(100.0,))
+        template = hotel.rooms[0]
+        template.max_number_of_guests, template.price_for_resident = 3, 80.0
+        # 10% off on the second night only, in local time
+        template.price_discount_unit, template.price_discount_amount = enums.BillingUnit.PERCENTAGE_VALUE, 10
+        template.price_discount_from = settings.timezone.localize(datetime(2030, 1, 2))
+        template.price_discount_until = settings.timezone.localize(datetime(2030, 1, 2, 23, 59))
+        template.price_for_less_people = [
+            dict(number_of_people=1, discount_unit=enums.BillingUnit.FIXED_VALUE.value, discount_amount=30,
+                 is_active=True),
+            dict(number_of_people=2, discount_unit=enums.BillingUnit.FIXED_VALUE.value, discount_amount=10,
+                 is_active=False),
+        ]
+        await add_property('Other')
+
+        rooms = [(template.id, 3, False), (template.id, 1, False), (template.id, 2, False), (template.id, 3, True)]
+        prices = await crud_pricing.get_room_prices(rooms, date(2030, 1, 1), date(2030, 1, 3))
+        assert {key: (price.nightly, price.discount) for key, price in prices.items()} == {
+            (template.id, 3, False): ([100.0, 90.0], 10.0),
+            (template.id, 1, False): ([70.0, 70.0], 60.0),
+            (template.id, 3, True): ([80.0, 80.0], 0),
+        }
+        assert await crud_pricing.get_room_prices(
+            rooms, date(2030, 1, 1), date(2030, 1, 3), property_id=hotel.id + 1
+        ) == {}
+
+    run_in_database(test())
+
+
+def test_quote_prices_a_cart_without_writing():
+    from datetime import datetime, timezone
+    import sqlalchemy as sa
+    from app import models, schemas
+    from app.core.dependencies import get_db
+    from app.crud import booking as crud_booking
+
+    async def test():
+        hotel = await add_property(prices=(100.0, 60.0))
+        double, single = hotel.rooms
+        booking_in = schemas.BookingCreate(
+            property_id=hotel.id, name='Guest', booked_from=datetime(2030, 1, 1, 9, tzinfo=timezone.utc),
+            booked_to=datetime(2030, 1, 4, 7, tzinfo=timezone.utc), rooms=[
+                schemas.BookedRoomCreate(room_id=double.id, bed_type_id=1, number_of_people=2),
+                schemas.BookedRoomCreate(room_id=single.id, bed_type_id=1, number_of_people=2, for_resident=True),
+            ]
+        )
+        quote = schemas.BookingQuote(**await crud_booking.quote(booking_in))
+        assert (quote.nights, quote.total_number_of_people, quote.total_price) == (3, 4, 480.0)
+        assert [(room.room_id, room.price, room.nightly_prices) for room in quote.rooms] == [
+            (double.id, 100.0, [100.0] * 3), (single.id, 60.0, [60.0] * 3)
+        ]
+        assert (await get_db().execute(sa.select(sa.func.count(models.Booking.id)))).scalar() == 0
+
+        booking_in.rooms[0].number_of_people = 3
+        assert await crud_booking.quote(booking_in) is None
+
+    run_in_database(test())
+
+
+def test_booking_rooms_keep_their_beds():
+    from datetime import datetime, timezone
+    import sqlalchemy as sa
+    from app import models, schemas
+    from app.core.dependencies import get_db
+    from app.crud import booking as crud_booking
+
+    async def test():
+        db = get_db()
+        hotel = await add_property(prices=(100.0, 60.0, 80.0))
+        user = models.User()
+        beds = [models.BedType(type=name) for name in ('Single', 'Double', 'Twin')]
+        db.add_all([user, *beds])
+        await db.flush()
+        booking_in = schemas.BookingCreate(
+            property_id=hotel.id, name='Guest', booked_from=datetime(2030, 1, 1, 9, tzinfo=timezone.utc),
+            booked_to=datetime(2030, 1, 3, 7, tzinfo=timezone.utc), rooms=[
+                schemas.BookedRoomCreate(
+                    room_id=template.id, bed_type_id=bed.id, bed_for_children=bed.type == 'Twin', number_of_people=2
+                )
+                for template, bed in zip(hotel.rooms, beds)
+            ]
+        )
+        booking = await crud_booking.create(user.id, booking_in)
+        assert (booking.total_price, booking.total_number_of_people) == (480.0, 6)
+
+        rooms = (await db.execute(sa.select(
+            models.BookedRoom.property_room_template_id, models.BookedRoom.price,
+            models.BookedRoomBed.bed_type_id, models.BookedRoomBed.bed_for_children
+        ).join(
+            models.BookedRoomBed, models.BookedRoomBed.booked_room_id == models.BookedRoom.id
+        ).where(
+            models.BookedRoom.booking_id == booking.id
+        ).order_by(models.BookedRoom.price))).all()
+        assert rooms == [
+            (hotel.rooms[1].id, 60.0, beds[1].id, False),
+            (hotel.rooms[2].id, 80.0, beds[2].id, True),
+            (hotel.rooms[0].id, 100.0, beds[0].id, False),
+        ]
+
+    run_in_database(test())
+
+
+def test_with_draw(monkeypatch):
+    from types import SimpleNamespace
+    from app import models
+    from app.core.dependencies import get_db
+    from app.crud import booking as crud_booking
+    from app.models import enums
+    from app.utils import redis_helper, withdrawal_rules
+    from app.utils.withdrawal_rules import WithdrawalRulesCache
+
+    rule = dict(amount=50.0, amount_unit=enums.BillingUnit.FIXED_VALUE,
+                amount_for_resident=10.0, amount_unit_for_resident=enums.BillingUnit.PERCENTAGE_VALUE)
+    room = SimpleNamespace(price=300.0, for_resident=False, room=SimpleNamespace(type_id=3))
+    resident = SimpleNamespace(price=300.0, for_resident=True, room=SimpleNamespace(type_id=4))
+    assert crud_booking._with_draw(rule, room) == 50.0
+    assert crud_booking._with_draw(rule, resident) == 30.0
+    assert crud_booking._with_draw(None, room) == 1000
+
+    fake_redis = FakeRedis()
+    monkeypatch.setattr(withdrawal_rules, 'redis', fake_redis)
+    monkeypatch.setattr(redis_helper, 'redis', fake_redis)
+    monkeypatch.setattr(WithdrawalRulesCache, '_rules', None)
+    monkeypatch.setattr(WithdrawalRulesCache, '_version', None)
+
+    async def test():
+        db = get_db()
+        template = (await add_property()).rooms[0]
+        rule = models.WithdrawalAmount(room_type_id=template.type_id, **{
+            'amount': 50.0, 'amount_unit': enums.BillingUnit.FIXED_VALUE, 'amount_for_resident': 10.0,
+            'amount_unit_for_resident': enums.BillingUnit.PERCENTAGE_VALUE,
+        })
+        db.add(rule)
+        await db.flush()
+        rooms = [
+            SimpleNamespace(price=300.0, for_resident=for_resident, room=template) for for_resident in (False, True)
+        ]
+        assert await crud_booking.with_draw_amounts(rooms) == [(50.0, template.type_id), (30.0, template.type_id)]
+
+        rule.amount = 70.0
+        await db.flush()
+        # the rules are kept until a change of them is announced
+        assert (await crud_booking.with_draw_amounts(rooms))[0] == (50.0, template.type_id)
+        await WithdrawalRulesCache.invalidate()
+        assert (await crud_booking.with_draw_amounts(rooms))[0] == (70.0, template.type_id)
+        template.type_id = None
+        assert (await crud_booking.with_draw_amounts(rooms[:1])) == [(1000, None)]
+
+    run_in_database(test())
+
+
+def test_update_inventory_never_goes_below_zero():
+    from datetime import date, datetime
+    from app.core.dependencies import get_db
+    from app.crud import inventory as crud_inventory, search_index as crud_search_index
+
+    async def test():
+        db = get_db()
+        room_id = (await add_property(rooms=2)).rooms[0].id
+        await db.commit()
+
+        async def free(checkin=date(2030, 1, 1), checkout=date(2030, 1, 3)):
+            return await crud_inventory.get_free_rooms_count(room_id, checkin, checkout)
+
+        assert await free() == 2
+        assert await crud_inventory.reserve_rooms([room_id, room_id], date(2030, 1, 1), date(2030, 1, 3)) is True
+        await db.commit()
+        assert await free() == 0 and await free(date(2030, 1, 3), date(2030, 1, 4)) == 2
+        await crud_search_index.rebuild_search_index()
+        assert (await search_properties(checkin=datetime(2030, 1, 2), checkout=datetime(2030, 1, 3)))[1] == 0
+        assert (await search_properties(checkin=datetime(2030, 1, 3), checkout=datetime(2030, 1, 4)))[1] == 1
+
+        # the second night is full, the caller rolls the first one back
+        assert await crud_inventory.reserve_rooms([room_id], date(2030, 1, 2), date(2030, 1, 4)) is False
+        await db.rollback()
+        assert await free(date(2030, 1, 3), date(2030, 1, 4)) == 2
+        assert await crud_inventory.reserve_rooms([room_id] * 3, date(2030, 1, 5), date(2030, 1, 6)) is False
+        await db.rollback()
+
+        await crud_inventory.release_rooms([room_id], date(2030, 1, 1), date(2030, 1, 3))
+        assert await free() == 1
+
+    run_in_database(test())
+
+
+def test_export_streams_the_rows_batch_by_batch(monkeypatch):
+    import csv
+    import json
+    from sqlalchemy.ext.asyncio import AsyncSession
+    from app import models, schemas
+    from app.api.merchant.v1.transactions import TRANSACTION_EXPORT_COLUMNS
+    from app.core.dependencies import get_db
+    from app.crud import transaction as crud_transaction
+    from app.models import enums
+    from app.utils import export
+
+    async def test():
+        db = get_db()
+        # the export opens its own session, here on the connection of the test schema
+        monkeypatch.setattr(export, 'AsyncSessionLocal', lambda: AsyncSession(bind=db.bind))
+        monkeypatch.setattr(export.settings, 'EXPORT_BATCH_SIZE', 2)
+        dashboard = models.MerchantDashboard(title='A', chief_id=1)
+        hotel = await add_property()
+        db.add_all([
+            models.Transaction(
+                title=enums.TransactionTitle.FOR_SERVICE, status=enums.TransactionStatus.SUCCESS, order_id=n,
+                amount=-10.0, balance=100.0 - 10 * n, property_id=hotel.id, dashboard=dashboard
+            )
+            for n in range(1, 4)
+        ])
+        await db.flush()
+        query = crud_transaction.get_all_transactions_by_property_id([hotel.id], dashboard.id)
+
+        async def export_(export_format):
+            return [chunk async for chunk in export.stream_rows(
+                query, schemas.Transaction, TRANSACTION_EXPORT_COLUMNS, export_format
+            )]
+
+        chunks = await export_(enums.ExportFormat.CSV)
+        # the header, then one chunk per batch
+        assert len(chunks) == 3
+        rows = list(csv.DictReader(''.join(chunks).splitlines()))
+        assert list(rows[0]) == list(TRANSACTION_EXPORT_COLUMNS)
+        assert sorted((row['order_id'], row['title'], row['room_type'], row['balance']) for row in rows) == [
+            ('1', 'for_service', '', '90.0'), ('2', 'for_service', '', '80.0'), ('3', 'for_service', '', '70.0')
+        ]
+
+        chunks = await export_(enums.ExportFormat.NDJSON)
+        assert len(chunks) == 2
+        lines = [json.loads(line) for line in ''.join(chunks).splitlines()]
+        assert sorted((line['order_id'], line['status'], line['property_id']) for line in lines) == [
+            (n, 'success', hotel.id) for n in range(1, 4)
+        ]
+
+    run_in_database(test())
+
+
+def test_post_entries_keeps_running_balances():
+    import sqlalchemy as sa
+    from app import models
+    from app.core.dependencies import get_db
+    from app.crud import transaction as crud_transaction
+    from app.models import enums
+
+    async def test():
+        db = get_db()
+        dashboard = models.MerchantDashboard(title='A', chief_id=1, balance=100.0)
+        db.add(dashboard)
+        await db.flush()
+
+        def fee(amount):
+            return dict(title=enums.TransactionTitle.FOR_SERVICE, status=enums.TransactionStatus.SUCCESS, amount=amount)
+
+        async def ledger():
+            transaction = models.Transaction
+            return (await db.execute(sa.select(transaction.amount, transaction.balance).where(
+                transaction.dashboard_id == dashboard.id
+            ).order_by(transaction.id))).all()
+
+        async def balance():
+            return (await db.execute(sa.select(models.MerchantDashboard.balance).where(
+                models.MerchantDashboard.id == dashboard.id
+            ))).scalar()
+
+        assert await crud_transaction.post_entries(dashboard.id, [fee(-30.0), fee(-20.0)], min_balance=0) == 50.0
+        assert await ledger() == [(-30.0, 70.0), (-20.0, 50.0)] and await balance() == 50.0
+
+        # nothing is posted when the balance would fall below the minimum
+        assert await crud_transaction.post_entries(dashboard.id, [fee(-40.0), fee(-20.0)], min_balance=0) is None
+        assert len(await ledger()) == 2 and await balance() == 50.0
+        assert await crud_transaction.post_entries(dashboard.id, []) is None
+
+        # without a minimum the balance may go negative, a refund brings it back
+        assert await crud_transaction.post_entries(dashboard.id, [fee(-60.0), fee(15.0)]) == 5.0
+        assert (await ledger())[2:] == [(-60.0, -10.0), (15.0, 5.0)] and await balance() == 5.0
+
+    run_in_database(test())
+
+
+def test_refund_fees_skips_rooms_without_a_fee(monkeypatch):
+    import sqlalchemy as sa
+    from app import models
+    from app.core.dependencies import get_db
+    from app.crud import booking as crud_booking
+    from app.models import enums
+    from app.utils import redis_helper, withdrawal_rules
+    from app.utils.withdrawal_rules import WithdrawalRulesCache
+
+    fake_redis = FakeRedis()
+    monkeypatch.setattr(withdrawal_rules, 'redis', fake_redis)
+    monkeypatch.setattr(redis_helper, 'redis', fake_redis)
+    monkeypatch.setattr(WithdrawalRulesCache, '_rules', None)
+    monkeypatch.setattr(WithdrawalRulesCache, '_version', None)
+
+    async def test():
+        db = get_db()
+        dashboard = models.MerchantDashboard(title='A', chief_id=1, balance=0.0)
+        db.add(dashboard)
+        await db.flush()
+        hotel = await add_property(prices=(100.0, 80.0), added_by_id=dashboard.id)
+        charged, free = hotel.rooms
+        free.type = models.RoomType(type='Single', max_number_of_guests=1)
+        await db.flush()
+        for template, amount in [(charged, 10.0), (free, 0.0)]:
+            db.add(models.WithdrawalAmount(
+                room_type_id=template.type_id, amount=amount, amount_unit=enums.BillingUnit.PERCENTAGE_VALUE,
+                amount_for_resident=amount, amount_unit_for_resident=enums.BillingUnit.PERCENTAGE_VALUE
+            ))
+        booking = await add_booking(hotel, status=enums.BookingStatus.CANCELED)
+        booking.rooms[0].room = charged
+        booking.rooms.append(models.BookedRoom(
+            booked_from=booking.booked_from, booked_to=booking.booked_to, property_id=hotel.id, price=80.0,
+            status=booking.status, room=free
+        ))
+        await db.flush()
+
+        await crud_booking.refund_fees(booking)
+        entries = (await db.execute(sa.select(
+            models.Transaction.amount, models.Transaction.room_type_id, models.Transaction.balance
+        ))).all()
+        assert entries == [(10.0, charged.type_id, 10.0)]
+
+    run_in_database(test())
+
+
+def test_admin_posts_balance_changes_as_top_ups(monkeypatch):
+    import asyncio
+    from types import SimpleNamespace
+    from sqladmin import ModelView
+    from app.admin import merchant_user
+
+    saved, posted = [], []
+
+    async def update_model(self, pk, data):
+        saved.append(dict(data))
+        return SimpleNamespace(id=pk, balance=100.0)
+
+    async def insert_model(self, data):
+        saved.append(dict(data))
+        return SimpleNamespace(id=4, balance=0)
+
+    async def top_up_balance(dashboard_id, amount):
+        posted.append((dashboard_id, amount))
+        return 250.0
+
+    monkeypatch.setattr(ModelView, 'update_model', update_model)
+    monkeypatch.setattr(ModelView, 'insert_model', insert_model)
+    monkeypatch.setattr(merchant_user, 'top_up_balance', top_up_balance)
+    view = object.__new__(merchant_user.MerchantDashboard)
+
+    model = asyncio.run(view.update_model(3, {'title': 'Hotel', 'balance': 250}))
+    assert saved == [{'title': 'Hotel'}] and posted == [(3, 150.0)] and model.balance == 250.0
+    asyncio.run(view.update_model(3, {'title': 'Hotel', 'balance': 100}))
+    assert posted == [(3, 150.0)]
+    asyncio.run(view.insert_model({'title': 'New', 'balance': 250}))
+    assert saved[-1] == {'title': 'New'} and posted[-1] == (4, 250.0)
+
+
+def test_time_buckets():
+    from datetime import date
+    from app.crud.stats import bucket_start, next_bucket
+    from app.models import enums
+
+    day = date(2024, 2, 29)
+    assert bucket_start(day, enums.TimeBucket.DAY) == day
+    assert next_bucket(day, enums.TimeBucket.DAY) == date(2024, 3, 1)
+    assert bucket_start(day, enums.TimeBucket.WEEK) == date(2024, 2, 26)
+    assert next_bucket(date(2024, 2, 26), enums.TimeBucket.WEEK) == date(2024, 3, 4)
+    assert bucket_start(day, enums.TimeBucket.MONTH) == date(2024, 2, 1)
+    assert next_bucket(date(2024, 1, 1), enums.TimeBucket.MONTH) == date(2024, 2, 1)
+    assert next_bucket(date(2024, 12, 1), enums.TimeBucket.MONTH) == date(2025, 1, 1)
+
+
+def test_series_counts_rooms_of_live_templates_only():
+    from datetime import date
+    from app import models
+    from app.core.dependencies import get_db
+    from app.crud import inventory as crud_inventory, stats as crud_stats
+    from app.models import enums
+
+    async def test():
+        db = get_db()
+        hotel, other = await add_property('A', prices=(100.0, 80.0), rooms=2), await add_property('B', rooms=2)
+        live, deleted = hotel.rooms
+        deleted.is_deleted = True
+        await crud_inventory.reserve_rooms([live.id], date(2030, 1, 1), date(2030, 1, 3))
+        await crud_inventory.reserve_rooms([deleted.id], date(2030, 1, 1), date(2030, 1, 2))
+        await crud_inventory.reserve_rooms([other.rooms[0].id], date(2030, 1, 1), date(2030, 1, 8))
+        for property_, day, figures in [
+            (hotel, date(2030, 1, 1), dict(orders=2, revenue=200.0, fees=-20.0)),
+            (hotel, date(2030, 1, 8), dict(orders=1, revenue=100.0)),
+            (other, date(2030, 1, 1), dict(orders=9, revenue=900.0)),
+        ]:
+            db.add(models.PropertyDailyStats(property_id=property_.id, date=day, **figures))
+        await db.flush()
+
+        # weeks start on Monday, 1 January 2030 is a Tuesday: the first week has six nights within the range
+        series = await crud_stats.get_series([hotel.id], date(2030, 1, 1), date(2030, 1, 13), enums.TimeBucket.WEEK)
+        assert series == [
+            dict(bucket=date(2029, 12, 31), bookings=2, revenue=200.0, fees=-20.0, occupancy_rate=2 / 12),
+            dict(bucket=date(2030, 1, 7), bookings=1, revenue=100.0, fees=0, occupancy_rate=0),
+        ]
+        series = await crud_stats.get_series([hotel.id], date(2030, 1, 2), date(2030, 1, 3), enums.TimeBucket.DAY)
+        assert [(row['bucket'], row['occupancy_rate']) for row in series] == [
+            (date(2030, 1, 2), 0.5), (date(2030, 1, 3), 0)
+        ]
+        series = await crud_stats.get_series([], date(2030, 1, 1), date(2030, 1, 31), enums.TimeBucket.MONTH)
+        assert series == [dict(bucket=date(2030, 1, 1), bookings=0, revenue=0, fees=0, occupancy_rate=None)]
+
+    run_in_database(test())
+
+
+def test_only_read_requests_filter_translations():
+    import asyncio
+    from types import SimpleNamespace
+    import sqlalchemy as sa
+    from sqlalchemy.orm.util import LoaderCriteriaOption
+    from app import models
+    from app.core.dependencies import set_db, get_db
+    from app.models.base import filter_translations
+
+    async def session_info(method):
+        dependency = set_db(SimpleNamespace(method=method))
+        await dependency.__anext__()
+        info = dict(get_db().sync_session.info)
+        await dependency.aclose()
+        return info
+
+    assert asyncio.run(session_info('GET')) == {'localized': True}
+    assert asyncio.run(session_info('PUT')) == {'localized': False}
+
+    def options(localized, **execution_options):
+        state = SimpleNamespace(
+            session=SimpleNamespace(info={'localized': localized}), is_select=True, is_column_load=False,
+            is_relationship_load=False, execution_options=execution_options, statement=sa.select(models.Property)
+        )
+        filter_translations(state)
+        return [option for option in state.statement._with_options if isinstance(option, LoaderCriteriaOption)]
+
+    assert len(options(True)) == 1
+    assert options(False) == [] and options(True, all_translations=True) == []
+
+
+def test_search_index_follows_the_live_templates():
+    import sqlalchemy as sa
+    from app import models
+    from app.core.dependencies import get_db
+    from app.crud import search_index as crud_search_index
+    from app.models import enums
+
+    async def test():
+        db = get_db()
+        wifi = models.Service(service_name='Wi-Fi')
+        hotel = await add_property(
+            'A', prices=(100.0, 80.0), rooms=3, services=[models.PropertyService(service=wifi)],
+            rating=models.PropertyRating(avg=8.5)
+        )
+        hotel.rooms[1].is_deleted = True
+        await db.flush()
+
+        async def index_row():
+            await crud_search_index.refresh_search_index(hotel.id)
+            return (await db.execute(
+                sa.select(models.PropertySearchIndex).execution_options(populate_existing=True)
+            )).scalar_one()
+
+        row = await index_row()
+        assert (row.property_id, row.city_slug, row.is_active) == (hotel.id, 'tashkent', enums.PropertyStatus.ACTIVE)
+        assert (row.min_price, row.max_number_of_rooms, row.service_ids, row.rating) == (100.0, 3, [wifi.id], 8.5)
+
+        hotel.is_active = enums.PropertyStatus.IN_ACTIVE
+        hotel.rooms[1].is_deleted = False
+        await db.flush()
+        row = await index_row()
+        assert (row.is_active, row.min_price) == (enums.PropertyStatus.IN_ACTIVE, 80.0)
+
+    run_in_database(test())
+
+
+def test_location_search():
+    from app.crud import search_index as crud_search_index
+    from app.models import enums
+
+    async def test():
+        centre = await add_property('Centre', latitude=41.31, longitude=69.28)
+        north = await add_property('North', latitude=41.355, longitude=69.28)  # 5 km away
+        await add_property('Samarkand', latitude=39.65, longitude=66.96)
+        await crud_search_index.rebuild_search_index()
+
+        async def found(**filters):
+            return [card['id'] for card in (await search_properties(**filters))[0]]
+
+        assert await found(latitude=41.31, longitude=69.28, radius=3) == [centre.id]
+        assert await found(
+            latitude=41.36, longitude=69.28, radius=10, sort_by=enums.PropertySortBy.DISTANCE
+        ) == [north.id, centre.id]
+        assert await found(bbox=(69, 41, 70, 42)) == [centre.id, north.id]
+        assert await found(
+            bbox=(69, 41, 70, 42), sort_by=enums.PropertySortBy.DISTANCE, sort_type=enums.SortType.DESC
+        ) == [centre.id, north.id]
+
+    run_in_database(test())
+
+
+def test_property_facets():
+    from datetime import datetime
+    from app import models
+    from app.crud import property as crud_property, search_index as crud_search_index
+    from app.models import enums
+
+    async def test():
+        wifi, pool = models.Service(service_name='Wi-Fi'), models.Service(service_name='Pool')
+        await add_property('A', services=[models.PropertyService(service=wifi)], is_breakfast_served=True)
+        await add_property('B', services=[models.PropertyService(service=wifi), models.PropertyService(service=pool)])
+        await add_property('C', star_rating=enums.PropertyStarRating.FIVE, city_centre_distance=5)
+        await add_property('D', city='samarkand')
+        await crud_search_index.rebuild_search_index()
+
+        filters = dict(
+            q=None, breakfast=None, property_type=None, star_rating=None, city='tashkent', city_centre_distance=None,
+            services=None, price_gte=0, price_lte=10 ** 6, checkin=datetime(2030, 1, 1), checkout=datetime(2030, 1, 3),
+            rooms=1, adults=1, is_resident=False, children=0, ratings=None,
+        )
+        facets = await crud_property.get_property_facets(**filters)
+        assert facets['total'] == 3
+        stars = enums.PropertyStarRating
+        assert facets['star_rating'] == {stars.THREE.value: 2, stars.FIVE.value: 1}
+        assert facets['service'] == {str(wifi.id): 2, str(pool.id): 1}
+        assert facets['breakfast'] == {'true': 1, 'false': 2}
+        assert facets['city_centre_distance'] == {
+            enums.CityCentreDistance.ONE_THREE.value: 2, enums.CityCentreDistance.FOUR_SIX.value: 1
+        }
+        facets = await crud_property.get_property_facets(**{**filters, 'services': [pool.id]})
+        assert (facets['total'], facets['service']) == (1, {str(wifi.id): 1, str(pool.id): 1})
+
+    run_in_database(test())
+
+
+def test_property_cards():
+    from app import models, schemas
+    from app.core.dependencies import get_db
+    from app.crud import property as crud_property, search_index as crud_search_index
+    from app.crud.favourite import crud_favourite
+
+    async def test():
+        services = [models.PropertyService(service=models.Service(service_name=name)) for name in 'ABCD']
+        hotel = await add_property(
+            'Hotel', prices=(120.0, 90.0), services=services, rating=models.PropertyRating(avg=9)
+        )
+        hostel = await add_property('Hostel', prices=(30.0,))
+        user = models.User()
+        get_db().add(user)
+        await crud_search_index.rebuild_search_index()
+
+        assert await crud_favourite.favourite_cards(user.id) == []
+        for property_id in (hotel.id, hostel.id):
+            await crud_favourite.create_or_delete_favourite(property_id=property_id, user_id=user.id)
+        cards = [schemas.PropertyCard(**card) for card in await crud_favourite.favourite_cards(user.id)]
+        assert [card.id for card in cards] == [hostel.id, hotel.id]
+        card = cards[1]
+        assert (card.name, card.type, card.city, card.city_slug) == ('Hotel', 'Hotel', 'Tashkent', 'tashkent')
+        assert (card.min_price, card.rating, card.services, card.photo) == (90.0, 9, ['A', 'B', 'C'], None)
+        assert (await crud_property.get_property_cards([hotel.id], rooms=2))[0]['min_price'] == 180.0
+
+    run_in_database(test())
+
+
+def test_localized_sessions_load_the_current_translations():
+    import sqlalchemy as sa
+    from app import models
+    from app.core.dependencies import get_db
+    from app.models import enums
+    from app.utils.i18n import translation
+
+    async def test():
+        db = get_db()
+        hotel = await add_property('Hotel', translations=[
+            models.PropertyTranslation(language=language, is_default=language == enums.Languages.EN,
+                                       description=language.value, address=language.value)
+            for language in enums.Languages
+        ])
+        db.expunge_all()
+
+        async def languages(localized):
+            db.info['localized'] = localized
+            with translation.use_locale('ru'):
+                query = sa.select(models.Property).where(models.Property.id == hotel.id)
+                property_ = (await db.execute(query.execution_options(populate_existing=True))).scalar_one()
+            return {property_translation.language for property_translation in property_.translations}
+
+        assert await languages(True) == {enums.Languages.RU, enums.Languages.EN}
+        assert await languages(False) == set(enums.Languages)
+
+    run_in_database(test())
+
+
+def test_relevance_sort():
+    import sqlalchemy as sa
+    from app import models
+    from app.crud import property as crud_property
+    from app.models import enums
+
+    def order_by(sort_by, q=None):
+        query = crud_property.filter_by_sort_type(
+            sa.select(models.PropertySearchIndex), enums.SortType.ASC, sort_by, q=q
+        )
+        return [str(clause) for clause in query._order_by_clauses]
+
+    ranked = order_by(enums.PropertySortBy.RELEVANCE, q='tashkent')
+    assert len(ranked) == 3 and ranked[0].endswith(' DESC') and 'name' in ranked[0]
+    assert ranked[2] == 'property_search_index.property_id'
+    assert order_by(enums.PropertySortBy.RELEVANCE) == [
+        'property_search_index.rating DESC NULLS LAST', 'property_search_index.property_id'
+    ]
+    assert order_by(enums.PropertySortBy.RATING, q='tashkent')[0] == 'property_search_index.rating ASC NULLS LAST'
+
+
+def test_search_cache_key():
+    from datetime import datetime
+    from app.models import enums
+    from app.utils.search_cache import PropertySearchCache
+
+    stars = [enums.PropertyStarRating.FIVE, enums.PropertyStarRating.ONE]
+    filters = dict(q='Tashkent ', city='tashkent', star_rating=stars, checkin=datetime(2024, 1, 1, 14), page=1)
+    key = PropertySearchCache.make_key(**filters)
+    assert key == PropertySearchCache.make_key(
+        page=1, checkin=datetime(2024, 1, 1, 9), q=' tashkent', city='tashkent', star_rating=stars[::-1]
+    )
+    assert key != PropertySearchCache.make_key(**{**filters, 'city': 'Tashkent'})
+    assert key != PropertySearchCache.make_key(**{**filters, 'star_rating': stars[:1]})
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    async def set(self, key, value, ex=None, nx=False):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    async def sadd(self, key, *members):
+        self.data.setdefault(key, set()).update(member.encode() for member in members)
+
+    async def sunion(self, *keys):
+        return set().union(*(self.data.get(key, ()) for key in keys))
+
+    async def expire(self, key, ex):
+        pass
+
+    async def incr(self, key):
+        self.data[key] = int(self.data.get(key, 0)) + 1
+        return self.data[key]
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    """Queues the commands of a FakeRedis and runs them on ``execute``"""
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.commands.append(getattr(self.redis, name)(*args, **kwargs))
+
+    async def execute(self):
+        return [await command for command in self.commands]
+
+
+def test_search_cache_is_dropped_for_changed_properties(monkeypatch):
+    from app.crud import property as crud_property, search_index as crud_search_index
+    from app.utils import redis_helper, search_cache
+
+    fake_redis = FakeRedis()
+    monkeypatch.setattr(search_cache, 'redis', fake_redis)
+    monkeypatch.setattr(redis_helper, 'redis', fake_redis)
+
+    async def test():
+        hotel = await add_property('A')
+        other = await add_property('B', city='samarkand')
+        await crud_search_index.rebuild_search_index()
+        assert (await search_properties(city='tashkent'))[1] == 1
+
+        await add_property('C')
+        await crud_search_index.rebuild_search_index()
+        # served from the cache until something of the searched city changes
+        assert (await search_properties(city='tashkent'))[1] == 1
+        await crud_property.invalidate_property_search(other.id)
+        assert (await search_properties(city='tashkent'))[1] == 1
+        await crud_property.invalidate_property_search(hotel.id)
+        assert (await search_properties(city='tashkent'))[1] == 2
+
+    run_in_database(test())
+
+
+def test_idempotency_fingerprint():
+    from app.utils.idempotency import _fingerprint
+
+    fingerprint = _fingerprint({'user': 1, 'booking_id': 5, 'reason': 'late'}, exclude=('user',))
+    assert fingerprint == _fingerprint({'reason': 'late', 'booking_id': 5, 'user': 2}, exclude=('user',))
+    assert fingerprint != _fingerprint({'booking_id': 5, 'reason': 'early'}, exclude=('user',))
+
+
+def test_idempotent_replays_the_first_response(monkeypatch):
+    import asyncio
+    from types import SimpleNamespace
+    from starlette.requests import Request
+    from app.utils import idempotency, redis_helper
+
+    fake_redis = FakeRedis()
+    monkeypatch.setattr(idempotency, 'redis', fake_redis)
+    monkeypatch.setattr(redis_helper, 'redis', fake_redis)
+    calls = []
+
+    @idempotency.idempotent('test', status_code=201)
+    async def create(user, amount: int):
+        calls.append(amount)
+        if amount < 0:
+            raise ValueError(amount)
+        return {'ok': True, 'amount': amount}
+
+    def call(amount, key='abc', user_id=1):
+        headers = [(b'idempotency-key', key.encode())] if key else []
+        request = Request({'type': 'http', 'method': 'POST', 'path': '/', 'headers': headers})
+        return asyncio.run(create(request=request, user=SimpleNamespace(id=user_id), amount=amount))
+
+    first = call(5)
+    assert first.status_code == 201 and calls == [5]
+    replay = call(5)
+    assert (replay.status_code, replay.body) == (201, first.body) and calls == [5]
+    assert call(6).status_code == 422
+    assert call(5, user_id=2).status_code == 201 and calls == [5, 5]
+    assert call(5, key=None) == {'ok': True, 'amount': 5} and calls == [5, 5, 5]
+
+    # a request still running holds the key with its fingerprint only
+    key = idempotency.IdempotentResponse.make_key('test', 1, 'running')
+    assert asyncio.run(idempotency.IdempotentResponse.acquire(key, idempotency._fingerprint({'amount': 5}, ()))) is None
+    assert call(5, key='running').status_code == 409 and calls == [5, 5, 5]
+
+    # a failed request leaves nothing behind, so it can be retried
+    with pytest.raises(ValueError):
+        call(-1, key='failed')
+    with pytest.raises(ValueError):
+        call(-1, key='failed')
+    assert calls[-2:] == [-1, -1]